@@ -0,0 +1,119 @@
+"""
+As-of alignment of daily series (oil spot and futures prices, exchange rates) onto another time index.
+
+Every row of the target gets the value of the closest date of the daily series in the given direction:
+- backward: last date at or before the row, e.g. the latest known exchange rate
+- forward: first date at or after the row, e.g. the hourly oil prices of msa_merged_data.csv,
+  which were back filled from the next trading day
+- nearest: closest date on either side (the earlier one on ties)
+Dates further away than the tolerance give missing values.
+
+The daily dates are sorted once and every target row is located with a binary search, so the target frame
+is neither merged nor sorted: the aligned columns are added to it in place.
+"""
+
+import numpy as np
+import pandas as pd
+
+DIRECTIONS = ("backward", "forward", "nearest")
+
+
+def _to_datetime64(values):
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]", copy=False)
+    return pd.to_datetime(pd.Series(values)).to_numpy(dtype="datetime64[ns]")
+
+
+def asof_positions(target, keys, direction="backward", tolerance=None):
+    """
+    Locate the matching date of every target timestamp in a sorted array of dates
+    ----------
+    Input
+        - target: array of timestamps to align
+        - keys: sorted array of dates of the daily series, without missing values
+        - direction: "backward", "forward" or "nearest"
+        - tolerance: largest distance (Pandas Timedelta) between a timestamp and its date, defaults to no limit
+    Returns
+        - Numpy array of positions into keys, -1 where there is no match
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be one of {}".format(", ".join(DIRECTIONS)))
+    target = _to_datetime64(target)
+    keys = _to_datetime64(keys)
+    if len(keys) == 0:
+        return np.full(len(target), -1)
+
+    if direction != "forward":
+        before = np.searchsorted(keys, target, side="right") - 1
+    if direction != "backward":
+        after = np.searchsorted(keys, target, side="left")
+        after[after == len(keys)] = -1
+    if direction == "backward":
+        positions = before
+    elif direction == "forward":
+        positions = after
+    else:
+        no_match = np.timedelta64(pd.Timedelta.max.value, "ns")
+        distance_before = np.where(before >= 0, target - keys[before], no_match)
+        distance_after = np.where(after >= 0, keys[after] - target, no_match)
+        positions = np.where(distance_after < distance_before, after, before)
+
+    if tolerance is not None:
+        too_far = np.abs(keys[positions] - target) > pd.Timedelta(tolerance).to_timedelta64()
+        positions = np.where((positions >= 0) & too_far, -1, positions)
+    return positions
+
+
+def _take(values, positions):
+    """
+    Return values at the given positions, missing values where positions are -1
+    """
+    missing = positions < 0
+    if len(values) == 0:
+        return np.full(len(positions), np.nan)
+    result = values[np.where(missing, 0, positions)]
+    if missing.any():
+        if result.dtype.kind in "iub":
+            result = result.astype(float)
+        result[missing] = np.datetime64("NaT") if result.dtype.kind in "mM" else np.nan
+    return result
+
+
+def add_asof_columns(df, date_col, daily, daily_date_col, columns=None, direction="backward", tolerance=None):
+    """
+    Add the columns of a daily series to a data frame by as-of matching on the dates.
+    Missing values of the daily series are skipped, as with fillna, i.e. each column is matched
+    against the dates where it has a value. Alter data frame in place
+    ----------
+    Input
+        - df: Pandas DataFrame to add the columns to, in any order
+        - date_col: name of the column of df with timestamps
+        - daily: Pandas DataFrame with the daily series, in any order
+        - daily_date_col: name of the column of daily with dates
+        - columns: columns of daily to add, defaults to every column but daily_date_col
+        - direction: "backward", "forward" or "nearest", see asof_positions
+        - tolerance: largest distance (Pandas Timedelta) between a row and the date it takes its values from
+    Returns
+        - The altered data frame
+    """
+    if columns is None:
+        columns = [col for col in daily.columns if col != daily_date_col]
+    keys = _to_datetime64(daily[daily_date_col])
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    target = _to_datetime64(df[date_col])
+    has_key = ~np.isnat(keys)
+
+    # Columns without missing values share one search
+    shared_positions = None
+    for col in columns:
+        values = daily[col].to_numpy()[order]
+        valid = has_key & pd.notna(values)
+        if valid.all():
+            if shared_positions is None:
+                shared_positions = asof_positions(target, keys, direction, tolerance)
+            df[col] = _take(values, shared_positions)
+        else:
+            df[col] = _take(values[valid], asof_positions(target, keys[valid], direction, tolerance))
+    return df
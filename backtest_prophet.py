@@ -0,0 +1,186 @@
+"""
+Rolling-origin backtest of the Prophet model.
+
+For every origin (cutoff), e.g. the first day of each month from 2015 to 2020, a model with the specification
+of refit_model.make_prophet_model is fitted on the hours before the cutoff and forecasts the following horizon.
+
+Fitting each fold from scratch is slow, so the origins are split into contiguous chains, one per worker process.
+Within a chain, each fold's fit starts from the parameters of the previous fold (refit_model.stan_init),
+which is close to the optimum since the training sets only differ by one period.
+Running this file writes one row of metrics per origin to backtest_metrics.csv:
+    python backtest_prophet.py --start 2015-01-01 --end 2020-01-01 --workers 4
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from refit_model import REGRESSORS, make_prophet_model, load_training_data, stan_init
+from prophet_predict import predict
+
+OUTPUT_PATH = "backtest_metrics.csv"
+
+
+def rolling_origins(start, end, freq="MS"):
+    """
+    Return the cutoffs of a rolling-origin backtest
+    ----------
+    Input
+        - start: first cutoff
+        - end: last cutoff (included)
+        - freq: pandas frequency between cutoffs, "MS" for the first day of each month
+    Returns
+        - List of Pandas Timestamps
+    """
+    return list(pd.date_range(start, end, freq=freq))
+
+
+def split_fold(data, cutoff, horizon, train_days=None):
+    """
+    Return the training and test sets of a fold
+    ----------
+    Input
+        - data: Prophet dataframe with columns y, ds and the regressors
+        - cutoff: first hour of the test set
+        - horizon: length of the test set, Pandas Timedelta
+        - train_days: number of days before the cutoff used for training, defaults to all the data
+    Returns
+        - Tuple of Pandas DataFrames (train, test)
+    """
+    train_start = data["ds"].min() if train_days is None else cutoff - pd.Timedelta(days=train_days)
+    train = data[(data["ds"] >= train_start) & (data["ds"] < cutoff)]
+    test = data[(data["ds"] >= cutoff) & (data["ds"] < cutoff + horizon)]
+    return train, test
+
+
+def forecast_metrics(actual, forecast):
+    """
+    Compare a forecast with the actual values
+    ----------
+    Input
+        - actual: array of actual values
+        - forecast: dataframe returned by Prophet.predict
+    Returns
+        - Dictionary with mae, rmse, mape (in percent) and coverage (share of actual values in the
+          uncertainty interval, NaN when the forecast has no interval)
+    """
+    actual = np.asarray(actual, dtype=float)
+    errors = actual - forecast["yhat"].to_numpy()
+    coverage = np.nan
+    if "yhat_lower" in forecast.columns:
+        coverage = np.mean((actual >= forecast["yhat_lower"].to_numpy()) &
+                           (actual <= forecast["yhat_upper"].to_numpy()))
+    return {"mae": np.mean(np.abs(errors)),
+            "rmse": np.sqrt(np.mean(errors ** 2)),
+            "mape": np.mean(np.abs(errors / actual)) * 100,
+            "coverage": coverage}
+
+
+def run_chain(data, cutoffs, regressors, horizon, train_days=None, warm_start=True, settings=None, chain=0):
+    """
+    Fit and evaluate the folds of consecutive cutoffs, each fold starting from the parameters of the previous one
+    ----------
+    Input
+        - data: Prophet dataframe with columns y, ds and the regressors
+        - cutoffs: sorted list of cutoffs
+        - regressors, horizon, train_days, warm_start, settings: see backtest
+        - chain: number of the chain, reported in the metrics
+    Returns
+        - List of dictionaries, one per fold
+    """
+    rows = []
+    init = None
+    for cutoff in cutoffs:
+        train, test = split_fold(data, cutoff, horizon, train_days)
+        if len(train) == 0 or len(test) == 0:
+            continue
+        model = make_prophet_model(regressors, **(settings or {}))
+        start = time.perf_counter()
+        if init is None:
+            model.fit(train)
+        else:
+            model.fit(train, init=init)
+        fit_seconds = time.perf_counter() - start
+        forecast = predict(model, test.drop(columns=["y"]))
+
+        rows.append(dict({"cutoff": cutoff, "chain": chain, "warm_start": init is not None,
+                          "n_train": len(train), "n_test": len(test), "fit_seconds": fit_seconds},
+                         **forecast_metrics(test["y"], forecast)))
+        if warm_start:
+            init = stan_init(model)
+    return rows
+
+
+def backtest(data, cutoffs, regressors=REGRESSORS, horizon=pd.Timedelta(days=30), train_days=None,
+             workers=1, warm_start=True, settings=None):
+    """
+    Run a rolling-origin backtest
+    ----------
+    Input
+        - data: Prophet dataframe with columns y, ds and the regressors, see refit_model.load_training_data
+        - cutoffs: list of cutoffs, see rolling_origins
+        - regressors: name of the additional regressors
+        - horizon: length of each test set, Pandas Timedelta
+        - train_days: number of days before each cutoff used for training, defaults to all the data before it
+        - workers: number of processes. The cutoffs are split into this many chains of consecutive cutoffs
+        - warm_start: if True, start each fit from the parameters of the previous fold of its chain
+        - settings: arguments of Prophet overriding refit_model.PROPHET_SETTINGS e.g. {"uncertainty_samples": 100}
+    Returns
+        - Pandas DataFrame with one row per fold and columns cutoff, chain, warm_start, n_train, n_test,
+          fit_seconds, mae, rmse, mape, coverage
+    """
+    cutoffs = sorted(pd.Timestamp(cutoff) for cutoff in cutoffs)
+    chains = [list(chain) for chain in np.array_split(np.array(cutoffs, dtype=object), max(workers, 1))
+              if len(chain)]
+
+    if workers <= 1:
+        rows = [row for i, chain in enumerate(chains)
+                for row in run_chain(data, chain, regressors, horizon, train_days, warm_start, settings, i)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Each process only receives the rows its chain can use
+            futures = [executor.submit(run_chain, data[data["ds"] < chain[-1] + horizon], chain, regressors,
+                                       horizon, train_days, warm_start, settings, i)
+                       for i, chain in enumerate(chains)]
+            rows = [row for future in futures for row in future.result()]
+
+    columns = ["cutoff", "chain", "warm_start", "n_train", "n_test", "fit_seconds", "mae", "rmse", "mape", "coverage"]
+    return pd.DataFrame(rows, columns=columns).sort_values("cutoff").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--start", default="2015-01-01", help="first cutoff")
+    parser.add_argument("--end", default="2020-01-01", help="last cutoff")
+    parser.add_argument("--freq", default="MS", help="pandas frequency between cutoffs (default: MS, monthly)")
+    parser.add_argument("--horizon-days", type=float, default=30, help="length of each test set in days")
+    parser.add_argument("--train-days", type=float, default=None,
+                        help="days of training data before each cutoff (default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes")
+    parser.add_argument("--cold", action="store_true", help="fit every fold from scratch")
+    parser.add_argument("--uncertainty-samples", type=int, default=None,
+                        help="samples used for the uncertainty intervals, 0 to skip them and the coverage")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    settings = {}
+    if args.uncertainty_samples is not None:
+        settings["uncertainty_samples"] = args.uncertainty_samples
+
+    start = time.perf_counter()
+    metrics = backtest(load_training_data(REGRESSORS), rolling_origins(args.start, args.end, args.freq),
+                       horizon=pd.Timedelta(days=args.horizon_days), train_days=args.train_days,
+                       workers=args.workers, warm_start=not args.cold, settings=settings)
+    metrics.to_csv(args.output, index=False)
+
+    print(metrics.to_string(index=False))
+    print("\nMean over {} folds: MAE {:.1f}, RMSE {:.1f}, MAPE {:.2f}%, coverage {:.3f}".format(
+        len(metrics), metrics["mae"].mean(), metrics["rmse"].mean(), metrics["mape"].mean(),
+        metrics["coverage"].mean()))
+    print("Fit time: {:.0f}s (cold folds {:.1f}s on average, warm started folds {:.1f}s), wall clock {:.0f}s".format(
+        metrics["fit_seconds"].sum(),
+        metrics.loc[~metrics["warm_start"], "fit_seconds"].mean(),
+        metrics.loc[metrics["warm_start"], "fit_seconds"].mean(),
+        time.perf_counter() - start))
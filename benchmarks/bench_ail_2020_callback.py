@@ -0,0 +1,89 @@
+"""
+Benchmark of the 2020 AIL callback of viz_summary_2020.py: the former boolean masks and rolling(24).mean() over
+the selected dates against the binary search and prefix sums of make_ail_2020_sums, for date ranges of growing
+width, and the time of a callback answered from the figure cache. Also checks that both give the same means.
+
+The forecasts cover every hour of the synthetic history (see benchmarks/synthetic_data.py), so at scale 10 the
+widest range is 110 years. Requires plotly and dash.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_ail_2020_callback --scales 1 10
+"""
+
+import argparse
+import time
+import warnings
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_inputs, merged_data, make_forecasts
+from feature_factory import prefix_rolling_mean
+
+WIDTHS = [7, 30, 365, None]
+"""
+Widths of the date ranges in days, None for the whole history
+"""
+
+
+def best_time(step, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        step()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def former_means(data, start_date, end_date):
+    condition = (data["BEGIN_DATE_GMT"] >= start_date) & (data["BEGIN_DATE_GMT"] <= end_date)
+    return data[condition].rolling(24).mean()
+
+
+def prefix_means(sums, start_date, end_date):
+    dates = sums["dates"]
+    first = int(np.searchsorted(dates, pd.Timestamp(start_date).to_datetime64(), side="left"))
+    last = int(np.searchsorted(dates, pd.Timestamp(end_date).to_datetime64(), side="right"))
+    return {col: prefix_rolling_mean((prefix[0][first:last + 1], prefix[1][first:last + 1]), 24)
+            for col, prefix in sums["prefixes"].items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    # The former rolling mean drops the date column with a warning on recent pandas
+    warnings.simplefilter("ignore", FutureWarning)
+
+    from viz_summary_2020 import AIL_2020_COLUMNS, make_ail_2020_sums, plot_ail_2020, cached_figure
+
+    print("{:<10}{:>8}{:>10}{:>14}{:>14}{:>14}{:>14}".format("", "scale", "hours", "former (ms)", "prefix (ms)",
+                                                         "figure (ms)", "cached (ms)"))
+    for scale in args.scales:
+        forecasts = make_forecasts(merged_data(make_inputs(scale)), year=None)
+        columns = forecasts[["BEGIN_DATE_GMT"] + AIL_2020_COLUMNS]
+        sums = make_ail_2020_sums(forecasts)
+        end = forecasts["BEGIN_DATE_GMT"].max().normalize()
+        for width in WIDTHS:
+            start = forecasts["BEGIN_DATE_GMT"].min().normalize() if width is None else \
+                end - pd.Timedelta(days=width)
+            start_date, end_date = str(start.date()), str(end.date())
+
+            former = former_means(columns, start_date, end_date)
+            means = prefix_means(sums, start_date, end_date)
+            for col in AIL_2020_COLUMNS:
+                np.testing.assert_allclose(means[col], former[col].to_numpy(), rtol=1e-9)
+
+            former_ms = 1000 * best_time(lambda: former_means(columns, start_date, end_date), args.repeat)
+            prefix_ms = 1000 * best_time(lambda: prefix_means(sums, start_date, end_date), args.repeat)
+            figure_ms = 1000 * best_time(lambda: plot_ail_2020(forecasts, start_date, end_date, sums=sums),
+                                         args.repeat)
+            cache = OrderedDict()
+            build = lambda: plot_ail_2020(forecasts, start_date, end_date, sums=sums)
+            cached_figure(cache, (start_date, end_date, None), build)
+            cached_ms = 1000 * best_time(lambda: cached_figure(cache, (start_date, end_date, None), build),
+                                         args.repeat)
+            print("{:<10}{:>7}x{:>10}{:>14.2f}{:>14.2f}{:>14.2f}{:>14.4f}".format(
+                "all" if width is None else "{} days".format(width), scale, len(former), former_ms, prefix_ms,
+                figure_ms, cached_ms))
@@ -0,0 +1,82 @@
+"""
+Benchmark of adding the daily oil prices to the hourly data: the former chain of outer merges, sort and
+column by column fillna(method="bfill") against the as-of alignment of asof_align.py.
+
+Uses a synthetic hourly frame over 2010-2020, daily futures (C1-C4) on business days and a spot price
+with a few missing days. Add more daily series with --extra-series.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_asof_align
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from asof_align import add_asof_columns
+
+
+def make_data(extra_series=0, seed=0):
+    """
+    Return the hourly frame and a list of daily frames, each with a BEGIN_DATE_GMT column
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2010-01-01 07:00:00", "2020-12-30 23:00:00", freq="H")
+    hourly = pd.DataFrame({"BEGIN_DATE_GMT": hours,
+                           "AIL_DEMAND": rng.integers(8000, 11000, len(hours)).astype(float),
+                           "Avg_temp": rng.normal(0, 10, len(hours))})
+    days = pd.bdate_range("2009-12-31", "2020-12-24")
+    futures = pd.DataFrame({"BEGIN_DATE_GMT": days})
+    for i in range(1, 5 + extra_series):
+        futures["future {}".format(i)] = rng.uniform(40, 90, len(days))
+    spot_days = days[rng.random(len(days)) > 0.02]
+    spot = pd.DataFrame({"BEGIN_DATE_GMT": spot_days, "WTI spot": rng.uniform(40, 90, len(spot_days))})
+    return hourly, [futures, spot]
+
+
+def legacy_align(hourly, daily_frames):
+    merged = hourly
+    for daily in daily_frames:
+        merged = merged.merge(daily, how="outer", on=["BEGIN_DATE_GMT"])
+    merged.index = merged["BEGIN_DATE_GMT"]
+    merged = merged.sort_index()
+    for daily in daily_frames:
+        for col in daily.columns.drop("BEGIN_DATE_GMT"):
+            merged[col] = merged[col].fillna(method="bfill")
+    # The outer merges add the days that are not hours of the hourly frame
+    return merged[merged["BEGIN_DATE_GMT"].isin(hourly["BEGIN_DATE_GMT"])]
+
+
+def asof_align(hourly, daily_frames):
+    for daily in daily_frames:
+        add_asof_columns(hourly, "BEGIN_DATE_GMT", daily, "BEGIN_DATE_GMT", direction="forward")
+    return hourly
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--extra-series", type=int, default=0,
+                        help="number of daily series added to the futures")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    hourly, daily_frames = make_data(args.extra_series)
+    legacy_time, legacy = timed(lambda: legacy_align(hourly, daily_frames), args.repeat)
+    asof_time, aligned = timed(lambda: asof_align(hourly.copy(), daily_frames), args.repeat)
+
+    columns = [col for daily in daily_frames for col in daily.columns.drop("BEGIN_DATE_GMT")]
+    same = np.array_equal(legacy[columns].to_numpy(), aligned[columns].to_numpy(), equal_nan=True)
+    print("Hours: {}, daily series: {}".format(len(hourly), len(columns)))
+    print("{:<30}{:>9.3f}s".format("outer merges + sort + bfill", legacy_time))
+    print("{:<30}{:>9.3f}s".format("as-of alignment", asof_time))
+    print("Speed up: {:.1f}x, same values: {}".format(legacy_time / asof_time, same))
@@ -0,0 +1,107 @@
+"""
+Benchmark of the vectorized temperature back filling against the original row-by-row implementation.
+
+Builds a synthetic data set of several hourly temperature stations over the same grid as merge_full_time,
+with isolated gaps and runs of gaps, checks that both implementations give the same results and reports the speed up.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_back_filling --stations 50
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from clean_temperature_script import back_filling_temperatures_pipeline, bfill_temperature, merge_full_time
+
+
+def legacy_bfill_temperature(full_df):
+    """
+    Original implementation: iterate through every missing row and look up the
+    previous hour or previous day with a boolean mask over the full data frame.
+    """
+    def time_gap(next_gap, current):
+        return (next_gap - current) / pd.Timedelta(hours=1)
+
+    def lookup(time):
+        value = full_df[full_df["FULL_BEGIN_DATE_GMT"] == time]["BFILL_TEMP_CELSIUS"]
+        return value.iloc[0] if len(value) else np.nan
+
+    na_df = full_df[pd.isna(full_df["TEMP_CELSIUS"])][["FULL_BEGIN_DATE_GMT"]].copy()
+    na_df["NEXT_GAP"] = na_df["FULL_BEGIN_DATE_GMT"].shift(-1)
+    na_df["PREV_GAP"] = na_df["FULL_BEGIN_DATE_GMT"].shift(1)
+    full_df["BFILL_TEMP_CELSIUS"] = pd.Series.copy(full_df["TEMP_CELSIUS"])
+
+    for index, row in na_df.iterrows():
+        prev_gap = time_gap(row["FULL_BEGIN_DATE_GMT"], row["PREV_GAP"])
+        next_gap = time_gap(row["NEXT_GAP"], row["FULL_BEGIN_DATE_GMT"])
+        if prev_gap == 1.0 or next_gap == 1.0:
+            full_df.at[index, "BFILL_TEMP_CELSIUS"] = lookup(
+                row["FULL_BEGIN_DATE_GMT"] - pd.Timedelta(days=1))
+        else:
+            full_df.at[index, "BFILL_TEMP_CELSIUS"] = lookup(
+                row["FULL_BEGIN_DATE_GMT"] - pd.Timedelta(hours=1))
+    return full_df["BFILL_TEMP_CELSIUS"].to_numpy()
+
+
+def legacy_back_filling_temperatures_pipeline(temp_raw_df):
+    full_df = merge_full_time(temp_raw_df)
+    full_df["BFILL_TEMP_CELSIUS"] = legacy_bfill_temperature(full_df)
+    return full_df
+
+
+def make_station(rng, n_isolated=150, n_runs=30, max_run=30):
+    """
+    Return a raw temperature data frame for one synthetic station with
+    isolated gaps and runs of gaps (some longer than a day).
+    """
+    times = pd.date_range(start='2010-01-01 07:00:00', end='2021-01-05 07:00:00', freq='H')
+    hours = np.arange(len(times))
+    temps = (5 - 15 * np.cos(2 * np.pi * hours / 8766)
+             - 5 * np.cos(2 * np.pi * hours / 24) + rng.normal(0, 2, len(times)))
+    missing = np.zeros(len(times), dtype=bool)
+    missing[rng.integers(0, len(times), n_isolated)] = True
+    for start in rng.integers(0, len(times) - max_run, n_runs):
+        missing[start:start + rng.integers(2, max_run)] = True
+    temps[missing] = np.nan
+    return pd.DataFrame({"BEGIN_DATE_GMT": times, "TEMP_CELSIUS": temps})
+
+
+def time_calls(func, inputs):
+    start = time.perf_counter()
+    results = [func(x) for x in inputs]
+    return time.perf_counter() - start, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    stations = [make_station(rng) for _ in range(args.stations)]
+    full_frames = [merge_full_time(station) for station in stations]
+
+    # Back filling stage only, on the regular hourly grid
+    new_fill_time, new_results = time_calls(
+        lambda df: bfill_temperature(df["TEMP_CELSIUS"].to_numpy(dtype=float)), full_frames)
+    old_fill_time, old_results = time_calls(
+        lambda df: legacy_bfill_temperature(df.copy()), full_frames)
+    for old, new in zip(old_results, new_results):
+        np.testing.assert_array_equal(old, new)
+
+    # Whole pipeline, including building the hourly grid with merge_full_time
+    new_time, new_results = time_calls(
+        lambda df: back_filling_temperatures_pipeline(df)["BFILL_TEMP_CELSIUS"].to_numpy(), stations)
+    for old, new in zip(old_results, new_results):
+        np.testing.assert_array_equal(old, new)
+    old_time = old_fill_time + (new_time - new_fill_time)
+
+    print("Stations: {}, hours per station: {}".format(args.stations, len(full_frames[0])))
+    print("{:<22}{:>12}{:>12}{:>10}".format("", "Row-by-row", "Vectorized", "Speed up"))
+    print("{:<22}{:>11.2f}s{:>11.3f}s{:>9.0f}x".format(
+        "Back filling", old_fill_time, new_fill_time, old_fill_time / new_fill_time))
+    print("{:<22}{:>11.2f}s{:>11.3f}s{:>9.0f}x".format(
+        "Pipeline (estimated)", old_time, new_time, old_time / new_time))
@@ -0,0 +1,93 @@
+"""
+Benchmark of the distribution figures built from precomputed statistics (distribution_stats.py): size of the figure
+JSON sent to the browser and time to build it, against the former figures made of every raw value
+(one violin per year, a px.box of the hourly AIL faceted by hour ending, one box per year of the daily load per
+degree day), on synthetic data at the given scales (see benchmarks/synthetic_data.py).
+
+Also checks the statistics of every group against np.percentile. Requires plotly and dash.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_distribution_stats --scales 1 10
+"""
+
+import argparse
+import time
+import warnings
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from benchmarks.synthetic_data import make_inputs, merged_data
+from dashboard_cubes import build_cubes
+from distribution_stats import distribution_stats
+
+
+def former_by_year(data):
+    fig = go.Figure()
+    for y in range(data.year.min(), data.year.max() + 1):
+        fig.add_trace(go.Violin(y=data[data["year"] == y]["AIL_DEMAND"], name=y, box_visible=True,
+                                meanline_visible=True))
+    return fig
+
+
+def former_by_hour(data):
+    return px.box(data, x="AIL_DEMAND", facet_col="HE", color="year", facet_col_wrap=4, facet_col_spacing=0.01,
+                  facet_row_spacing=0.01, height=1200)
+
+
+def former_normalized(daily):
+    temp_df = daily[daily["hours"] > 0].copy()
+    temp_df['Normalized_AIL_Demand'] = temp_df.AIL_DEMAND_sum / temp_df.Degree_days_sum
+    fig = go.Figure()
+    for year in range(2010, 2021):
+        fig.add_trace(go.Box(x=temp_df[temp_df.index.year == year].index.year,
+                             y=temp_df['Normalized_AIL_Demand'][temp_df.index.year == year], name=str(year)))
+    return fig
+
+
+def payload(build, data):
+    """
+    Return (kB of JSON, seconds to build and serialize) of the figure of data
+    """
+    start = time.perf_counter()
+    size = len(build(data).to_json())
+    return size / 1024, time.perf_counter() - start
+
+
+def check_stats(data):
+    """
+    Compare the quartiles, mean and whiskers of AIL_DEMAND by (year, HE) with np.percentile
+    """
+    stats = distribution_stats(data, "AIL_DEMAND", ["year", "HE"])["stats"]
+    for (year, hour), group in data.groupby(["year", "HE"]):
+        values = group["AIL_DEMAND"].to_numpy(dtype=float)
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+        np.testing.assert_allclose(stats.loc[(year, hour), ["q1", "median", "q3", "mean", "lowerfence",
+                                                            "upperfence"]].to_numpy(dtype=float),
+                                   [q1, median, q3, values.mean(), inside.min(), inside.max()])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    args = parser.parse_args()
+    warnings.simplefilter("ignore", UserWarning)
+
+    from viz_exploratory_data import prepare_data, plot_ail_dstribution_by_year, plot_ail_distribution_by_hour
+    from viz_summary_2020 import plot_normalized_demand
+
+    print("{:<26}{:>6}{:>24}{:>20}".format("", "scale", "payload (kB)", "build (s)"))
+    for scale in args.scales:
+        merged = merged_data(make_inputs(scale))
+        data = prepare_data(merged[["BEGIN_DATE_GMT", "HE", "AIL_DEMAND"]].copy())
+        daily = build_cubes(merged)["daily"]
+        check_stats(data)
+        figures = [("AIL by year", former_by_year, plot_ail_dstribution_by_year, data),
+                   ("AIL by hour and year", former_by_hour, plot_ail_distribution_by_hour, data),
+                   ("normalized demand", former_normalized, plot_normalized_demand, daily)]
+        for name, former, new, figure_data in figures:
+            former_kb, former_seconds = payload(former, figure_data)
+            kb, seconds = payload(new, figure_data)
+            print("{:<26}{:>5}x{:>12.0f}{:>12.0f}{:>10.2f}{:>10.2f}".format(name, scale, former_kb, kb,
+                                                                        former_seconds, seconds))
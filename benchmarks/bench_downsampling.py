@@ -0,0 +1,71 @@
+"""
+Benchmark of the downsampling of the time series figures of the dashboards: size of the figure JSON sent to the
+browser and time to build it, with every point against at most downsampling.MAX_POINTS points per line.
+
+Figures: the daily temperature vs. consumption line (daily cube and, for hourly resolution, the hourly data)
+and the 2020 AIL callback (full year and a one week zoom), on synthetic data at the given scales
+(see benchmarks/synthetic_data.py). Also checks that the highest and lowest value of every line are kept.
+Requires plotly and dash.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_downsampling --scales 1 10
+"""
+
+import argparse
+import time
+import numpy as np
+
+from benchmarks.synthetic_data import make_inputs, merged_data, make_forecasts
+from dashboard_cubes import build_cubes
+from downsampling import MAX_POINTS
+
+
+def payload(build):
+    """
+    Return (points, kB of JSON, seconds to build and serialize, figure) of the figure returned by build
+    """
+    start = time.perf_counter()
+    fig = build()
+    size = len(fig.to_json())
+    seconds = time.perf_counter() - start
+    return sum(len(trace.x) for trace in fig.data), size / 1024, seconds, fig
+
+
+def extremes_kept(full, reduced):
+    """
+    Return whether every line of reduced has the same highest and lowest value as the line of full
+    """
+    return all(np.nanmax(np.asarray(a.y, dtype=float)) == np.nanmax(np.asarray(b.y, dtype=float)) and
+               np.nanmin(np.asarray(a.y, dtype=float)) == np.nanmin(np.asarray(b.y, dtype=float))
+               for a, b in zip(full.data, reduced.data))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS)
+    args = parser.parse_args()
+
+    from viz_exploratory_data import plot_temp_v_demand_line
+    from viz_summary_2020 import plot_ail_2020
+
+    print("{:<34}{:>6}{:>18}{:>22}{:>20}{:>9}".format("", "scale", "points", "payload (kB)", "build (s)",
+                                                     "extremes"))
+    for scale in args.scales:
+        merged = merged_data(make_inputs(scale))
+        daily = build_cubes(merged)["daily"]
+        hourly = merged.set_index("BEGIN_DATE_GMT")
+        forecasts = make_forecasts(merged)
+        figures = [("daily temperature vs. demand", lambda n: plot_temp_v_demand_line(daily, None, n), len(daily)),
+                   ("hourly temperature vs. demand", lambda n: plot_temp_v_demand_line(hourly, None, n), len(hourly)),
+                   ("AIL 2020, full year", lambda n: plot_ail_2020(forecasts, "2020-01-01", "2020-12-31", None, n),
+                    len(forecasts)),
+                   ("AIL 2020, one week zoom", lambda n: plot_ail_2020(forecasts, "2020-01-01", "2020-12-31",
+                                                                       ("2020-03-01", "2020-03-08"), n),
+                    len(forecasts))]
+        for name, build, rows in figures:
+            full_points, full_kb, full_seconds, full = payload(lambda: build(rows))
+            points, kb, seconds, reduced = payload(lambda: build(args.max_points))
+            print("{:<34}{:>5}x{:>9}{:>9}{:>11.0f}{:>11.0f}{:>10.3f}{:>10.3f}{:>9}".format(
+                name, scale, full_points, points, full_kb, kb, full_seconds, seconds,
+                str(extremes_kept(full, reduced))))
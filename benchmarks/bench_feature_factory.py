@@ -0,0 +1,94 @@
+"""
+Benchmark of making lag, lead, rolling window, exponentially weighted and degree day features: one pandas
+expression per feature (shift, rolling().mean(), rolling().max(), ewm().mean()) against feature_factory.add_features.
+
+Uses a synthetic hourly frame over 2010-2020 with the four city temperatures, each with 1, 2, 24 hour lags,
+a 24 hour lead, rolling means and maxima over 3, 24, 168 and 720 hours, and heating degree days and their
+exponentially weighted means. Repeat the windows with --extra-windows.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_feature_factory
+"""
+
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+from feature_factory import (lag, lead, rolling_mean, rolling_max, ewm, heating_degree_days, add_features)
+
+CITIES = ["Calgary_temp", "Edmonton_temp", "FortMM_Temp", "Lethbridge_temp"]
+WINDOWS = [3, 24, 168, 720]
+
+
+def make_data(seed=0):
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2010-01-01 07:00:00", "2020-12-30 23:00:00", freq="H")
+    data = pd.DataFrame({"BEGIN_DATE_GMT": hours})
+    for city in CITIES:
+        data[city] = 5 - 15 * np.cos(2 * np.pi * hours.dayofyear / 365) + rng.normal(0, 5, len(hours))
+        data.loc[rng.random(len(hours)) < 0.001, city] = np.nan
+    return data
+
+
+def make_features(windows):
+    features = []
+    for city in CITIES:
+        degree_days = heating_degree_days(city)
+        features += [lag(city, 1), lag(city, 2), lag(city, 24), lead(city, 24), degree_days,
+                     ewm(degree_days, 24), ewm(degree_days, 168)]
+        features += [rolling_mean(city, window) for window in windows]
+        features += [rolling_max(city, window) for window in windows]
+        # Declared by several models
+        features += [lag(city, 1), rolling_mean(city, 24)]
+    return features
+
+
+def pandas_features(data, features):
+    for feature in features:
+        column = data[feature["column"]]
+        if feature["kind"] == "lag":
+            data[feature["name"]] = column.shift(feature["hours"])
+        elif feature["kind"] == "mean":
+            data[feature["name"]] = column.rolling(feature["window"]).mean()
+        elif feature["kind"] == "max":
+            data[feature["name"]] = column.rolling(feature["window"]).max()
+        elif feature["kind"] == "ewm":
+            data[feature["name"]] = column.ewm(halflife=feature["halflife"]).mean()
+        elif feature["kind"] == "hdd":
+            data[feature["name"]] = (feature["base_temp"] - column).clip(lower=0) / 24
+    return data
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--extra-windows", type=int, default=0,
+                        help="number of extra sets of rolling windows, each one hour longer than the previous")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    # Both variants add the features one column at a time
+    warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+
+    windows = WINDOWS + [window + i + 1 for i in range(args.extra_windows) for window in WINDOWS]
+    data, features = make_data(), make_features(windows)
+    pandas_time, expected = timed(lambda: pandas_features(data.copy(), features), args.repeat)
+    factory_time, result = timed(lambda: add_features(data.copy(), features), args.repeat)
+
+    names = list(dict.fromkeys(feature["name"] for feature in features))
+    error = np.nanmax(np.abs(expected[names].to_numpy() - result[names].to_numpy()))
+    same_missing = np.array_equal(expected[names].isna().to_numpy(), result[names].isna().to_numpy())
+    print("Hours: {}, features: {} ({} distinct)".format(len(data), len(features), len(names)))
+    print("{:<30}{:>9.3f}s".format("pandas, one per feature", pandas_time))
+    print("{:<30}{:>9.3f}s".format("feature_factory", factory_time))
+    print("Speed up: {:.1f}x, largest difference: {:.1e}, same missing values: {}".format(
+        pandas_time / factory_time, error, same_missing))
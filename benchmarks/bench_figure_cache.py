@@ -0,0 +1,64 @@
+"""
+Benchmark of the figure cache of the exploratory dashboard (viz_exploratory_data.py, figure_cache.py): time to
+build the app and render both of its tabs on a first start (figures built and written to the cache) and on a
+restart with the same data (figures read from the cache, hourly data not loaded), on synthetic data.
+
+The cache is written to a temporary directory. Requires plotly and dash.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_figure_cache --scales 1 10
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+from benchmarks.synthetic_data import make_inputs, merged_data
+from dashboard_cubes import build_cubes
+
+
+def start_and_render(make_app, cubes, load_data, data_path, cache_dir):
+    """
+    Return the seconds to build the app and render every tab, as the first view of each tab does
+    """
+    start = time.perf_counter()
+    app = make_app(cubes, load_data, data_path, cache_dir)
+    render = app.callback_map["section-content.children"]["callback"]
+    render = getattr(render, "__wrapped__", render)
+    for section in ["ail", "temperature"]:
+        render(section)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    args = parser.parse_args()
+    warnings.simplefilter("ignore", UserWarning)
+
+    import figure_cache
+    from viz_exploratory_data import make_app, prepare_data
+
+    print("{:<8}{:>10}{:>18}{:>14}{:>14}".format("scale", "hours", "first start (s)", "restart (s)", "cache (MB)"))
+    for scale in args.scales:
+        merged = merged_data(make_inputs(scale))
+        cubes = build_cubes(merged)
+        with tempfile.TemporaryDirectory() as tmp:
+            # The cache key only needs a file whose content stands for the data
+            data_path = os.path.join(tmp, "merged_data.csv")
+            with open(data_path, "w") as f:
+                f.write("scale {}\n".format(scale))
+            cache_dir = os.path.join(tmp, "figures")
+
+            def load_data():
+                return prepare_data(merged[["BEGIN_DATE_GMT", "HE", "AIL_DEMAND"]].copy())
+
+            figure_cache._figures.clear()
+            first = start_and_render(make_app, cubes, load_data, data_path, cache_dir)
+            # A restart: nothing in memory, the figures are read from the cache
+            figure_cache._figures.clear()
+            restart = start_and_render(make_app, cubes, load_data, data_path, cache_dir)
+            size = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+        print("{:>5}x{:>12}{:>18.2f}{:>14.3f}{:>14.1f}".format(scale, len(merged), first, restart, size / 2 ** 20))
@@ -0,0 +1,70 @@
+"""
+Benchmark of the columnar input cache for the Excel workbooks in **original data**.
+
+For every workbook that is present, times a cold load (parse the workbook and write the cache)
+and a warm load (read the cached Parquet files), and checks that both return the same data.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_input_cache
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+
+from input_cache import read_excel_cached
+
+WORKBOOKS = [
+    ("original data/Temps Data full.xls", dict(sheet_name=None)),
+    ("original data/AIL and Pool Price (2010-2020)(7183).xls", dict(sheet_name="Sheet 1")),
+    ("original data/AIL and Pool Price (2010-2020)(7183).xls", dict(sheet_name="Sheet 2")),
+    ("original data/EIA Oil Prices.xls", dict(sheet_name="Data 1", skiprows=[0, 1])),
+    ("original data/EIA NYMEX Futures (Crude Oil).xls", dict(sheet_name="Data 1", skiprows=[0, 1])),
+    ("original data/USDCAD BOC Rate.xls", dict()),
+]
+
+
+def timed_load(path, kwargs, cache_dir):
+    start = time.perf_counter()
+    result = read_excel_cached(path, cache_dir=cache_dir, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def as_frames(result):
+    return result if isinstance(result, dict) else {None: result}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of warm loads to average")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="input_cache_bench_")
+    total_cold = total_warm = 0.0
+    print("{:<58}{:>10}{:>10}{:>10}".format("Workbook", "Cold", "Warm", "Speed up"))
+    try:
+        for path, kwargs in WORKBOOKS:
+            if not os.path.exists(path):
+                print("{:<58}{:>30}".format(os.path.basename(path), "missing, skipped"))
+                continue
+            cold, cold_result = timed_load(path, kwargs, cache_dir)
+            warm = 0.0
+            for _ in range(args.repeat):
+                elapsed, warm_result = timed_load(path, kwargs, cache_dir)
+                warm += elapsed / args.repeat
+            for (_, cold_df), (_, warm_df) in zip(as_frames(cold_result).items(),
+                                                  as_frames(warm_result).items()):
+                pd.testing.assert_frame_equal(cold_df, warm_df)
+            total_cold += cold
+            total_warm += warm
+            label = "{} [{}]".format(os.path.basename(path), kwargs.get("sheet_name", 0))
+            print("{:<58}{:>9.3f}s{:>9.3f}s{:>9.0f}x".format(label, cold, warm, cold / warm))
+        if total_warm:
+            print("{:<58}{:>9.3f}s{:>9.3f}s{:>9.0f}x".format(
+                "Total", total_cold, total_warm, total_cold / total_warm))
+    finally:
+        shutil.rmtree(cache_dir)
@@ -0,0 +1,83 @@
+"""
+Benchmark of loading the merged data set: parsing msa_merged_data.csv as the consumers used to
+(pd.read_csv then pd.to_datetime without a format) against load_merged_data reading the typed Parquet copy.
+
+Uses msa_merged_data.csv when it exists, otherwise a synthetic file with the same columns over 2010-2020.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_merged_data_load
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from msa_data import MERGED_CSV_PATH, MERGED_SCHEMA, load_merged_data
+
+
+def write_synthetic_csv(path, seed=0):
+    """
+    Write a csv file shaped like msa_merged_data.csv with random values
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2010-01-01 07:00:00", "2020-12-30 23:00:00", freq="H")
+    data = pd.DataFrame(index=pd.Index(hours, name="BEGIN_DATE_GMT"))
+    for col, dtype in MERGED_SCHEMA.items():
+        if dtype == "float32":
+            data[col] = rng.normal(50, 20, len(hours))
+        else:
+            data[col] = rng.integers(0, 2, len(hours))
+    data["HE"] = (hours.hour + 1).astype(float)
+    data["dayofweek"] = hours.weekday
+    data["month"] = hours.month
+    data["year"] = hours.year
+    data.to_csv(path)
+
+
+def legacy_load(path):
+    data = pd.read_csv(path)
+    data["BEGIN_DATE_GMT"] = pd.to_datetime(data["BEGIN_DATE_GMT"])
+    return data
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="merged_data_bench_")
+    try:
+        csv_path = os.path.join(work_dir, "msa_merged_data.csv")
+        if os.path.exists(MERGED_CSV_PATH):
+            shutil.copy(MERGED_CSV_PATH, csv_path)
+        else:
+            write_synthetic_csv(csv_path)
+
+        csv_time, csv_data = timed(lambda: legacy_load(csv_path), args.repeat)
+        convert_time, _ = timed(lambda: load_merged_data(path=csv_path), 1)
+        binary_time, binary_data = timed(lambda: load_merged_data(path=csv_path), args.repeat)
+
+        csv_memory = csv_data.memory_usage(deep=True).sum() / 2 ** 20
+        binary_memory = binary_data.memory_usage(deep=True).sum() / 2 ** 20
+        print("Rows: {}, columns: {}".format(*binary_data.shape))
+        print("{:<40}{:>10}{:>12}".format("", "Load", "Memory"))
+        print("{:<40}{:>9.3f}s{:>9.1f} MB".format("read_csv + to_datetime", csv_time, csv_memory))
+        print("{:<40}{:>9.3f}s{:>12}".format("load_merged_data, first run (csv)", convert_time, ""))
+        print("{:<40}{:>9.3f}s{:>9.1f} MB".format("load_merged_data (Parquet)", binary_time, binary_memory))
+        print("Load speed up: {:.0f}x, memory: {:.1f}x smaller".format(
+            csv_time / binary_time, csv_memory / binary_memory))
+    finally:
+        shutil.rmtree(work_dir)
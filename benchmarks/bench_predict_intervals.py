@@ -0,0 +1,65 @@
+"""
+Benchmark of predictions with uncertainty intervals: Prophet's model.predict against prophet_predict.predict,
+for a first call, a second call over the same hours with other regressor values (the cached trend paths are reused,
+as for the 2020 and temperature normalized forecasts) and a call without intervals.
+
+Fits a small Prophet model on synthetic hourly data and predicts one leap year of hours. Requires fbprophet.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_predict_intervals --samples 1000
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from refit_model import make_prophet_model
+from prophet_predict import predict, clear_cache
+from benchmarks.bench_scenario_forecast import TEMPERATURE_COLUMNS, make_data
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, default=1000, help="samples of the uncertainty intervals")
+    parser.add_argument("--train-days", type=int, default=90, help="days of data used to fit the model")
+    args = parser.parse_args()
+
+    data = make_data(2019)
+    train = data[(data["ds"] < "2020-01-01") & (data["ds"] >= pd.Timestamp("2020-01-01") -
+                                                pd.Timedelta(days=args.train_days))]
+    future = data[data["ds"] >= "2020-01-01"].drop(columns=["y"]).reset_index(drop=True)
+    other_weather = future.copy()
+    other_weather[TEMPERATURE_COLUMNS] = data[data["ds"].dt.year == 2019][TEMPERATURE_COLUMNS].to_numpy()[
+        np.arange(len(future)) % (365 * 24)]
+    model = make_prophet_model(TEMPERATURE_COLUMNS + ["workingday"], uncertainty_samples=args.samples)
+    model.fit(train)
+
+    def prophet_predict_twice():
+        return model.predict(future), model.predict(other_weather)
+
+    def fast_predict_twice():
+        clear_cache()
+        first_time, first = timed(lambda: predict(model, future, seed=0))
+        second_time, _ = timed(lambda: predict(model, other_weather, seed=0))
+        return first_time, second_time, first
+
+    prophet_time, (reference, _) = timed(prophet_predict_twice)
+    total_time, (first_time, second_time, fast) = timed(fast_predict_twice)
+    no_interval_time, _ = timed(lambda: predict(model, future, intervals=False))
+
+    width = (reference["yhat_upper"] - reference["yhat_lower"]).mean()
+    print("Hours: {}, samples: {}".format(len(future), args.samples))
+    print("{:<44}{:>9.2f}s".format("model.predict, two scenarios", prophet_time))
+    print("{:<44}{:>9.2f}s".format("predict, two scenarios", total_time))
+    print("{:<44}{:>9.2f}s".format("  first scenario", first_time))
+    print("{:<44}{:>9.2f}s".format("  second scenario (cached trend paths)", second_time))
+    print("{:<44}{:>9.2f}s".format("predict, no intervals", no_interval_time))
+    print("Speed up: {:.1f}x. Mean interval width {:.0f} (Prophet) vs {:.0f}".format(
+        prophet_time / total_time, width, (fast["yhat_upper"] - fast["yhat_lower"]).mean()))
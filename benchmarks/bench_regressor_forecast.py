@@ -0,0 +1,81 @@
+"""
+Benchmark of the regressor forecasts: the former loop fitting statsmodels' STLForecast to each regressor one after
+another against regressor_forecast.py, fitting in parallel processes, updating the saved states with one new day
+and fitting on a recent window only.
+
+Uses six synthetic hourly regressors (daily cycle and random walk). States are saved in a temporary directory.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_regressor_forecast --days 730 --workers 6
+"""
+
+import argparse
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.forecasting.stl import STLForecast
+from statsmodels.tsa.arima.model import ARIMA
+
+from regressor_forecast import CONTINUOUS_REGRESSORS, ARIMA_ORDER, ARIMA_TREND, forecast_regressors
+
+
+def make_data(days, seed=0):
+    """
+    Return a Prophet style dataframe with ds and the continuous regressors
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2018-01-01", periods=days * 24, freq="H")
+    data = pd.DataFrame({"ds": hours})
+    for regressor in CONTINUOUS_REGRESSORS:
+        data[regressor] = (5 * np.sin(2 * np.pi * (hours.hour + rng.integers(24)) / 24)
+                           + np.cumsum(rng.normal(0, 0.3, len(hours))))
+    return data
+
+
+def legacy_forecast(data, periods):
+    indexed = data.set_index("ds")
+    indexed.index.freq = "H"
+    forecasts = {}
+    for var in CONTINUOUS_REGRESSORS:
+        var_forecast = STLForecast(indexed[var], ARIMA, model_kwargs=dict(order=ARIMA_ORDER, trend=ARIMA_TREND)).fit()
+        forecasts[var] = var_forecast.forecast(periods).to_numpy()
+    return pd.DataFrame(forecasts)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=730, help="days of hourly history")
+    parser.add_argument("--periods", type=int, default=24 * 30, help="hours to forecast")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--window-days", type=int, default=180, help="days of history of the window fit")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    data = make_data(args.days + 1)
+    history, new_day = data.iloc[:-24], data
+    state_dir = tempfile.mkdtemp()
+
+    legacy_time, legacy = timed(lambda: legacy_forecast(history, args.periods))
+    fit_time, fitted = timed(lambda: forecast_regressors(history, periods=args.periods, workers=args.workers,
+                                                         refit=True, state_dir=state_dir))
+    update_time, _ = timed(lambda: forecast_regressors(new_day, periods=args.periods, state_dir=state_dir))
+    window_time, _ = timed(lambda: forecast_regressors(history, periods=args.periods, workers=args.workers,
+                                                       window=args.window_days * 24, state_dir=None))
+
+    max_diff = np.abs(legacy.to_numpy() - fitted[CONTINUOUS_REGRESSORS].to_numpy()).max()
+    print("Regressors: {}, hours: {}, forecast: {} hours".format(len(CONTINUOUS_REGRESSORS), len(history),
+                                                                args.periods))
+    print("{:<40}{:>9.2f}s".format("STLForecast, one after another", legacy_time))
+    print("{:<40}{:>9.2f}s".format("forecast_regressors, parallel fit", fit_time))
+    print("{:<40}{:>9.2f}s".format("  update with one new day", update_time))
+    print("{:<40}{:>9.2f}s".format("  fit on {} days".format(args.window_days), window_time))
+    print("Speed up: fit {:.1f}x, update {:.0f}x. Max abs difference with STLForecast: {:.2e}".format(
+        legacy_time / fit_time, legacy_time / update_time, max_diff))
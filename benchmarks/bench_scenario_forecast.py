@@ -0,0 +1,77 @@
+"""
+Benchmark of weather scenario forecasts: one model.predict per scenario against scenario_forecast,
+which predicts the base scenario once and shifts it by the change of the regressor terms.
+
+Fits a small Prophet model on synthetic hourly data with four temperature regressors, then forecasts
+one leap year of hours under each weather year. Requires fbprophet.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_scenario_forecast --scenarios 10
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from refit_model import make_prophet_model
+from scenario_forecast import weather_year_scenarios, scenario_forecast
+
+TEMPERATURE_COLUMNS = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag",
+                       "FortMM_temp.1_hour_lag", "Lethbridge_temp.1_hour_lag"]
+
+
+def make_data(first_year, seed=0):
+    """
+    Return hourly Prophet data from first_year to 2020 with temperature regressors and a working day dummy
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("{}-01-01".format(first_year), "2020-12-31 23:00:00", freq="H")
+    season = -15 * np.cos(2 * np.pi * hours.dayofyear / 365.25)
+    data = pd.DataFrame({"ds": hours})
+    for col in TEMPERATURE_COLUMNS:
+        data[col] = season + rng.normal(0, 5, len(hours))
+    data["workingday"] = (hours.weekday < 5).astype(int)
+    data["y"] = (9500 - 20 * data[TEMPERATURE_COLUMNS].mean(axis=1) + 300 * data["workingday"]
+                 + 400 * np.sin(2 * np.pi * hours.hour / 24) + rng.normal(0, 100, len(hours)))
+    return data
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", type=int, default=10, help="number of weather years")
+    parser.add_argument("--train-days", type=int, default=90, help="days of data used to fit the model")
+    args = parser.parse_args()
+
+    regressors = TEMPERATURE_COLUMNS + ["workingday"]
+    data = make_data(2020 - args.scenarios)
+    train = data[(data["ds"] < "2020-01-01") & (data["ds"] >= pd.Timestamp("2020-01-01") -
+                                                pd.Timedelta(days=args.train_days))]
+    future = data[data["ds"] >= "2020-01-01"].drop(columns=["y"]).reset_index(drop=True)
+    model = make_prophet_model(regressors).fit(train)
+    scenarios = weather_year_scenarios(data, future, TEMPERATURE_COLUMNS, range(2020 - args.scenarios, 2020))
+
+    def predict_each():
+        results = {}
+        for year, values in scenarios.items():
+            scenario_future = future.copy()
+            scenario_future[TEMPERATURE_COLUMNS] = values.to_numpy()
+            results[year] = model.predict(scenario_future)["yhat"].to_numpy()
+        return results
+
+    predict_time, _ = timed(lambda: model.predict(future))
+    legacy_time, legacy = timed(predict_each)
+    batched_time, (_, scenario_yhat) = timed(lambda: scenario_forecast(model, future, scenarios))
+
+    max_diff = max(np.nanmax(np.abs(legacy[year] - scenario_yhat[year].to_numpy())) for year in scenarios)
+    print("Hours: {}, scenarios: {}".format(len(future), len(scenarios)))
+    print("{:<32}{:>9.2f}s".format("one predict", predict_time))
+    print("{:<32}{:>9.2f}s".format("one predict per scenario", legacy_time))
+    print("{:<32}{:>9.2f}s".format("scenario_forecast", batched_time))
+    print("Speed up: {:.1f}x, max abs difference of yhat: {:.2e}".format(legacy_time / batched_time, max_diff))
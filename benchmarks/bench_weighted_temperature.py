@@ -0,0 +1,77 @@
+"""
+Benchmark of the population weighted temperature: the former per scenario column arithmetic of calc_weighted_temp
+(one pass over the wide table per scenario) against the single sum over the stations of weighted_temperatures.
+
+Uses a synthetic wide temperature table over 2010-2020 with yearly changing population shares.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_weighted_temperature --stations 4 50
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from weighted_temperature import POP_SCENARIOS, population_weights, weighted_temperatures
+
+
+def make_wide_table(n_stations, scenarios=POP_SCENARIOS, seed=0):
+    """
+    Return a wide temperature table with BFILL_TEMP_CELSIUS|<CITY> and PCT_<SCENARIO>|<CITY> columns
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2010-01-01 07:00:00", "2020-12-30 23:00:00", freq="H")
+    stations = ["STATION{}".format(i) for i in range(n_stations)]
+    year_index = hours.year - hours.year[0]
+    data = {"BEGIN_DATE_GMT": hours}
+    for station in stations:
+        data["BFILL_TEMP_CELSIUS|" + station] = rng.normal(0, 10, len(hours))
+    for scenario in scenarios:
+        shares = rng.random((year_index.max() + 1, n_stations))
+        shares /= shares.sum(axis=1, keepdims=True)
+        for i, station in enumerate(stations):
+            data["PCT_{}|{}".format(scenario, station)] = shares[year_index, i]
+    return pd.DataFrame(data), stations
+
+
+def legacy_weighted_temp(temp_data, stations, scenarios=POP_SCENARIOS):
+    result = {}
+    for scenario in scenarios:
+        weighted = 0
+        for station in stations:
+            weighted = weighted + temp_data["BFILL_TEMP_CELSIUS|" + station] * \
+                temp_data["PCT_{}|{}".format(scenario, station)]
+        result[scenario] = weighted
+    return pd.DataFrame(result)
+
+
+def matrix_weighted_temp(temp_data, stations, scenarios=POP_SCENARIOS):
+    temps = temp_data[["BFILL_TEMP_CELSIUS|" + station for station in stations]].to_numpy(dtype=float)
+    years, weights = population_weights(temp_data, stations, scenarios)
+    return weighted_temperatures(temps, temp_data["BEGIN_DATE_GMT"].dt.year.to_numpy(), years, weights)
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stations", type=int, nargs="+", default=[4, 50])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:<10}{:>12}{:>12}{:>10}{:>14}".format("Stations", "Legacy", "Matrix", "Speed up", "Max abs diff"))
+    for n_stations in args.stations:
+        temp_data, stations = make_wide_table(n_stations)
+        legacy_time, legacy = timed(lambda: legacy_weighted_temp(temp_data, stations), args.repeat)
+        matrix_time, matrix = timed(lambda: matrix_weighted_temp(temp_data, stations), args.repeat)
+        max_diff = np.abs(legacy.to_numpy() - matrix).max()
+        print("{:<10}{:>11.3f}s{:>11.3f}s{:>9.1f}x{:>14.2e}".format(
+            n_stations, legacy_time, matrix_time, legacy_time / matrix_time, max_diff))
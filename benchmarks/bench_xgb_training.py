@@ -0,0 +1,137 @@
+"""
+Benchmark of the XGBoost random search: the former script (dense float64 feature matrix, RandomizedSearchCV with
+n_jobs=-1 and default XGBoost threads and tree method) against other models/xgb_training.py (memory-mapped float32
+matrix shared by the joblib workers, histogram trees, thread budget).
+
+Each variant runs in its own process on synthetic merged data over 2010-2020. Peak memory is the largest sum of the
+proportional set size (PSS, shared pages split between the processes sharing them) of the process and its workers,
+sampled every 50 ms. Linux only. Requires xgboost and scikit-learn.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_xgb_training --n-iter 6 --splits 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from msa_data import MERGED_SCHEMA
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "other models"))
+
+
+def make_merged_data(scale=1, seed=0):
+    """
+    Return a dataframe shaped like the merged data with random values, over 2010-2020 times scale
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2010-01-01 07:00:00", "2020-12-30 23:00:00", freq="H")
+    hours = pd.date_range(hours[0], periods=len(hours) * scale, freq="H")
+    data = pd.DataFrame({"BEGIN_DATE_GMT": hours})
+    for col, dtype in MERGED_SCHEMA.items():
+        if dtype == "float32":
+            data[col] = rng.normal(50, 20, len(hours)).astype(dtype)
+        else:
+            data[col] = rng.integers(0, 2, len(hours))
+    data["AIL_DEMAND"] = (9500 + 400 * np.sin(2 * np.pi * hours.hour / 24) - 20 * data["Avg_temp"]
+                          + rng.normal(0, 100, len(hours))).astype("float32")
+    data["HE"] = pd.array(hours.hour + 1, dtype="UInt8")
+    return data
+
+
+def process_tree_pss_mb(pid):
+    """
+    Return the summed PSS (MB) of a process and its descendants
+    """
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open("/proc/{}/smaps_rollup".format(current)) as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+            with open("/proc/{0}/task/{0}/children".format(current)) as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total / 1024
+
+
+def legacy_search(data, n_iter, n_splits, workers):
+    import xgboost as xgb
+    from sklearn.model_selection import TimeSeriesSplit, RandomizedSearchCV
+    from xgb_training import PARAM_GRID, TARGET, prepare_data, feature_columns
+
+    prepared = prepare_data(data)
+    X = prepared[feature_columns(prepared)].to_numpy(dtype=float, na_value=np.nan)
+    y = np.array(prepared[TARGET])
+    tscv = TimeSeriesSplit(n_splits=n_splits)
+    train_index, _ = list(tscv.split(X))[-1]
+    search = RandomizedSearchCV(xgb.XGBRegressor(), param_distributions=PARAM_GRID, scoring="neg_mean_squared_error",
+                                n_iter=n_iter, n_jobs=workers, cv=tscv, random_state=42)
+    search.fit(X[train_index], y[train_index])
+    return search.best_score_
+
+
+def shared_search(data, n_iter, n_splits, workers, feature_dir):
+    from xgb_training import train
+
+    return train(data, n_iter, n_splits, workers, 42, feature_dir)["cv_results"]["mean_test_score"].max()
+
+
+def run_variant(variant, n_iter, n_splits, workers, scale):
+    """
+    Run a variant in a new process and return a dictionary with seconds, peak_pss_mb and best score
+    """
+    command = [sys.executable, "-m", "benchmarks.bench_xgb_training", "--variant", variant,
+               "--n-iter", str(n_iter), "--splits", str(n_splits), "--workers", str(workers), "--scale", str(scale)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    peak = [0.0]
+
+    def sample():
+        while process.poll() is None:
+            peak[0] = max(peak[0], process_tree_pss_mb(process.pid))
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    output, _ = process.communicate()
+    sampler.join()
+    return dict(json.loads(output.strip().splitlines()[-1]), peak_pss_mb=peak[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n-iter", type=int, default=6, help="number of candidates of the random search")
+    parser.add_argument("--splits", type=int, default=5, help="number of folds")
+    parser.add_argument("--workers", type=int, default=-1, help="number of worker processes, -1 for all cores")
+    parser.add_argument("--scale", type=int, default=1, help="number of times the 2010-2020 hours are repeated")
+    parser.add_argument("--variant", choices=["legacy", "shared"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        data = make_merged_data(args.scale)
+        start = time.perf_counter()
+        if args.variant == "legacy":
+            score = legacy_search(data, args.n_iter, args.splits, args.workers)
+        else:
+            score = shared_search(data, args.n_iter, args.splits, args.workers, tempfile.mkdtemp())
+        print(json.dumps({"seconds": time.perf_counter() - start, "score": float(score)}))
+    else:
+        print("Hours: {}, candidates: {}, folds: {}, workers: {}, cores: {}".format(
+            len(pd.date_range("2010-01-01 07:00:00", "2020-12-30 23:00:00", freq="H")) * args.scale, args.n_iter,
+            args.splits, args.workers, os.cpu_count()))
+        print("{:<40}{:>10}{:>16}{:>16}".format("", "seconds", "peak PSS (MB)", "best score"))
+        results = {}
+        for variant, label in [("legacy", "RandomizedSearchCV, float64"), ("shared", "xgb_training, memmap float32")]:
+            results[variant] = run_variant(variant, args.n_iter, args.splits, args.workers, args.scale)
+            print("{:<40}{seconds:>10.1f}{peak_pss_mb:>16.0f}{score:>16.0f}".format(label, **results[variant]))
+        print("Speed up {:.1f}x, peak memory {:.1f}x lower".format(
+            results["legacy"]["seconds"] / results["shared"]["seconds"],
+            results["legacy"]["peak_pss_mb"] / results["shared"]["peak_pss_mb"]))
@@ -0,0 +1,118 @@
+"""
+Load test of forecast_service.py: throughput and latency of concurrent clients with and without micro-batching.
+
+Fits a small Prophet model on synthetic hourly data (as bench_scenario_forecast), starts the service on a free
+local port once with batching disabled (one predict per request) and once with batching, and runs the same
+clients against both. Each client posts requests of --hours consecutive hours one after another. Requires fbprophet.
+
+Run from the root of the repository:
+    python -m benchmarks.load_test_service --clients 16 --requests 20 --hours 24
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from forecast_service import make_server
+from refit_model import make_prophet_model
+from benchmarks.bench_scenario_forecast import TEMPERATURE_COLUMNS, make_data
+
+REGRESSORS = TEMPERATURE_COLUMNS + ["workingday"]
+
+
+def make_request(rng, hours):
+    """
+    Return the body of a request for a random day of 2021 with random temperatures
+    """
+    ds = pd.date_range("2021-01-01", periods=hours, freq="H") + pd.Timedelta(days=int(rng.integers(365)))
+    rows = {"ds": ds.strftime("%Y-%m-%d %H:%M:%S").tolist()}
+    for col in TEMPERATURE_COLUMNS:
+        rows[col] = rng.normal(0, 10, hours).round(1).tolist()
+    rows["workingday"] = (ds.weekday < 5).astype(int).tolist()
+    return json.dumps({"rows": rows}).encode()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_clients(url, clients, requests, hours, seed=0):
+    """
+    Run concurrent clients, each posting requests one after another
+    ----------
+    Input
+        - url: base url of the service e.g. http://127.0.0.1:8050
+        - clients: number of concurrent clients
+        - requests: number of requests per client
+        - hours: number of rows per request
+        - seed: seed of the random requests
+    Returns
+        - Tuple (seconds, latencies): wall clock time and Numpy array of the latency of each request in seconds
+    """
+    bodies = [[make_request(np.random.default_rng([seed, client, i]), hours) for i in range(requests)]
+              for client in range(clients)]
+
+    def client(client_bodies):
+        latencies = []
+        for body in client_bodies:
+            start = time.perf_counter()
+            post(url + "/forecast", body)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = [latency for result in executor.map(client, bodies) for latency in result]
+    return time.perf_counter() - start, np.array(latencies)
+
+
+def load_test(model, clients, requests, hours, max_requests, max_wait):
+    """
+    Start the service, run the clients against it and return a dictionary of results
+    """
+    server = make_server({"synthetic": model}, port=0, max_requests=max_requests, max_wait=max_wait)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}".format(server.server_address[1])
+    try:
+        post(url + "/forecast", make_request(np.random.default_rng(), hours))
+        seconds, latencies = run_clients(url, clients, requests, hours)
+        with urllib.request.urlopen(url + "/metrics") as response:
+            metrics = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+    p50, p99 = np.percentile(latencies * 1000, [50, 99])
+    return {"throughput": len(latencies) / seconds, "p50": p50, "p99": p99,
+            "batch_requests": metrics["batch_requests"]["mean"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--hours", type=int, default=24, help="rows per request")
+    parser.add_argument("--samples", type=int, default=100, help="samples of the uncertainty intervals")
+    parser.add_argument("--max-batch-requests", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    data = make_data(2019)
+    model = make_prophet_model(REGRESSORS, uncertainty_samples=args.samples)
+    model.fit(data[(data["ds"] >= "2019-10-01") & (data["ds"] < "2020-01-01")])
+
+    print("Clients: {}, requests per client: {}, hours per request: {}".format(args.clients, args.requests,
+                                                                               args.hours))
+    print("{:<16}{:>14}{:>12}{:>12}{:>18}".format("", "requests/s", "p50 (ms)", "p99 (ms)", "requests/batch"))
+    results = {}
+    for name, max_requests in [("no batching", 1), ("batching", args.max_batch_requests)]:
+        results[name] = load_test(model, args.clients, args.requests, args.hours, max_requests,
+                                  args.max_wait_ms / 1000)
+        print("{:<16}{throughput:>14.1f}{p50:>12.1f}{p99:>12.1f}{batch_requests:>18.1f}".format(name, **results[name]))
+    print("Throughput gain: {:.1f}x".format(results["batching"]["throughput"] / results["no batching"]["throughput"]))
@@ -0,0 +1,267 @@
+"""
+Benchmark suite: time and peak memory of the main data processing steps on synthetic data at several scales.
+
+Steps timed: back_filling_temperatures_pipeline (every station), calc_weighted_temp, calc_degree_days,
+the merge of merge_full_data.py (build_merged_data), make_prophet_df, make_future_df, the dashboard aggregates
+(dashboard_cubes.build_cubes) and the figure builders of viz_exploratory_data.py and viz_summary_2020.py. The inputs come from benchmarks/synthetic_data.py, see
+SCALES there for the history length and number of stations of each scale.
+
+The time of a step is the best of --repeat runs, and its peak memory is the peak of the memory allocated during
+one more run, traced with tracemalloc (Numpy and pandas allocations included). Steps whose dependencies are not
+installed (fbprophet, dash) are reported as skipped.
+
+Results are written to benchmarks/results/<commit>.json (or --output) with the versions of Python, pandas and
+Numpy, so runs of two versions of the repository can be compared with --compare:
+    python -m benchmarks.run_suite --scales 1 10
+    python -m benchmarks.run_suite --scales 1 10 --compare benchmarks/results/<previous commit>.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_inputs, wide_temperature_table, merge_sources, merged_data, \
+    make_forecasts
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+def back_filling(context):
+    from clean_temperature_script import back_filling_temperatures_pipeline
+
+    inputs = context["inputs"]
+    temps_raw, hours = inputs["temps_raw"], inputs["hours"]
+    stations = [temps_raw[temps_raw["NRG_STREAM_NAME"] == stream] for stream in inputs["stations"]]
+    return lambda: [back_filling_temperatures_pipeline(station, hours[0], hours[-1]) for station in stations]
+
+
+def weighted_temp(context):
+    from merge_full_data import TEMP_COL, WEIGHTED_TEMP_COLS, calc_weighted_temp
+
+    temp_data = context["wide"].copy()
+    return lambda: calc_weighted_temp(temp_data, TEMP_COL, list(WEIGHTED_TEMP_COLS))
+
+
+def degree_days(context):
+    from merge_full_data import TEMP_COL, calc_degree_days
+
+    temps = context["wide"].filter(like=TEMP_COL + "|").mean(axis=1)
+    return lambda: calc_degree_days(temps, base_temp=18)
+
+
+def merge(context):
+    from merge_full_data import build_merged_data
+
+    sources = merge_sources(context["inputs"], context["wide"])
+    return lambda: build_merged_data(sources)
+
+
+def prophet_frame(context):
+    from normalize_2020_predictions import FEATURES
+    from feature_factory import add_features
+
+    data = add_features(context["merged"].copy(), FEATURES)
+    regressors = [feature["name"] for feature in FEATURES] + ["future 1", "WTI spot", "workingday"]
+    return data.drop(columns=["AIL_DEMAND"]), data["AIL_DEMAND"], regressors
+
+
+def prophet_df(context):
+    from normalize_2020_predictions import make_prophet_df
+
+    X, y, regressors = prophet_frame(context)
+    return lambda: make_prophet_df(X, y, regressors)
+
+
+def future_df(context):
+    from fbprophet import Prophet
+    from normalize_2020_predictions import make_prophet_df, make_future_df
+
+    prophet_data = make_prophet_df(*prophet_frame(context))
+    train_df = prophet_data[prophet_data["ds"] < "2020-01-01"].dropna()
+    test_df = prophet_data[prophet_data["ds"] >= "2020-01-01"]
+    # make_future_dataframe only needs the training dates, the model does not have to be fitted
+    model = Prophet()
+    model.history_dates = pd.to_datetime(train_df["ds"]).sort_values()
+    return lambda: make_future_df(model, train_df, test_df, include_history=True)
+
+
+def cubes(context):
+    from dashboard_cubes import build_cubes
+
+    data = context["merged"]
+    return lambda: build_cubes(data)
+
+
+def exploratory_figure(name, cube=None):
+    def case(context):
+        import viz_exploratory_data
+
+        if cube is not None:
+            data = context["cubes"][cube]
+        else:
+            data = viz_exploratory_data.prepare_data(context["merged"][["BEGIN_DATE_GMT", "HE", "AIL_DEMAND"]].copy())
+        builder = getattr(viz_exploratory_data, name)
+        return lambda: builder(data)
+    return case
+
+
+def summary_figure(name, cube=None):
+    def case(context):
+        import viz_summary_2020
+
+        builder = getattr(viz_summary_2020, name)
+        if name == "plot_ail_2020":
+            forecasts = make_forecasts(context["merged"])
+            return lambda: builder(forecasts, "2020-01-01", "2020-12-31")
+        data = context["cubes"][cube]
+        return lambda: builder(data)
+    return case
+
+
+CASES = [("back_filling_temperatures_pipeline", back_filling),
+         ("calc_weighted_temp", weighted_temp),
+         ("calc_degree_days", degree_days),
+         ("build_merged_data", merge),
+         ("make_prophet_df", prophet_df),
+         ("make_future_df", future_df),
+         ("build_cubes", cubes)] + \
+    [("viz_exploratory_data." + name, exploratory_figure(name, cube))
+     for name, cube in [("plot_ail_dstribution_by_year", None), ("plot_ail_distribution_by_hour", None),
+                        ("plot_temp_v_demand_line", "daily"), ("plot_temp_v_demand_scatter", "daily")]] + \
+    [("viz_summary_2020." + name, summary_figure(name, cube))
+     for name, cube in [("plot_oil_v_demand", "yearly"), ("plot_avg_pool_price", "yearly"),
+                        ("plot_normalized_demand", "daily"), ("plot_ail_2020", None)]]
+"""
+List of (name, setup): setup takes the context of a scale (see make_context) and returns the step to time,
+a function without arguments
+"""
+
+
+def make_context(scale, seed=0):
+    """
+    Return the synthetic inputs of a scale and the tables derived from them
+    """
+    from dashboard_cubes import build_cubes
+
+    inputs = make_inputs(scale, seed)
+    wide = wide_temperature_table(inputs)
+    merged = merged_data(inputs, wide)
+    return {"inputs": inputs, "wide": wide, "merged": merged, "cubes": build_cubes(merged)}
+
+
+def measure(step, repeat):
+    """
+    Return the best time (seconds) of repeat runs of step and the peak memory (MB) allocated by one more run
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        step()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        step()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+
+def run_suite(scales, repeat=3, cases=None, seed=0):
+    """
+    Run the benchmark cases at every scale
+    ----------
+    Input
+        - scales: list of scales, see synthetic_data.SCALES
+        - repeat: number of timed runs of each step
+        - cases: names of the cases to run, defaults to all of CASES
+        - seed: seed of the synthetic data
+    Returns
+        - List of dictionaries with case, scale, hours, stations, seconds, peak_mb,
+          or skipped (the missing dependency) instead of seconds and peak_mb
+    """
+    results = []
+    for scale in scales:
+        context = make_context(scale, seed)
+        size = {"scale": scale, "hours": len(context["inputs"]["hours"]),
+                "stations": len(context["inputs"]["stations"])}
+        for name, setup in CASES:
+            if cases and name not in cases:
+                continue
+            try:
+                step = setup(context)
+            except ImportError as error:
+                results.append(dict(case=name, skipped=str(error), **size))
+                continue
+            seconds, peak_mb = measure(step, repeat)
+            results.append(dict(case=name, seconds=seconds, peak_mb=peak_mb, **size))
+            print("{:<50}{:>6}x{:>10.3f}s{:>10.1f} MB".format(name, scale, seconds, peak_mb), flush=True)
+        del context
+    return results
+
+
+def git_commit():
+    """
+    Return the current commit of the repository, None outside of a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """
+    Print the ratio of the time and peak memory of every result to the same case and scale of previous results
+    """
+    before = {(r["case"], r["scale"]): r for r in previous["results"] if "seconds" in r}
+    print("\nCompared with {} ({})".format(previous.get("commit"), previous.get("created")))
+    print("{:<50}{:>7}{:>12}{:>12}".format("", "scale", "time", "memory"))
+    for result in results:
+        old = before.get((result["case"], result["scale"]))
+        if old is None or "seconds" not in result:
+            continue
+        print("{:<50}{:>6}x{:>11.2f}x{:>11.2f}x".format(
+            result["case"], result["scale"], result["seconds"] / old["seconds"],
+            result["peak_mb"] / max(old["peak_mb"], 1e-9)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10],
+                        help="scales of the synthetic data (default: 1 10, 100 needs about 16 GB of memory)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each step")
+    parser.add_argument("--cases", nargs="+", default=None, help="names of the cases to run (default: all)")
+    parser.add_argument("--output", default=None,
+                        help="path of the JSON results (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = run_suite(args.scales, args.repeat, args.cases)
+    report = {"commit": commit, "created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+              "cpu_count": os.cpu_count(), "repeat": args.repeat, "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, "{}.json".format(commit[:10] if commit else "unversioned"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        if "skipped" in result:
+            print("{:<50}{:>6}x  skipped: {}".format(result["case"], result["scale"], result["skipped"]))
+    print("Results written to {}".format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,174 @@
+"""
+Synthetic inputs shaped like the MSA data, at a chosen scale of history length and station count.
+
+Scale 1 is the real data: 2010-2020 and the four temperature stations. Larger scales first extend the history
+backwards (up to 10 times, 1910-2020: pandas timestamps cannot go before 1677) and then multiply the number of
+stations, so scale 10 is 110 years of 4 stations and scale 100 is 110 years of 40 stations.
+
+make_inputs returns the raw temperature sheets, AIL and pool price, oil prices, exchange rates and population,
+each in the format the scripts of the repository read them. The other functions derive the intermediate tables
+(wide temperature table, merged data, 2020 forecasts) without running the cleaning scripts.
+"""
+
+import numpy as np
+import pandas as pd
+
+from clean_temperature_script import STREAM_NAMES_DICT
+from merge_full_data import build_merged_data
+from msa_data import apply_schema
+
+SCALES = {1: (1, 1), 10: (10, 1), 100: (10, 10)}
+"""
+Scale: (history factor, station factor)
+"""
+END_HOUR = "2020-12-30 23:00:00"
+YEARS = 11
+POP_COLUMNS = ["pop_high", "pop_low", "pop_medium"]
+
+
+def scale_factors(scale):
+    """
+    Return (history factor, station factor) of a scale, see SCALES. Scales not in SCALES extend the history first
+    """
+    if scale in SCALES:
+        return SCALES[scale]
+    history = min(scale, 10)
+    return history, max(1, scale // history)
+
+
+def make_stations(station_factor):
+    """
+    Return a dictionary of stream name: census division with the real stations first
+    """
+    stations = dict(STREAM_NAMES_DICT)
+    for i in range(len(STREAM_NAMES_DICT) * (station_factor - 1)):
+        stations["EC - Station{} Temp".format(i + 1)] = 100 + i
+    return stations
+
+
+def make_inputs(scale=1, seed=0):
+    """
+    Return synthetic MSA inputs
+    ----------
+    Input
+        - scale: 1, 10 or 100, see SCALES
+        - seed: seed of the random values
+    Returns
+        - Dictionary with
+          hours: DatetimeIndex of the hourly history
+          stations: dictionary of stream name: census division, as clean_temperature_script.STREAM_NAMES_DICT
+          temps_raw: long table of the temperature sheets (BEGIN_DATE_GMT, END_DATE_GMT, NRG_STREAM_NAME,
+                     TEMP_CELSIUS) with missing hours and missing values
+          population: cleaned population (Region, Year, pop_* and pct_pop_* columns)
+          ail: AIL and pool price (BEGIN_DATE_GMT, HE, POOL_PRICE, AIL_DEMAND)
+          oilfutures, oilprices: daily oil prices in CAD (BEGIN_DATE_GMT, future 1-4 / WTI spot) on business days
+          fx: USD/CAD exchange rates (SOURCE_DAY_DATE, RATE, SOURCE_TIMEZONE)
+    """
+    rng = np.random.default_rng(seed)
+    history_factor, station_factor = scale_factors(scale)
+    end = pd.Timestamp(END_HOUR)
+    start = pd.Timestamp("2010-01-01 07:00:00") - pd.DateOffset(years=YEARS * (history_factor - 1))
+    hours = pd.date_range(start, end, freq="H")
+    n = len(hours)
+    seasonal = -15 * np.cos(2 * np.pi * (hours.dayofyear.to_numpy() - 15) / 365.25) \
+        - 4 * np.cos(2 * np.pi * (hours.hour.to_numpy() - 15) / 24)
+    stations = make_stations(station_factor)
+
+    # Temperature sheets: 0.5% of the hours are not reported, 0.5% are reported without a value
+    frames = []
+    for stream in stations:
+        temps = 3 + seasonal + rng.normal(0, 4, n)
+        temps[rng.random(n) < 0.005] = np.nan
+        reported = rng.random(n) >= 0.005
+        frames.append(pd.DataFrame({"BEGIN_DATE_GMT": hours[reported],
+                                    "END_DATE_GMT": hours[reported] + pd.Timedelta(hours=1),
+                                    "NRG_STREAM_NAME": pd.Categorical.from_codes(
+                                        np.full(reported.sum(), len(frames)), list(stations)),
+                                    "TEMP_CELSIUS": temps[reported]}))
+    temps_raw = pd.concat(frames, ignore_index=True)
+
+    # Population of each census division, growing every year
+    years = np.arange(hours[0].year, 2047)
+    regions = np.array(list(stations.values()))
+    population = pd.DataFrame({"Region": np.repeat(regions, len(years)), "Year": np.tile(years, len(regions))})
+    base = rng.uniform(5e4, 1.5e6, len(regions))
+    for i, col in enumerate(POP_COLUMNS):
+        growth = 1 + rng.uniform(0.005, 0.02, len(regions)) * (i + 1) / 2
+        population[col] = np.round(np.repeat(base, len(years)) *
+                                   growth[np.repeat(np.arange(len(regions)), len(years))] ** (
+                                       population["Year"] - 2010)).astype(np.int64)
+        population["pct_" + col] = population[col] / population.groupby("Year")[col].transform("sum")
+
+    ail = pd.DataFrame({"BEGIN_DATE_GMT": hours,
+                        "HE": hours.hour + 1,
+                        "POOL_PRICE": rng.gamma(2, 25, n).round(2),
+                        "AIL_DEMAND": (9500 + 400 * np.sin(2 * np.pi * hours.hour / 24) - 30 * seasonal
+                                       + rng.normal(0, 150, n)).astype(np.int64)})
+
+    days = pd.bdate_range(hours[0].normalize() - pd.Timedelta(days=1), end.normalize() + pd.Timedelta(days=7))
+    price = 60 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+    oilfutures = pd.DataFrame({"BEGIN_DATE_GMT": days})
+    for i in range(1, 5):
+        oilfutures["future {}".format(i)] = price * (1 + 0.005 * i)
+    spot_days = rng.random(len(days)) > 0.02
+    oilprices = pd.DataFrame({"BEGIN_DATE_GMT": days[spot_days], "WTI spot": price[spot_days]})
+    fx = pd.DataFrame({"SOURCE_DAY_DATE": days, "RATE": 1.3 + rng.normal(0, 0.05, len(days)).cumsum() / 50,
+                       "SOURCE_TIMEZONE": "MST"})
+
+    return {"hours": hours, "stations": stations, "temps_raw": temps_raw, "population": population,
+            "ail": ail, "oilfutures": oilfutures, "oilprices": oilprices, "fx": fx}
+
+
+def wide_temperature_table(inputs):
+    """
+    Return the wide temperature table written by clean_temperature_script.py (BEGIN_DATE_GMT,
+    BFILL_TEMP_CELSIUS|<CITY> and PCT_<SCENARIO>|<CITY> columns), with the missing temperatures filled
+    by the previous value instead of the back filling rules
+    """
+    from clean_temperature_script import city_name
+
+    hours = inputs["hours"]
+    temps_raw, population = inputs["temps_raw"], inputs["population"]
+    columns = {"BEGIN_DATE_GMT": hours}
+    year_rows = hours.year.to_numpy() - population["Year"].min()
+    for stream, region in inputs["stations"].items():
+        rows = temps_raw["NRG_STREAM_NAME"] == stream
+        temps = pd.Series(temps_raw.loc[rows, "TEMP_CELSIUS"].to_numpy(),
+                          index=temps_raw.loc[rows, "BEGIN_DATE_GMT"]).reindex(hours)
+        columns["BFILL_TEMP_CELSIUS|" + city_name(stream)] = temps.ffill().bfill().to_numpy()
+        region_population = population[population["Region"] == region].sort_values("Year")
+        for col in POP_COLUMNS:
+            columns["PCT_{}|{}".format(col.upper(), city_name(stream))] = \
+                region_population["pct_" + col].to_numpy()[year_rows]
+    return pd.DataFrame(columns)
+
+
+def merge_sources(inputs, temp_data=None):
+    """
+    Return the sources of merge_full_data.build_merged_data, as returned by merge_full_data.load_sources
+    """
+    return {"ail": inputs["ail"], "temp": wide_temperature_table(inputs) if temp_data is None else temp_data,
+            "oilfutures": inputs["oilfutures"], "oilprices": inputs["oilprices"]}
+
+
+def merged_data(inputs, temp_data=None):
+    """
+    Return the merged data of the inputs as msa_data.load_merged_data returns it
+    """
+    return apply_schema(build_merged_data(merge_sources(inputs, temp_data)))
+
+
+def make_forecasts(merged, year=2020, seed=0):
+    """
+    Return forecasts shaped like forecasted_2020_data.csv for the hours of year in merged data,
+    or for every hour when year is None
+    """
+    rng = np.random.default_rng(seed)
+    data = merged if year is None else merged[merged["BEGIN_DATE_GMT"].dt.year == year]
+    actual = data["AIL_DEMAND"].to_numpy()
+    forecasts = pd.DataFrame({"BEGIN_DATE_GMT": data["BEGIN_DATE_GMT"].to_numpy(),
+                              "Actual_Load": actual,
+                              "Predicted_Load": actual + rng.normal(0, 200, len(actual)),
+                              "Temperature_Norm_Load": actual + rng.normal(0, 300, len(actual))})
+    forecasts.index = forecasts["BEGIN_DATE_GMT"]
+    return forecasts
@@ -0,0 +1,119 @@
+"""
+Calendar dimension table with one row per day from 2010 to 2046.
+
+Day level attributes (weekday, Canadian and Alberta holidays, working days) are computed once,
+cached under cache/ and joined to hourly data frames with a vectorized lookup on the date.
+
+Columns:
+- weekday: Monday = 0, ..., Sunday = 6
+- holiday: 1 if the day is in holidays.CA(), as used for msa_merged_data.csv
+- ab_holiday: 1 if the day is a holiday in Alberta (adds Family Day, Heritage Day...)
+- workingday: 1 unless the day is a holiday or on a weekend
+- ab_workingday: 1 unless the day is an Alberta holiday or on a weekend
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import holidays
+
+from input_cache import HAS_PYARROW
+
+START_YEAR = 2010
+END_YEAR = 2046
+CACHE_DIR = "cache"
+CALENDAR_COLUMNS = ["weekday", "holiday", "ab_holiday", "workingday", "ab_workingday"]
+
+_calendars = {}
+
+
+def build_calendar(start_year=START_YEAR, end_year=END_YEAR):
+    """
+    Build the calendar dimension table
+    ----------
+    Input
+        - start_year: first year of the table
+        - end_year: last year of the table (included)
+    Returns
+        - Pandas DataFrame indexed by date with the columns in CALENDAR_COLUMNS
+    """
+    days = pd.date_range(start="{}-01-01".format(start_year),
+                         end="{}-12-31".format(end_year), freq="D")
+    years = range(start_year, end_year + 1)
+    ca_holidays = pd.to_datetime(list(holidays.CA(years=years).keys()))
+    ab_holidays = pd.to_datetime(list(holidays.CA(prov="AB", years=years).keys()))
+
+    calendar = pd.DataFrame(index=pd.Index(days, name="date"))
+    calendar["weekday"] = days.weekday.astype("int8")
+    calendar["holiday"] = days.isin(ca_holidays).astype("int8")
+    calendar["ab_holiday"] = days.isin(ab_holidays).astype("int8")
+    weekend = calendar["weekday"] >= 5
+    calendar["workingday"] = (~(weekend | (calendar["holiday"] == 1))).astype("int8")
+    calendar["ab_workingday"] = (~(weekend | (calendar["ab_holiday"] == 1))).astype("int8")
+    return calendar
+
+
+def calendar_path(start_year=START_YEAR, end_year=END_YEAR, cache_dir=CACHE_DIR):
+    """
+    Return the path of the cached calendar. The holidays package version is part of the name
+    since holiday rules change between versions
+    """
+    return os.path.join(cache_dir, "calendar_{}_{}_holidays-{}.parquet".format(
+        start_year, end_year, holidays.__version__))
+
+
+def load_calendar(start_year=START_YEAR, end_year=END_YEAR, cache_dir=CACHE_DIR):
+    """
+    Return the calendar dimension table, reading it from the cache when it exists
+    ----------
+    Input
+        - start_year: first year of the table
+        - end_year: last year of the table (included)
+        - cache_dir: directory of the cache
+    Returns
+        - Pandas DataFrame, see build_calendar
+    """
+    key = (start_year, end_year, cache_dir)
+    if key in _calendars:
+        return _calendars[key]
+
+    path = calendar_path(start_year, end_year, cache_dir)
+    if HAS_PYARROW and os.path.exists(path):
+        calendar = pd.read_parquet(path)
+    else:
+        calendar = build_calendar(start_year, end_year)
+        if HAS_PYARROW:
+            os.makedirs(cache_dir, exist_ok=True)
+            calendar.to_parquet(path)
+    _calendars[key] = calendar
+    return calendar
+
+
+def add_calendar_features(df, date_col, columns=("holiday", "workingday"), calendar=None):
+    """
+    Add day level calendar columns to a data frame with one row per hour (or any frequency).
+    Alter data frame in place
+    ----------
+    Input
+        - df: Pandas DataFrame
+        - date_col: name of the column with timestamps
+        - columns: calendar columns to add, see CALENDAR_COLUMNS
+        - calendar: calendar dimension table, defaults to load_calendar().
+          Years outside of the table are built on the fly
+    Returns
+        - The altered data frame
+    """
+    if calendar is None:
+        calendar = load_calendar()
+    days = df[date_col].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    calendar_days = calendar.index.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    if len(days) and (days.min() < calendar_days[0] or days.max() > calendar_days[-1]):
+        calendar = build_calendar(min(pd.Timestamp(days.min()).year, calendar.index[0].year),
+                                  max(pd.Timestamp(days.max()).year, calendar.index[-1].year))
+        calendar_days = calendar.index.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+
+    # The calendar has one row per day so a day's row number is its distance from the first day
+    positions = (days - calendar_days[0]).astype(np.int64)
+    for col in columns:
+        df[col] = calendar[col].to_numpy()[positions].astype(np.int64)
+    return df
@@ -1,6 +1,9 @@
 
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import pandas as pd
 import numpy as np
+from input_cache import read_excel_cached
 
 STREAM_NAMES_DICT = {"EC - Calgary Temp": 6,
                      "EC - Edmonton Temp": 11,
@@ -16,6 +19,22 @@ Census division that contains each city
 - 16: Fort McMurray
 """
 
+FULL_TIME_START = "2010-01-01 07:00:00"
+FULL_TIME_END = "2021-01-05 07:00:00"
+"""
+Hourly range of the cleaned temperature data
+"""
+
+CITY_NAMES_DICT = {"EC - Calgary Temp": "CALGARY",
+                   "EC - Edmonton Temp": "EDMONTON",
+                   "EC - Fort McMurray Temp": "FORTMM",
+                   "EC - Lethbridge Temp": "LETHBRG"
+                   }
+"""
+Short names used as column suffixes in the wide table e.g. BFILL_TEMP_CELSIUS|CALGARY
+Streams not listed here use their name without the "EC - " prefix and " Temp" suffix
+"""
+
 # Cleaning Temperature Data
 """
 After Inital data cleaning, the number of missings values for each city is:
@@ -31,73 +50,93 @@ The purpose is to find out number of gaps in the data for each location
 --------
 Parameters:
     - df: raw data frame
+    - start, end: first and last hour of the full time range
 """
 
 
-def merge_full_time(df):
-    full_time = pd.DataFrame(pd.date_range(start='2010-01-01 07:00:00', end='2021-01-05 07:00:00', freq='H'),
+def merge_full_time(df, start=FULL_TIME_START, end=FULL_TIME_END):
+    full_time = pd.DataFrame(pd.date_range(start=start, end=end, freq='H'),
                              columns=["FULL_BEGIN_DATE_GMT"])
     return full_time.merge(df, how="left",
                            left_on="FULL_BEGIN_DATE_GMT",
                            right_on="BEGIN_DATE_GMT")
 
 
-def back_filling_temperatures_pipeline(temp_raw_df):
+def find_gaps(missing):
+    """
+    Classify missing entries of a regular hourly series in a single pass.
+    ---------
+    Input:
+        - missing: boolean numpy array, True where the value is missing
+    Returns:
+        - Tuple of boolean numpy arrays (isolated, in_run)
+            isolated: missing value with available values on both sides
+            in_run: missing value that is part of two or more continous gaps
+    """
+    prev_missing = np.zeros_like(missing)
+    prev_missing[1:] = missing[:-1]
+    next_missing = np.zeros_like(missing)
+    next_missing[:-1] = missing[1:]
+    in_run = missing & (prev_missing | next_missing)
+    isolated = missing & ~in_run
+    return isolated, in_run
+
+
+def bfill_temperature(values, hours_per_day=24):
+    """
+    Back fill a temperature series laid out on a regular hourly grid (see merge_full_time).
+    Offsets are positional so position i - 1 is the previous hour and i - 24 is the same hour of the previous day.
+    - Isolated gaps take the value from the previous hour
+    - Gaps inside a run take the (already back filled) value from the same hour of the previous day
+    ---------
+    Input:
+        - values: numpy array of temperatures with NaN for missing entries
+        - hours_per_day: positional offset used for runs of gaps
+    Returns:
+        - numpy array of back filled temperatures
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[0]
+    isolated, in_run = find_gaps(np.isnan(values))
+    filled = values.copy()
+
+    # Isolated gaps: the previous hour is always an observed value
+    iso_idx = np.flatnonzero(isolated)
+    iso_src = iso_idx - 1
+    filled[iso_idx] = np.where(iso_src >= 0, values[np.maximum(iso_src, 0)], np.nan)
+
+    # Runs of gaps: each one resolves to the latest position that is not in a run,
+    # going back a whole number of days. Arranging the series as (days x hours)
+    # turns that into a running maximum down each hour-of-day column.
+    if in_run.any():
+        n_days = -(-n // hours_per_day)
+        source = np.arange(n_days * hours_per_day)
+        source[n:] = -1
+        source[:n][in_run] = -1
+        source = np.maximum.accumulate(
+            source.reshape(n_days, hours_per_day), axis=0).ravel()[:n]
+        run_idx = np.flatnonzero(in_run)
+        run_src = source[run_idx]
+        filled[run_idx] = np.where(run_src >= 0, filled[np.maximum(run_src, 0)], np.nan)
+
+    return filled
+
+
+def back_filling_temperatures_pipeline(temp_raw_df, start=FULL_TIME_START, end=FULL_TIME_END):
     """
-    Alter full dataframe inplace.  Fill out missing values according to the following rule:
+    Return full dataframe with a new column "BFILL_TEMP_CELSIUS". Fill out missing values according to the following rule:
     - If the gap is isolated, use value from previous hour
     - If there are two or more continous gaps, use corresponding seuqence of hours from previous day
     --------
     Parameters:
-        - na_df: dataframe with just missing entries
-        - full_df: dataframe with all entries
+        - temp_raw_df: raw temperature data for a single location
+        - start, end: first and last hour of the full time range, see merge_full_time
     """
-    def bfill_temperature(na_df, full_df):
-        """
-        Helper function. Returns the number of hours in-between gaps
-        ---------
-        Inputs:
-            - next-gap: gap i + 1
-            - current-gap: gap i
-            Valus must be of type "datetime64[ns]"
-        """
-        def time_gap(next_gap, current):
-            return (next_gap - current) / pd.Timedelta(hours=1)
-
-        # Generate columns with previous and next gap
-        na_df["NEXT_GAP"] = na_df["FULL_BEGIN_DATE_GMT"].shift(-1)
-        na_df["PREV_GAP"] = na_df["FULL_BEGIN_DATE_GMT"].shift(
-            1)  # Equivalent of lagging variable by 1
-
-        # Make new column to store back-filled values
-        full_df["BFILL_TEMP_CELSIUS"] = pd.Series.copy(full_df["TEMP_CELSIUS"])
-
-        # Iterating through each row in the dataframe with only missing values
-        for index, row in na_df.iterrows():
-            prev_gap = time_gap(row["FULL_BEGIN_DATE_GMT"], row["PREV_GAP"])
-            next_gap = time_gap(row["NEXT_GAP"], row["FULL_BEGIN_DATE_GMT"])
-
-            # If the missing row is part of a continous sequence ...
-            if prev_gap == 1.0 or next_gap == 1.0:
-
-                # .... use temperature from same time of previous day
-                last_day_temp = full_df[full_df["FULL_BEGIN_DATE_GMT"] ==
-                                        row["FULL_BEGIN_DATE_GMT"]-pd.Timedelta(days=1)]["BFILL_TEMP_CELSIUS"]
-                full_df.at[index, "BFILL_TEMP_CELSIUS"] = last_day_temp
-            # If the missing row is isolated...
-            else:
-                # ... use temperature from last hour
-                last_hour_temp = full_df[full_df["FULL_BEGIN_DATE_GMT"] ==
-                                         row["FULL_BEGIN_DATE_GMT"]-pd.Timedelta(hours=1)]["BFILL_TEMP_CELSIUS"]
-                full_df.at[index, "BFILL_TEMP_CELSIUS"] = last_hour_temp
-
     # Generate full data frame
-    temp_full_df = merge_full_time(temp_raw_df)
-    # Filter out missing Values
-    temp_na_df = temp_full_df[pd.isna(temp_full_df["TEMP_CELSIUS"])][[
-        "FULL_BEGIN_DATE_GMT"]]
+    temp_full_df = merge_full_time(temp_raw_df, start, end)
     # Back filling missing temperature
-    bfill_temperature(temp_na_df, temp_full_df)
+    temp_full_df["BFILL_TEMP_CELSIUS"] = bfill_temperature(
+        temp_full_df["TEMP_CELSIUS"].to_numpy(dtype=float))
 
     return temp_full_df
 
@@ -117,10 +156,142 @@ def fill_aux_data(df, stream_name, region):
     return final_df[df.columns.difference(["FULL_BEGIN_DATE_GMT", "SOURCE_DATETIME", "VERSION_BEGIN_LOCAL", "VERSION_END_LOCAL"])]
 
 
+def city_name(stream):
+    """
+    Return the short name of a temperature stream used in the wide table
+    """
+    if stream in CITY_NAMES_DICT:
+        return CITY_NAMES_DICT[stream]
+    return stream.replace("EC - ", "").replace(" Temp", "").replace(" ", "").upper()
+
+
+def clean_station(location_temp_raw, stream, census_div, population_data):
+    """
+    Back fill and weight the temperature data of a single station.
+    Returns the station's block of the wide table, indexed by BEGIN_DATE_GMT
+    with columns named <COLUMN>|<CITY> e.g. BFILL_TEMP_CELSIUS|CALGARY
+    ---------
+    Input:
+        - location_temp_raw: raw temperature data for the station
+        - stream: name of the temperature stream
+        - census_div: census division that contains the station
+        - population_data: population data for the station's census division
+    Returns:
+        - Pandas DataFrame
+    """
+    location_temp_raw = location_temp_raw.copy()
+    # Consider the outlier in Lethbridge an NA
+    if stream == "EC - Lethbridge Temp":
+        outliers = np.flatnonzero(location_temp_raw["TEMP_CELSIUS"].to_numpy() > 40)
+        if len(outliers):
+            location_temp_raw.iloc[outliers[0], location_temp_raw.columns.get_loc(
+                "TEMP_CELSIUS")] = np.nan
+    # Backfilling the temperature
+    location_temp_full = back_filling_temperatures_pipeline(location_temp_raw)
+    # Filling in additional data
+    location_temp_final = fill_aux_data(location_temp_full, stream, census_div)
+
+    # Generate column with values for the year
+    location_temp_final["Year"] = location_temp_final["BEGIN_DATE_GMT"].dt.year
+
+    # Weight temperature by population based on the given temperature column
+    weighted_temp = location_temp_final.merge(
+        population_data, on=['Year', 'Region'], how='left')
+    weighted_temp.rename(str.upper, axis='columns', inplace=True)
+
+    # Every hour appears once per station so the block is a plain reshape of the long table
+    value_columns = station_value_columns(population_data)
+    block = weighted_temp.set_index("BEGIN_DATE_GMT")[value_columns]
+    block.columns = [col + "|" + city_name(stream) for col in value_columns]
+    return block
+
+
+def station_value_columns(population_data):
+    """
+    Return the numeric columns kept for every station in the wide table
+    """
+    pop_columns = [col.upper() for col in population_data.columns
+                   if col not in ["Year", "Region"] and not col.startswith("Unnamed")]
+    return sorted(["BFILL_TEMP_CELSIUS", "TEMP_CELSIUS"] + pop_columns)
+
+
+def clean_all_stations(temps_raw, population_data, stations=STREAM_NAMES_DICT, workers=1):
+    """
+    Clean every station and assemble the wide table of back filled and weighted temperatures.
+    With workers > 1, stations are cleaned in a pool of processes. At most two stations per worker
+    are in flight at a time and each finished block is copied straight into the preallocated wide table,
+    so peak memory stays close to the size of the final table no matter how many stations there are.
+    ---------
+    Input:
+        - temps_raw: raw temperature data for all stations, with column NRG_STREAM_NAME
+        - population_data: cleaned population data with columns Year, Region and population estimates
+        - stations: dictionary of stream name: census division
+        - workers: number of processes used to clean stations
+    Returns:
+        - Pandas DataFrame indexed by BEGIN_DATE_GMT with one column per (measure, city) pair
+    """
+    station_rows = temps_raw.groupby("NRG_STREAM_NAME").indices
+    region_rows = population_data.groupby("Region").indices
+    empty_rows = np.array([], dtype=int)
+
+    def jobs():
+        for stream, census_div in stations.items():
+            yield (temps_raw.iloc[station_rows.get(stream, empty_rows)],
+                   stream,
+                   census_div,
+                   population_data.iloc[region_rows.get(census_div, empty_rows)])
+
+    # Allocate the wide table up front, columns ordered by measure then city
+    hours = merge_full_time(temps_raw.iloc[:0])["FULL_BEGIN_DATE_GMT"]
+    columns = sorted(((col, city_name(stream)) for col in station_value_columns(population_data)
+                      for stream in stations))
+    wide = pd.DataFrame(np.full((len(hours), len(columns)), np.nan),
+                        index=pd.Index(hours, name="BEGIN_DATE_GMT"),
+                        columns=[col + "|" + city for col, city in columns])
+    positions = {col: i for i, col in enumerate(wide.columns)}
+    integer_columns = []
+
+    def place(block):
+        integer_columns.extend(col for col in block.columns if pd.api.types.is_integer_dtype(block[col]))
+        if block.index.has_duplicates:
+            # Raw rows repeating an hour are averaged, as pivot_table did
+            block = block.groupby(level=0).mean()
+        block = block.reindex(wide.index)
+        for col in block.columns:
+            wide.iloc[:, positions[col]] = block[col].to_numpy(dtype=float)
+
+    if workers <= 1:
+        for job in jobs():
+            place(clean_station(*job))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for job in jobs():
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        place(future.result())
+                pending.add(executor.submit(clean_station, *job))
+            for future in pending:
+                place(future.result())
+
+    # Keep integer measures (population counts) as integers and drop measures
+    # that are missing for every hour, as pivot_table did
+    wide = wide.astype({col: "int64" for col in integer_columns})
+    return wide.dropna(axis=1, how="all")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Back fill temperature data and weight it by population")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes used to clean stations (default: 1)")
+    args = parser.parse_args()
+
     # Reading in tempearure data
     # The data is spread across different sheets so they need to concatenated
-    temps = pd.read_excel("original data/Temps Data full.xls", sheet_name=None)
+    temps = read_excel_cached(
+        "original data/Temps Data full.xls", sheet_name=None)
     frames = [df for sheet, df in temps.items()]
     temps_raw = pd.concat(frames)
 
@@ -128,64 +299,14 @@ if __name__ == "__main__":
     temps_raw = temps_raw[["BEGIN_DATE_GMT",
                            "END_DATE_GMT", "NRG_STREAM_NAME", "TEMP_CELSIUS"]]
 
-    location_temps = []
-
-    for stream, census_div in STREAM_NAMES_DICT.items():
-        # Seperate the dataframe by location
-        location_temp_raw = temps_raw[temps_raw["NRG_STREAM_NAME"]
-                                      == stream]
-        # Consider the outlier in Lethbridge an NA
-        if stream == "EC - Lethbridge Temp":
-            lb_outlier_index = location_temp_raw[location_temp_raw["TEMP_CELSIUS"] > 40].index[0]
-            location_temp_raw.at[lb_outlier_index, "TEMP_CELSIUS"] = None
-        # Backfilling the temperature
-        location_temp_full = back_filling_temperatures_pipeline(
-            location_temp_raw)
-        # Filling in additional data
-        location_temp_final = fill_aux_data(
-            location_temp_full, stream, census_div)
-        location_temps.append(location_temp_final)
-
-    temps_final = pd.concat(location_temps)
-
-    # Generate column with values for the year
-    temps_final["Year"] = [
-        int(begin_time.year) for begin_time in temps_final["BEGIN_DATE_GMT"]]
-
     # Read in population data
     population_data = pd.read_csv("cleaned data/Population 2010-2046.csv")
 
-    # Weight temperature by population based on the given temperature column
-    # Example name of resulting columns: BFILL_weighted_pop_high
-    # => temperature data that has been back filled and weighted according to high population estimates
-
-    weighted_temp = temps_final.merge(
-        population_data, on=['Year', 'Region'], how='left')
-
-    # temp_col = "BFILL_TEMP_CELSIUS"
-    # for pop_col in ["pop_high", "pop_low", "pop_medium"]:
-    #     weighted_temp[temp_col.replace("_TEMP_CELSIUS", "") +
-    #                   "_weighted_" + pop_col] = weighted_temp[temp_col] * weighted_temp["pct_"+pop_col]
-    # weighted_temp.sort_values(["BEGIN_DATE_GMT", "Region"], inplace=True)
-
-    weighted_temp.rename(str.upper, axis='columns', inplace=True)
+    # Back fill each station and weight temperature by population
+    # Example name of resulting columns: PCT_POP_HIGH|CALGARY
+    # => percentage of the population living in Calgary's census division according to high population estimates
+    weighted_temp_wide = clean_all_stations(
+        temps_raw, population_data, workers=args.workers)
 
-    # Replacing names for convenience
-    weighted_temp.replace({'EC - Calgary Temp': 'CALGARY',
-                           "EC - Edmonton Temp": 'EDMONTON',
-                           "EC - Fort McMurray Temp": "FORTMM",
-                           "EC - Lethbridge Temp": "LETHBRG"}, inplace=True)
-    # Dropping unncessary column
-    weighted_temp_wide = weighted_temp.drop(
-        columns=["YEAR", "REGION"]).reindex()
-
-    # Pivot table to wide format
-    weighted_temp_wide = weighted_temp_wide.pivot_table(index='BEGIN_DATE_GMT', columns="NRG_STREAM_NAME",
-                                                        margins=False)
-    weighted_temp_wide.columns = weighted_temp_wide.columns.map(
-        '|'.join).str.strip('|')
-    weighted_temp_wide.drop(columns=["UNNAMED: 0|CALGARY",
-                                     "UNNAMED: 0|EDMONTON",
-                                     "UNNAMED: 0|FORTMM", "UNNAMED: 0|LETHBRG"], inplace=True)
     # Write results to csv
     weighted_temp_wide.to_csv("cleaned data/WF_Weighted Temp 2010-2021.csv")
@@ -0,0 +1,126 @@
+"""
+Aggregate tables (cubes) of the merged data read by the dashboards.
+
+The dashboards only plot aggregates of the hourly data: daily means against temperature, yearly averages of load,
+oil and pool prices, daily load per degree day. build_cubes computes them once from the hourly data:
+- daily: mean of every measure per day, sums of AIL_DEMAND and Degree_days, number of hours
+- monthly: mean of every measure per month, number of hours
+- yearly: mean of every measure per year, number of hours with a value of every measure
+- hour_year: mean, minimum and maximum of AIL_DEMAND and mean of Weighted_Avg_Temp per year and hour ending (HE)
+
+They are written as Parquet files to dashboard_cubes/ by the "cubes" stage of run_pipeline.py
+(or python dashboard_cubes.py). load_cubes reads them, and builds them again from the merged data when they are
+missing or older than msa_merged_data.csv, so the dashboards do not load the hourly data when the cubes exist.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from input_cache import HAS_PYARROW
+from msa_data import MERGED_CSV_PATH, DATE_COL, parquet_path, load_merged_data
+
+CUBE_DIR = "dashboard_cubes"
+CUBES = ["daily", "monthly", "yearly", "hour_year"]
+MEASURES = ["AIL_DEMAND", "POOL_PRICE", "WTI spot", "Weighted_Avg_Temp", "Degree_days"]
+"""
+Columns of the merged data aggregated in the cubes
+"""
+
+_cubes = {}
+
+
+def cube_path(name, cube_dir=CUBE_DIR):
+    """
+    Return the path of the Parquet file of a cube
+    """
+    return os.path.join(cube_dir, name + ".parquet")
+
+
+def build_cubes(data):
+    """
+    Aggregate the hourly merged data
+    ----------
+    Input
+        - data: merged data with a BEGIN_DATE_GMT column, HE and the MEASURES columns, see msa_data.load_merged_data
+    Returns
+        - Dictionary of cube name: Pandas DataFrame
+          daily and monthly are indexed by the first hour of the day/month (BEGIN_DATE_GMT), yearly by the year,
+          hour_year by (year, HE)
+    """
+    hourly = data.set_index(DATE_COL)[MEASURES].astype(float)
+    hourly["hours"] = 1
+
+    days = hourly.resample("D")
+    daily = days[MEASURES].mean()
+    daily["AIL_DEMAND_sum"] = days["AIL_DEMAND"].sum()
+    daily["Degree_days_sum"] = days["Degree_days"].sum()
+    daily["hours"] = days["hours"].sum()
+
+    months = hourly.resample("MS")
+    monthly = months[MEASURES].mean()
+    monthly["hours"] = months["hours"].sum()
+
+    years = hourly.groupby(hourly.index.year.rename("year"))
+    yearly = years[MEASURES].mean()
+    for col in MEASURES:
+        yearly[col + "_count"] = years[col].count()
+    yearly["hours"] = years["hours"].sum()
+
+    hour_years = hourly.assign(HE=data["HE"].to_numpy(dtype=float, na_value=np.nan)).groupby(
+        [hourly.index.year.rename("year"), "HE"])
+    hour_year = hour_years["AIL_DEMAND"].agg(["mean", "min", "max"]).add_prefix("AIL_DEMAND_")
+    hour_year["Weighted_Avg_Temp_mean"] = hour_years["Weighted_Avg_Temp"].mean()
+    hour_year["hours"] = hour_years["hours"].sum()
+    hour_year = hour_year.reset_index().astype({"HE": np.uint8}).set_index(["year", "HE"])
+
+    return {"daily": daily, "monthly": monthly, "yearly": yearly, "hour_year": hour_year}
+
+
+def write_cubes(cubes, cube_dir=CUBE_DIR):
+    """
+    Write the cubes returned by build_cubes as Parquet files
+    """
+    os.makedirs(cube_dir, exist_ok=True)
+    for name, cube in cubes.items():
+        path = cube_path(name, cube_dir)
+        cube.to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+
+def _cubes_are_fresh(cube_dir, data_path):
+    sources = [path for path in (data_path, parquet_path(data_path)) if os.path.exists(path)]
+    newest_source = max((os.path.getmtime(path) for path in sources), default=0)
+    return all(os.path.exists(cube_path(name, cube_dir)) and
+               os.path.getmtime(cube_path(name, cube_dir)) >= newest_source for name in CUBES)
+
+
+def load_cubes(cube_dir=CUBE_DIR, data_path=MERGED_CSV_PATH):
+    """
+    Return the cubes, read from their Parquet files when they are up to date with the merged data and otherwise
+    built from the merged data (and written, if pyarrow is installed)
+    ----------
+    Input
+        - cube_dir: directory of the Parquet files
+        - data_path: path of the merged data csv file
+    Returns
+        - Dictionary of cube name: Pandas DataFrame, see build_cubes
+    """
+    key = (cube_dir, data_path)
+    if key in _cubes:
+        return _cubes[key]
+    if HAS_PYARROW and _cubes_are_fresh(cube_dir, data_path):
+        cubes = {name: pd.read_parquet(cube_path(name, cube_dir)) for name in CUBES}
+    else:
+        cubes = build_cubes(load_merged_data(["HE"] + MEASURES, data_path))
+        if HAS_PYARROW:
+            write_cubes(cubes, cube_dir)
+    _cubes[key] = cubes
+    return cubes
+
+
+if __name__ == "__main__":
+    cubes = build_cubes(load_merged_data(["HE"] + MEASURES))
+    write_cubes(cubes)
+    for name, cube in cubes.items():
+        print("{}: {} rows, {:.0f} kB".format(name, len(cube), os.path.getsize(cube_path(name)) / 1024))
@@ -0,0 +1,128 @@
+"""
+Vectorized heating and cooling degree days.
+
+Degree days are counted per hour, i.e. a temperature 1 degree below the base temperature for one hour
+is 1/24 heating degree day. All functions accept a single base temperature or an array of base temperatures,
+in which case they return one column per base temperature so a whole grid (e.g. 10 to 22 Celsius) is computed at once.
+
+Running this file calibrates the base temperature against AIL_DEMAND in msa_merged_data.csv
+    python degree_days.py
+"""
+
+import numpy as np
+import pandas as pd
+
+BASE_TEMP_GRID = np.arange(10, 22.5, 0.5)
+
+
+def _broadcast(temps, base_temps):
+    """
+    Return temperatures and base temperatures as arrays that broadcast to shape (hours,) or (hours, bases)
+    """
+    temps = np.asarray(temps, dtype=float)
+    base_temps = np.asarray(base_temps, dtype=float)
+    if base_temps.ndim == 0:
+        return temps, base_temps
+    return temps[:, np.newaxis], base_temps[np.newaxis, :]
+
+
+def heating_degree_days(temps, base_temp=18, hours_per_day=24):
+    """
+    Calculate heating degree days per hour
+    ---------
+    Input:
+    - temps: Pandas Series, Numpy array.. with hourly temperatures
+    - base_temp: base temperature, or array of base temperatures
+    - hours_per_day: number of readings per day
+    Returns:
+    - Numpy array of shape (hours,) or (hours, base temperatures). Missing temperatures give NaN
+    """
+    temps, base_temp = _broadcast(temps, base_temp)
+    return np.maximum(base_temp - temps, 0) * (1 / hours_per_day)
+
+
+def cooling_degree_days(temps, base_temp=18, hours_per_day=24):
+    """
+    Calculate cooling degree days per hour
+    ---------
+    Input:
+    - temps: Pandas Series, Numpy array.. with hourly temperatures
+    - base_temp: base temperature, or array of base temperatures
+    - hours_per_day: number of readings per day
+    Returns:
+    - Numpy array of shape (hours,) or (hours, base temperatures). Missing temperatures give NaN
+    """
+    temps, base_temp = _broadcast(temps, base_temp)
+    return np.maximum(temps - base_temp, 0) * (1 / hours_per_day)
+
+
+def degree_days(temps, base_temp=18, hours_per_day=24):
+    """
+    Calculate heating and cooling degree days per hour
+    ---------
+    Input:
+    - temps: Pandas Series, Numpy array.. with hourly temperatures
+    - base_temp: base temperature, or array of base temperatures
+    - hours_per_day: number of readings per day
+    Returns:
+    - Tuple of Numpy arrays (heating, cooling), see heating_degree_days
+    """
+    return (heating_degree_days(temps, base_temp, hours_per_day),
+            cooling_degree_days(temps, base_temp, hours_per_day))
+
+
+def calibrate_base_temperature(temps, demand, base_temps=BASE_TEMP_GRID):
+    """
+    Fit demand = a + b * HDD + c * CDD by least squares for every base temperature at once
+    and report how well each base temperature explains demand.
+    ---------
+    Input:
+    - temps: Pandas Series, Numpy array.. with hourly temperatures
+    - demand: Pandas Series, Numpy array.. with hourly demand (e.g. AIL_DEMAND)
+    - base_temps: array of base temperatures to try
+    Returns:
+    - Pandas DataFrame with one row per base temperature and columns
+      base_temp, r_squared, intercept, hdd_coef, cdd_coef
+    """
+    temps = np.asarray(temps, dtype=float)
+    demand = np.asarray(demand, dtype=float)
+    base_temps = np.asarray(base_temps, dtype=float)
+    keep = ~(np.isnan(temps) | np.isnan(demand))
+    temps, demand = temps[keep], demand[keep]
+
+    # Centering demand keeps the sums of squares well conditioned
+    demand_mean = demand.mean()
+    centered = demand - demand_mean
+    hdd, cdd = degree_days(temps, base_temps)
+
+    # Normal equations of every base temperature from column sums, shape (bases, 3, 3)
+    n_obs = np.full(len(base_temps), float(len(temps)))
+    sum_h, sum_c = hdd.sum(axis=0), cdd.sum(axis=0)
+    sum_hh, sum_cc = (hdd * hdd).sum(axis=0), (cdd * cdd).sum(axis=0)
+    sum_hc = (hdd * cdd).sum(axis=0)
+    XtX = np.stack([np.stack([n_obs, sum_h, sum_c], axis=-1),
+                    np.stack([sum_h, sum_hh, sum_hc], axis=-1),
+                    np.stack([sum_c, sum_hc, sum_cc], axis=-1)], axis=1)
+    Xty = np.stack([np.full(len(base_temps), centered.sum()),
+                    centered @ hdd, centered @ cdd], axis=-1)
+    # A base temperature above or below every reading leaves a column of zeros, the pseudo inverse handles it
+    coefs = np.einsum("bij,bj->bi", np.linalg.pinv(XtX), Xty)
+
+    ss_tot = centered @ centered
+    ss_res = ss_tot - np.einsum("bi,bi->b", coefs, Xty)
+    coefs[:, 0] += demand_mean
+
+    return pd.DataFrame({"base_temp": base_temps,
+                         "r_squared": 1 - ss_res / ss_tot,
+                         "intercept": coefs[:, 0],
+                         "hdd_coef": coefs[:, 1],
+                         "cdd_coef": coefs[:, 2]})
+
+
+if __name__ == "__main__":
+    data = pd.read_csv("msa_merged_data.csv")
+    fit = calibrate_base_temperature(data["Avg_temp"], data["AIL_DEMAND"])
+    print(fit.to_string(index=False))
+    best = fit.loc[fit["r_squared"].idxmax()]
+    print("Best base temperature: {:.1f} Celsius (R squared = {:.4f})".format(
+        best["base_temp"], best["r_squared"]))
@@ -0,0 +1,169 @@
+"""
+Box plot and violin statistics of many groups at once, for the distribution figures of the dashboards.
+
+Plotly box and violin traces built from the raw values send every value to the browser, which then computes the
+statistics itself. distribution_stats computes them on the server for every group in one pass over the sorted values:
+- quartiles (linear interpolation, as np.percentile and plotly's default quartilemethod), mean and count
+- whiskers (fences): the lowest and highest values within 1.5 interquartile ranges of the box, as plotly draws them
+- outliers: the values beyond the whiskers, at most max_outliers per group (the furthest from the box)
+- density: a gaussian kernel density on kde_points points spanning each group, with Silverman's bandwidth as
+  plotly's violins. It is computed from a histogram of all values on BINS fixed bins, which is exact to a
+  fraction of the bandwidth
+The figures then only send a few numbers per group (see box_trace and violin_outline).
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+MAX_OUTLIERS = 20
+KDE_POINTS = 100
+BINS = 1024
+GROUP_CHUNK = 32
+"""
+Number of groups whose densities are evaluated at a time
+"""
+
+
+def _quantile(sorted_values, starts, counts, q):
+    position = starts + (counts - 1) * q
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def _densities(values, codes, n_groups, counts, bandwidth, lowest, highest, kde_points):
+    # Histogram of every group on the same bins, then the kernel sum over the bins for each point of each group
+    edges_low, edges_high = values.min(), values.max()
+    width = (edges_high - edges_low) / BINS or 1.0
+    bins = np.minimum(((values - edges_low) / width).astype(np.int64), BINS - 1)
+    histogram = np.bincount(codes * BINS + bins, minlength=n_groups * BINS).reshape(n_groups, BINS)
+    centers = edges_low + width * (np.arange(BINS) + 0.5)
+
+    steps = np.linspace(0, 1, kde_points)
+    grid = (lowest - 2 * bandwidth)[:, None] + ((highest - lowest) + 4 * bandwidth)[:, None] * steps
+    density = np.empty((n_groups, kde_points))
+    for start in range(0, n_groups, GROUP_CHUNK):
+        chunk = slice(start, start + GROUP_CHUNK)
+        scaled = (grid[chunk, :, None] - centers) / bandwidth[chunk, None, None]
+        density[chunk] = np.einsum("gpb,gb->gp", np.exp(-0.5 * scaled ** 2), histogram[chunk])
+    density /= (counts * bandwidth * np.sqrt(2 * np.pi))[:, None]
+    return grid, density
+
+
+def distribution_stats(data, value_col, by, max_outliers=MAX_OUTLIERS, kde_points=None):
+    """
+    Compute the box plot (and violin) statistics of a column for every group
+    ----------
+    Input
+        - data: Pandas DataFrame
+        - value_col: name of the column of values, missing and infinite values are ignored
+        - by: name or list of names of the columns defining the groups
+        - max_outliers: maximum number of outliers kept per group
+        - kde_points: number of points of the density of each group, None to skip the densities
+    Returns
+        - Dictionary with
+          stats: Pandas DataFrame indexed by the groups (sorted), with count, mean, q1, median, q3,
+                 lowerfence, upperfence, min, max and, with densities, bandwidth
+          outliers: Pandas Series of the kept outliers, indexed by their group
+          grid, density: Numpy arrays of shape (groups, kde_points), the values at which each density is
+                         evaluated and the density, only with kde_points
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    data = data[np.isfinite(data[value_col].to_numpy(dtype=float))]
+    grouped = data.groupby(by, sort=True)
+    codes = grouped.ngroup()
+    index = grouped.size().index
+    n_groups = len(index)
+
+    # Rows with a missing group have no group number (or -1, depending on the pandas version)
+    grouped_rows = (codes.notna() & (codes >= 0)).to_numpy()
+    values = data[value_col].to_numpy(dtype=float)[grouped_rows]
+    codes = codes.to_numpy()[grouped_rows].astype(np.int64)
+    order = np.lexsort((values, codes))
+    values, codes = values[order], codes[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    q1 = _quantile(values, starts, counts, 0.25)
+    median = _quantile(values, starts, counts, 0.5)
+    q3 = _quantile(values, starts, counts, 0.75)
+    mean = np.bincount(codes, weights=values, minlength=n_groups) / counts
+
+    # Values within 1.5 interquartile ranges of the box, the others are outliers
+    iqr = q3 - q1
+    low_limit, high_limit = (q1 - 1.5 * iqr)[codes], (q3 + 1.5 * iqr)[codes]
+    inside = (values >= low_limit) & (values <= high_limit)
+    lowerfence = np.minimum.reduceat(np.where(inside, values, np.inf), starts)
+    upperfence = np.maximum.reduceat(np.where(inside, values, -np.inf), starts)
+
+    outside = np.flatnonzero(~inside)
+    distance = np.maximum(low_limit[outside] - values[outside], values[outside] - high_limit[outside])
+    outside = outside[np.lexsort((-distance, codes[outside]))]
+    outlier_codes = codes[outside]
+    rank = np.arange(len(outside)) - np.searchsorted(outlier_codes, outlier_codes, side="left")
+    outside = np.sort(outside[rank < max_outliers])
+
+    stats = pd.DataFrame({"count": counts, "mean": mean, "q1": q1, "median": median, "q3": q3,
+                          "lowerfence": lowerfence, "upperfence": upperfence,
+                          "min": values[starts], "max": values[starts + counts - 1]}, index=index)
+    result = {"stats": stats, "outliers": pd.Series(values[outside], index=index[codes[outside]])}
+
+    if kde_points:
+        # Silverman's rule of thumb, as plotly.js
+        squares = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=n_groups)
+        std = np.sqrt(squares / np.maximum(counts - 1, 1))
+        spread = np.minimum(std, iqr / 1.349)
+        spread = np.where(spread > 0, spread, np.where(std > 0, std, 1.0))
+        bandwidth = 1.059 * spread * counts ** -0.2
+        stats["bandwidth"] = bandwidth
+        result["grid"], result["density"] = _densities(values, codes, n_groups, counts, bandwidth,
+                                                       stats["min"].to_numpy(), stats["max"].to_numpy(),
+                                                       kde_points)
+    return result
+
+
+def box_trace(stats, position, orientation="v", **kwargs):
+    """
+    Return a box trace drawn from precomputed statistics
+    ----------
+    Input
+        - stats: row of the stats of distribution_stats
+        - position: position of the box on the axis of the groups
+        - orientation: "v" for vertical boxes, "h" for horizontal ones
+        - kwargs: other attributes of the trace (name, marker_color, ...)
+    Returns
+        - go.Box
+    """
+    axis = "x" if orientation == "v" else "y"
+    return go.Box(**{axis: [position]}, q1=[stats["q1"]], median=[stats["median"]], q3=[stats["q3"]],
+                  lowerfence=[stats["lowerfence"]], upperfence=[stats["upperfence"]], mean=[stats["mean"]],
+                  orientation=orientation, **kwargs)
+
+
+def outlier_trace(outliers, position, orientation="v", **kwargs):
+    """
+    Return the markers of the outliers of a group, see box_trace
+    """
+    outliers = np.asarray(outliers, dtype=float)
+    positions = [position] * len(outliers)
+    x, y = (positions, outliers) if orientation == "v" else (outliers, positions)
+    return go.Scatter(x=x, y=y, mode="markers", marker_size=4, showlegend=False, hoverinfo="x+y", **kwargs)
+
+
+def violin_outline(grid, density, position, half_width=0.4, **kwargs):
+    """
+    Return the outline of a vertical violin drawn from a precomputed density
+    ----------
+    Input
+        - grid, density: row of the grid and density of distribution_stats
+        - position: x of the middle of the violin
+        - half_width: half of the widest part of the violin, in units of x
+        - kwargs: other attributes of the trace (name, line_color, ...)
+    Returns
+        - go.Scatter filled to itself
+    """
+    offset = half_width * density / density.max()
+    return go.Scatter(x=np.concatenate([position - offset, (position + offset)[::-1]]),
+                      y=np.concatenate([grid, grid[::-1]]),
+                      mode="lines", fill="toself", hoverinfo="skip", **kwargs)
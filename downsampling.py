@@ -0,0 +1,163 @@
+"""
+Shape preserving downsampling of time series traces for the dashboards.
+
+A trace of hundreds of thousands of points is reduced to at most MAX_POINTS points before it is sent to the browser:
+- minmax: the series is cut into buckets of consecutive points and the lowest and highest point of every bucket
+  are kept, so every peak and trough stays visible
+- lttb: Largest Triangle Three Buckets, keeps in every bucket the point forming the largest triangle with the
+  point kept in the previous bucket and the average of the next bucket, closer to the look of the full line
+
+The dashboards downsample only the points of the current zoom range: zoom_range reads the range from the
+relayoutData of a dcc.Graph, so each zoom sends a new set of at most MAX_POINTS points per trace.
+"""
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 2000
+"""
+Maximum number of points of a trace sent to the browser
+"""
+
+
+def _numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def _ends(n, n_out):
+    # Too few points for any bucket: the first and last point, or only the first
+    return np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+
+
+def minmax_indices(y, n_out):
+    """
+    Return the sorted positions of the lowest and highest value of (n_out - 2) // 2 buckets of consecutive points,
+    and of the first and last point (only the first and last point when n_out < 4).
+    Missing values are only kept when a bucket has no other value
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 4:
+        return _ends(n, n_out)
+    # Buckets of equal size are the rows of a (buckets, size) matrix, the last one padded
+    size = -(-n // max(1, (n_out - 2) // 2))
+    rows = -(-n // size)
+    missing = np.isnan(y)
+    padded = np.full(rows * size, np.inf)
+    padded[:n] = np.where(missing, np.inf, y)
+    lowest = padded.reshape(rows, size).argmin(axis=1) + np.arange(rows) * size
+    padded[:n] = np.where(missing, -np.inf, y)
+    padded[n:] = -np.inf
+    highest = padded.reshape(rows, size).argmax(axis=1) + np.arange(rows) * size
+    return np.unique(np.concatenate([[0, n - 1], lowest, np.minimum(highest, n - 1)]))
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Return the sorted positions of the points kept by Largest Triangle Three Buckets: the first and last point
+    and one point of each of n_out - 2 buckets (only the first and last point when n_out < 3)
+    """
+    x, y = _numeric(x), np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 3:
+        return _ends(n, n_out)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    # Average point of every bucket (of its values that are not missing), the last "bucket" being the last point
+    inner, valid = y[1:n - 1], ~np.isnan(y[1:n - 1])
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(np.where(valid, inner, 0), edges[:-1] - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_y = sums_y / np.add.reduceat(valid, edges[:-1] - 1)
+    next_x = np.r_[(sums_x / np.diff(edges))[1:], x[-1]]
+    next_y = np.r_[mean_y[1:], y[-1]]
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs((x[previous] - next_x[i]) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y[i] - y[previous]))
+        previous = start + (int(np.nanargmax(areas)) if not np.isnan(areas).all() else 0)
+        kept[i + 1] = previous
+    return kept
+
+
+def downsample(x, y, max_points=MAX_POINTS, method="minmax"):
+    """
+    Reduce a trace to at most max_points points
+    ----------
+    Input
+        - x, y: values of the trace, x sorted (numbers or timestamps)
+        - max_points: maximum number of points returned
+        - method: "minmax" or "lttb"
+    Returns
+        - Tuple (x, y) of Numpy arrays
+    """
+    x, y = np.asarray(x), np.asarray(y, dtype=float)
+    if method == "minmax":
+        kept = minmax_indices(y, max_points)
+    elif method == "lttb":
+        kept = lttb_indices(x, y, max_points)
+    else:
+        raise ValueError("Unknown downsampling method {}".format(method))
+    return x[kept], y[kept]
+
+
+def zoom_range(relayout_data, axis="xaxis"):
+    """
+    Return the range of an axis after a zoom, None when the axis shows its full range
+    ----------
+    Input
+        - relayout_data: relayoutData property of a dcc.Graph
+        - axis: name of the axis in the figure layout
+    Returns
+        - Tuple (start, end) of the axis values as strings or numbers, or None
+    """
+    if not relayout_data or relayout_data.get(axis + ".autorange"):
+        return None
+    if axis + ".range[0]" in relayout_data and axis + ".range[1]" in relayout_data:
+        return relayout_data[axis + ".range[0]"], relayout_data[axis + ".range[1]"]
+    if axis + ".range" in relayout_data:
+        return tuple(relayout_data[axis + ".range"])
+    return None
+
+
+def visible_slice(index, x_range):
+    """
+    Return the slice of the sorted index shown in x_range, with one more point on each side so lines reach
+    the edges of the plot. The whole index when x_range is None
+    """
+    if x_range is None:
+        return slice(None)
+    values = np.asarray(index)
+    start, end = x_range
+    if np.issubdtype(values.dtype, np.datetime64):
+        start, end = pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()
+    first = max(int(np.searchsorted(values, start, side="left")) - 1, 0)
+    last = min(int(np.searchsorted(values, end, side="right")) + 1, len(values))
+    return slice(first, last)
+
+
+def downsampled_traces(index, columns, x_range=None, max_points=MAX_POINTS, method="minmax"):
+    """
+    Downsample the columns of a data frame (or dictionary of arrays) over the points of index shown in x_range
+    ----------
+    Input
+        - index: sorted x values shared by the columns
+        - columns: dictionary of name: y values
+        - x_range: (start, end) of the zoom, see zoom_range, None for the whole index
+        - max_points, method: see downsample
+    Returns
+        - Dictionary of name: (x, y) Numpy arrays
+    """
+    shown = visible_slice(index, x_range)
+    x = np.asarray(index)[shown]
+    return {name: downsample(x, np.asarray(values, dtype=float)[shown], max_points, method)
+            for name, values in columns.items()}
@@ -0,0 +1,186 @@
+"""
+Declarative lag, lead, rolling window, exponentially weighted and degree day features.
+
+Models declare their features as a list of dictionaries, built with the helpers below, e.g.
+    FEATURES = [lag("Calgary_temp", 1), rolling_mean("Calgary_temp", 24), ewm(heating_degree_days("Calgary_temp"), 24)]
+and add_features computes all of them at once with array operations:
+- lags and leads are slices of the column
+- rolling means of every window of a column come from one cumulative sum of that column
+- rolling maxima of every window of a column come from one table of maxima over power of two windows
+- features may use other features as their column (e.g. the exponentially weighted mean of degree days),
+  and a feature declared twice is only computed once
+
+Rows are expected to be consecutive hours, as in the merged data. Windows are trailing (they end at the current
+hour) and are missing when they contain a missing value or start before the first row, as with pandas' rolling.
+"""
+
+import numpy as np
+import pandas as pd
+
+from degree_days import heating_degree_days as _heating, cooling_degree_days as _cooling
+
+
+def _feature(kind, column, name, **params):
+    if isinstance(column, dict):
+        # Feature of another feature, which is computed first
+        return dict(kind=kind, column=column["name"], name=name, source=column, **params)
+    return dict(kind=kind, column=column, name=name, **params)
+
+
+def _column_name(column):
+    return column["name"] if isinstance(column, dict) else column
+
+
+def lag(column, hours=1, name=None):
+    """
+    Value of column hours before, named "<column>.<hours>_hour_lag" by default
+    """
+    return _feature("lag", column, name or "{}.{}_hour_lag".format(_column_name(column), hours), hours=hours)
+
+
+def lead(column, hours=1, name=None):
+    """
+    Value of column hours after, named "<column>.<hours>_hour_lead" by default
+    """
+    return _feature("lag", column, name or "{}.{}_hour_lead".format(_column_name(column), hours), hours=-hours)
+
+
+def rolling_mean(column, window, name=None):
+    """
+    Mean of column over the last window hours, named "<column>.<window>_hour_mean" by default
+    """
+    return _feature("mean", column, name or "{}.{}_hour_mean".format(_column_name(column), window), window=window)
+
+
+def rolling_max(column, window, name=None):
+    """
+    Maximum of column over the last window hours, named "<column>.<window>_hour_max" by default
+    """
+    return _feature("max", column, name or "{}.{}_hour_max".format(_column_name(column), window), window=window)
+
+
+def ewm(column, halflife, name=None):
+    """
+    Exponentially weighted mean of column with a half-life of halflife hours, named "<column>.ewm_<halflife>h"
+    by default. Same as pandas' Series.ewm(halflife=halflife).mean()
+    """
+    return _feature("ewm", column, name or "{}.ewm_{}h".format(_column_name(column), halflife), halflife=halflife)
+
+
+def heating_degree_days(column, base_temp=18, name=None):
+    """
+    Heating degree days per hour of the temperature column, named "<column>.HDD_<base_temp>" by default
+    """
+    return _feature("hdd", column, name or "{}.HDD_{}".format(_column_name(column), base_temp), base_temp=base_temp)
+
+
+def cooling_degree_days(column, base_temp=18, name=None):
+    """
+    Cooling degree days per hour of the temperature column, named "<column>.CDD_<base_temp>" by default
+    """
+    return _feature("cdd", column, name or "{}.CDD_{}".format(_column_name(column), base_temp), base_temp=base_temp)
+
+
+def _spec(feature):
+    return tuple(sorted((key, value) for key, value in feature.items() if key not in ("name", "source")))
+
+
+def _shift(values, hours):
+    shifted = np.full(len(values), np.nan)
+    if hours >= 0:
+        shifted[hours:] = values[:len(values) - hours]
+    else:
+        shifted[:hours] = values[-hours:]
+    return shifted
+
+
+def prefix_sums(values):
+    """
+    Return (cumulative sum with missing values as 0, cumulative count of missing values) of values,
+    both starting at 0. The prefix sums of rows first to last are the slices [first:last + 1] of both arrays
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    return (np.concatenate([[0], np.cumsum(np.where(missing, 0, values))]),
+            np.concatenate([[0], np.cumsum(missing)]))
+
+
+def prefix_rolling_mean(prefix, window):
+    """
+    Return the trailing rolling means over window rows of the values whose prefix sums are prefix
+    (see prefix_sums), missing when the window contains a missing value or starts before the first row
+    """
+    sums, missing = prefix
+    means = np.full(len(sums) - 1, np.nan)
+    if window <= len(means):
+        means[window - 1:] = (sums[window:] - sums[:-window]) / window
+        means[window - 1:][missing[window:] - missing[:-window] > 0] = np.nan
+    return means
+
+
+def _rolling_max(levels, values, window):
+    # levels[k][i] is the maximum of values[i:i + 2 ** k], the maximum over a window is the maximum of
+    # the two (overlapping) power of two windows covering it
+    k = int(np.log2(window))
+    while len(levels) <= k:
+        previous, step = levels[-1], 2 ** (len(levels) - 1)
+        levels.append(np.maximum(previous[:-step], previous[step:]))
+    maxima = np.full(len(values), np.nan)
+    if window <= len(values):
+        level = levels[k]
+        maxima[window - 1:] = np.maximum(level[:len(values) - window + 1], level[window - 2 ** k:])
+    return maxima
+
+
+def add_features(data, features):
+    """
+    Compute features and add them as columns. Alter data frame in place
+    ----------
+    Input
+        - data: Pandas DataFrame whose rows are consecutive hours
+        - features: list of features from lag, lead, rolling_mean, rolling_max, ewm, heating_degree_days and
+          cooling_degree_days. Their columns are columns of data or other features
+    Returns
+        - data, with one more column per feature
+    """
+    computed = {}
+    prefixes = {}
+    max_levels = {}
+    columns = {}
+
+    def column_values(name):
+        if name not in columns:
+            columns[name] = data[name].to_numpy(dtype=float)
+        return columns[name]
+
+    def compute(feature):
+        spec = _spec(feature)
+        if spec in computed:
+            return computed[spec]
+        if "source" in feature and feature["column"] not in columns:
+            columns[feature["column"]] = compute(feature["source"])
+        column, kind = feature["column"], feature["kind"]
+        values = column_values(column)
+
+        if kind == "lag":
+            result = _shift(values, feature["hours"])
+        elif kind == "mean":
+            if column not in prefixes:
+                prefixes[column] = prefix_sums(values)
+            result = prefix_rolling_mean(prefixes[column], feature["window"])
+        elif kind == "max":
+            result = _rolling_max(max_levels.setdefault(column, [values]), values, feature["window"])
+        elif kind == "ewm":
+            result = pd.Series(values).ewm(halflife=feature["halflife"]).mean().to_numpy()
+        elif kind == "hdd":
+            result = _heating(values, feature["base_temp"])
+        elif kind == "cdd":
+            result = _cooling(values, feature["base_temp"])
+        else:
+            raise ValueError("Unknown feature kind {}".format(kind))
+        computed[spec] = result
+        return result
+
+    for feature in features:
+        data[feature["name"]] = compute(feature)
+    return data
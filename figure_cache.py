@@ -0,0 +1,106 @@
+"""
+Disk cache of the dashboard figures.
+
+Building some figures (e.g. the distributions of the hourly AIL) takes longer than starting the dashboard.
+cached_figure stores the JSON of a figure in cache/figures under a key made of:
+- the content hash of the data file the figure is made from (see input_cache.source_key)
+- the function building the figure (its name, and the source code of its module and of the modules of the
+  repository it uses, e.g. distribution_stats or downsampling) and its parameters
+- FIGURE_VERSION
+- the version of plotly
+so a restart with the same data and code reads the figure instead of building it, and any change builds it again.
+Figures read once are also kept in memory. Delete cache/figures to clear it.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import plotly
+
+from input_cache import file_digest, source_key
+
+CACHE_DIR = os.path.join("cache", "figures")
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIGURE_VERSION = 1
+"""
+Part of every key, increase it to build all figures again after a change the keys do not see
+(e.g. in a module only used indirectly by the builder)
+"""
+
+_figures = {}
+
+
+def _code_digest(builder):
+    # Source files of the builder's module and of the modules of the repository it refers to, so that a change of
+    # a helper (e.g. distribution_stats.box_trace) also builds the figure again
+    modules = [inspect.getmodule(builder)] + [inspect.getmodule(value) for value in builder.__globals__.values()]
+    paths = {os.path.abspath(module.__file__) for module in modules if getattr(module, "__file__", None)}
+    digest = hashlib.sha256(builder.__qualname__.encode())
+    for path in sorted(paths):
+        if path.startswith(ROOT + os.sep) and path.endswith(".py"):
+            digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def data_key(data_path, cache_dir=CACHE_DIR):
+    """
+    Return the content hash of the data file the figures are made from, to be computed once per app
+    (see input_cache.source_key)
+    """
+    return source_key(data_path, cache_dir)["sha256"]
+
+
+def figure_key(builder, data_hash, params=None):
+    """
+    Return the key of a figure in the cache
+    ----------
+    Input
+        - builder: function building the figure
+        - data_hash: content hash of the data file the figure is made from, see data_key
+        - params: dictionary of keyword arguments of builder
+    Returns
+        - String
+    """
+    key = {"figure": "{}.{}".format(builder.__module__, builder.__qualname__),
+           "code": _code_digest(builder),
+           "params": params or {},
+           "data": data_hash,
+           "plotly": plotly.__version__,
+           "version": FIGURE_VERSION}
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+
+def cached_figure(builder, load_args, data_hash, params=None, cache_dir=CACHE_DIR):
+    """
+    Return the JSON of a figure, read from the cache or built (and written to the cache) on the first call
+    ----------
+    Input
+        - builder: function building the figure
+        - load_args: function returning the tuple of positional arguments of builder, only called when the figure
+          is not in the cache
+        - data_hash: content hash of the data file the arguments are made from, see data_key
+        - params: dictionary of keyword arguments of builder
+        - cache_dir: directory of the cache
+    Returns
+        - Dictionary (the figure as plotly JSON), can be used as the figure of a dcc.Graph
+    """
+    key = figure_key(builder, data_hash, params)
+    if key in _figures:
+        return _figures[key]
+    path = os.path.join(cache_dir, key + ".json")
+    if os.path.exists(path):
+        with open(path) as f:
+            figure = json.load(f)
+    else:
+        text = builder(*load_args(), **(params or {})).to_json()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file of its own first so that an interrupted write is never read back and
+        # sessions building the same figure at the same time do not write to the same file
+        with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", delete=False) as f:
+            f.write(text)
+        os.replace(f.name, path)
+        figure = json.loads(text)
+    _figures[key] = figure
+    return figure
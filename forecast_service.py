@@ -0,0 +1,319 @@
+"""
+Local HTTP service returning AIL forecasts from preloaded Prophet models.
+
+The models are loaded from the model registry once at startup. Clients post the regressor rows of the hours they
+want forecasts for. Requests arriving at the same time are coalesced into micro-batches: a worker thread per model
+waits up to --max-wait-ms for other requests (up to --max-batch-requests of them) and forecasts all their rows with
+a single prophet_predict.predict call, which costs much less than one call per request.
+
+Endpoints:
+    POST /forecast  {"model": "pretrained", "rows": [{"ds": "2021-01-01 00:00:00", "<regressor>": value, ...}, ...],
+                     "intervals": true}
+                    rows can also be given by column: {"ds": [...], "<regressor>": [...]}. Returns
+                    {"model": ..., "forecast": {"ds": [...], "yhat": [...], "yhat_lower": [...], "yhat_upper": [...]}}
+    GET /metrics    number of requests and batches, batch sizes and p50/p99 latencies (milliseconds)
+    GET /health     loaded models and their regressors
+
+Run with:
+    python forecast_service.py --models pretrained --port 8050
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+from model_registry import load_model, load_pretrained_model
+from prophet_predict import predict
+
+METRICS_WINDOW = 10000
+"""
+Number of most recent requests and batches the latency and batch size percentiles are computed on
+"""
+
+
+def load_models(names):
+    """
+    Load models from the model registry
+    ----------
+    Input
+        - names: keys or aliases of registered models. "pretrained" imports pickled_model if needed
+    Returns
+        - Dictionary of name: fitted model of the Prophet class
+    """
+    models = {}
+    for name in names:
+        model = load_pretrained_model() if name == "pretrained" else load_model(name)
+        if model is None:
+            raise KeyError("No model registered under {}, see python model_registry.py".format(name))
+        models[name] = model
+    return models
+
+
+def rows_to_frame(rows, regressors):
+    """
+    Return the dataframe of the rows of a request
+    ----------
+    Input
+        - rows: list of dictionaries (one per hour) or dictionary of lists (one per column)
+        - regressors: names of the regressors of the model
+    Returns
+        - Pandas DataFrame with ds and the regressors. Raises ValueError if the rows are not valid
+    """
+    frame = pd.DataFrame(rows)
+    missing = [col for col in ["ds"] + list(regressors) if col not in frame.columns]
+    if len(frame) == 0 or missing:
+        raise ValueError("rows must not be empty and need the columns: {}".format(", ".join(missing or ["ds"])))
+    frame = frame[["ds"] + list(regressors)]
+    frame["ds"] = pd.to_datetime(frame["ds"])
+    frame[list(regressors)] = frame[list(regressors)].astype(float)
+    if frame.isnull().values.any():
+        raise ValueError("rows have missing values")
+    return frame
+
+
+def predict_frames(model, frames, samples=None, seed=0, intervals=True):
+    """
+    Forecast the rows of several requests with one prediction
+    ----------
+    Input
+        - model: fitted model of the Prophet class
+        - frames: list of dataframes returned by rows_to_frame
+        - samples, seed, intervals: see prophet_predict.predict
+    Returns
+        - List of Pandas DataFrames with ds, yhat (and yhat_lower, yhat_upper), in the order of the rows of each frame
+    """
+    batch = pd.concat(frames, ignore_index=True)
+    forecast = predict(model, batch, samples, seed, intervals)
+    # Prophet returns the rows sorted by ds. Sorting the same column the same way gives the row of the batch each
+    # forecast belongs to, also for hours requested several times with different regressors
+    order = batch.sort_values("ds").index.to_numpy()
+    columns = ["ds", "yhat"] + (["yhat_lower", "yhat_upper"] if "yhat_lower" in forecast.columns else [])
+    values = forecast[columns].iloc[np.argsort(order)].reset_index(drop=True)
+
+    bounds = np.cumsum([0] + [len(frame) for frame in frames])
+    return [values.iloc[start:end].reset_index(drop=True) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def new_metrics():
+    """
+    Return an empty dictionary of service metrics, see record_request and metrics_summary
+    """
+    return {"lock": threading.Lock(), "started": time.time(), "requests": 0, "errors": 0, "batches": 0,
+            "latencies": deque(maxlen=METRICS_WINDOW), "batch_requests": deque(maxlen=METRICS_WINDOW),
+            "batch_rows": deque(maxlen=METRICS_WINDOW)}
+
+
+def record_request(metrics, seconds, error=False):
+    with metrics["lock"]:
+        metrics["requests"] += 1
+        metrics["errors"] += error
+        metrics["latencies"].append(seconds)
+
+
+def record_batch(metrics, requests, rows):
+    with metrics["lock"]:
+        metrics["batches"] += 1
+        metrics["batch_requests"].append(requests)
+        metrics["batch_rows"].append(rows)
+
+
+def metrics_summary(metrics):
+    """
+    Return a JSON serializable summary of the metrics: counts since startup, and latency (milliseconds) and
+    batch size percentiles over the last METRICS_WINDOW requests and batches
+    """
+    with metrics["lock"]:
+        latencies = np.array(metrics["latencies"]) * 1000
+        batch_requests = np.array(metrics["batch_requests"])
+        batch_rows = np.array(metrics["batch_rows"])
+        summary = {"uptime_seconds": time.time() - metrics["started"], "requests": metrics["requests"],
+                   "errors": metrics["errors"], "batches": metrics["batches"]}
+
+    def percentiles(values):
+        if len(values) == 0:
+            return {"p50": None, "p99": None, "mean": None}
+        p50, p99 = np.percentile(values, [50, 99])
+        return {"p50": float(p50), "p99": float(p99), "mean": float(values.mean())}
+
+    summary["latency_ms"] = percentiles(latencies)
+    summary["batch_requests"] = percentiles(batch_requests)
+    summary["batch_rows"] = percentiles(batch_rows)
+    return summary
+
+
+def start_batcher(model, metrics, max_requests=64, max_wait=0.005, samples=None, seed=0):
+    """
+    Start the worker thread forecasting the requests of a model in micro-batches
+    ----------
+    Input
+        - model: fitted model of the Prophet class
+        - metrics: dictionary returned by new_metrics
+        - max_requests: maximum number of requests per batch, 1 forecasts every request on its own
+        - max_wait: seconds the first request of a batch waits for other requests
+        - samples, seed: see prophet_predict.predict
+    Returns
+        - Queue to put (dataframe, intervals, Future) items in, see submit
+    """
+    requests = queue.Queue()
+
+    def run():
+        while True:
+            items = [requests.get()]
+            deadline = time.perf_counter() + max_wait
+            while len(items) < max_requests:
+                try:
+                    items.append(requests.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except queue.Empty:
+                    break
+
+            # Requests with and without intervals are forecasted separately
+            for intervals in (True, False):
+                group = [item for item in items if item[1] == intervals]
+                if not group:
+                    continue
+                try:
+                    results = predict_frames(model, [frame for frame, _, _ in group], samples, seed, intervals)
+                except Exception as error:
+                    for _, _, future in group:
+                        future.set_exception(error)
+                    continue
+                record_batch(metrics, len(group), sum(len(result) for result in results))
+                for (_, _, future), result in zip(group, results):
+                    future.set_result(result)
+
+    threading.Thread(target=run, daemon=True).start()
+    return requests
+
+
+def submit(batcher, frame, intervals=True):
+    """
+    Queue the rows of a request and wait for their forecast
+    ----------
+    Input
+        - batcher: queue returned by start_batcher
+        - frame: dataframe returned by rows_to_frame
+        - intervals: if True, the forecast has yhat_lower and yhat_upper
+    Returns
+        - Pandas DataFrame with ds, yhat (and yhat_lower, yhat_upper)
+    """
+    future = Future()
+    batcher.put((frame, intervals, future))
+    return future.result()
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests of the service, see make_server
+    """
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.send_json(200, metrics_summary(self.server.metrics))
+        elif self.path == "/health":
+            self.send_json(200, {name: {"regressors": list(model.extra_regressors)}
+                                 for name, model in self.server.models.items()})
+        else:
+            self.send_json(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        if self.path != "/forecast":
+            self.send_json(404, {"error": "unknown path " + self.path})
+            return
+        status, error = 200, None
+        # Only invalid requests are client errors (400), failures of the forecast itself are server errors (500)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("the request must be a JSON object")
+            name = request.get("model", self.server.default_model)
+            if not isinstance(name, str):
+                raise ValueError("model must be a string")
+            if name not in self.server.models:
+                status, error = 404, "unknown model {}".format(name)
+            else:
+                frame = rows_to_frame(request.get("rows", []), list(self.server.models[name].extra_regressors))
+        except ValueError as exception:
+            status, error = 400, str(exception)
+        except Exception as exception:
+            status, error = 500, "{}: {}".format(type(exception).__name__, exception)
+        if error is None:
+            try:
+                forecast = submit(self.server.batchers[name], frame, bool(request.get("intervals", True)))
+            except Exception as exception:
+                status, error = 500, "{}: {}".format(type(exception).__name__, exception)
+        if error is not None:
+            self.send_json(status, {"error": error})
+            record_request(self.server.metrics, time.perf_counter() - start, error=True)
+            return
+
+        forecast["ds"] = forecast["ds"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        self.send_json(200, {"model": name, "forecast": forecast.to_dict(orient="list")})
+        record_request(self.server.metrics, time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(models, host="127.0.0.1", port=8050, max_requests=64, max_wait=0.005, samples=None, seed=0,
+                verbose=False):
+    """
+    Create the HTTP server of the service and start one batcher per model
+    ----------
+    Input
+        - models: dictionary of name: fitted model of the Prophet class, see load_models. The first one is used
+          when a request does not name a model
+        - host, port: address of the server, port 0 picks a free port
+        - max_requests, max_wait, samples, seed: see start_batcher
+        - verbose: if True, log every request
+    Returns
+        - ThreadingHTTPServer, call serve_forever to start serving
+    """
+    server = ThreadingHTTPServer((host, port), ForecastHandler)
+    server.daemon_threads = True
+    server.models = models
+    server.default_model = next(iter(models))
+    server.metrics = new_metrics()
+    server.batchers = {name: start_batcher(model, server.metrics, max_requests, max_wait, samples, seed)
+                       for name, model in models.items()}
+    server.verbose = verbose
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", nargs="+", default=["pretrained"], help="keys or aliases of registered models")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--max-batch-requests", type=int, default=64,
+                        help="maximum number of requests per batch, 1 to disable batching")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="time a request waits for others")
+    parser.add_argument("--samples", type=int, default=None, help="samples of the uncertainty intervals")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the uncertainty intervals")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    server = make_server(load_models(args.models), args.host, args.port, args.max_batch_requests,
+                         args.max_wait_ms / 1000, args.samples, args.seed, args.verbose)
+    print("Forecast service running on http://{}:{}/ with models {}".format(
+        args.host, server.server_address[1], ", ".join(server.models)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,195 @@
+"""
+Shared loading layer for the Excel workbooks in **original data**.
+
+Parsing .xls files with pd.read_excel is the slowest part of rebuilding the cleaned data.
+read_excel_cached parses each workbook/sheet once and stores the result as a typed Parquet file under cache/inputs.
+Later calls with the same source file (same path, modification time and content hash) and the same read options
+load the Parquet file instead.
+
+If pyarrow is not installed, read_excel_cached falls back to reading the workbook directly.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CACHE_DIR = os.path.join("cache", "inputs")
+MANIFEST_NAME = "manifest.json"
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Return the sha256 hash of a file's content
+    ----------
+    Input
+        - path: path to the file
+        - chunk_size: number of bytes read at a time
+    Returns
+        - String
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on a lock file (created if needed) against the other threads of this process
+    and other processes, e.g. around the read, update and replace of a shared index file
+    """
+    with _thread_locks_lock:
+        thread_lock = _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+    with thread_lock, open(path, "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _save_manifest(cache_dir, entries):
+    """
+    Add entries to the manifest. The manifest is read again under a lock, so entries added by other processes
+    in the meantime are kept, and written to a temporary file of its own before it replaces the manifest
+    """
+    # Stages of run_pipeline.py and the threads of the dashboards update the same manifest
+    with file_lock(os.path.join(cache_dir, MANIFEST_NAME + ".lock")):
+        manifest = _load_manifest(cache_dir)
+        manifest.update(entries)
+        with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", delete=False) as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f.name, os.path.join(cache_dir, MANIFEST_NAME))
+
+
+def source_key(path, cache_dir=CACHE_DIR):
+    """
+    Return a dictionary identifying the current version of a source file: its path, modification time and content hash.
+    The hash is only recomputed when the modification time or size of the file changed since it was last seen.
+    ----------
+    Input
+        - path: path to the source file
+        - cache_dir: directory of the cache
+    Returns
+        - Dictionary
+    """
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    manifest = _load_manifest(cache_dir)
+    entry = manifest.get(abs_path)
+    if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+        entry = {"mtime_ns": stat.st_mtime_ns,
+                 "size": stat.st_size,
+                 "sha256": file_digest(abs_path)}
+        os.makedirs(cache_dir, exist_ok=True)
+        _save_manifest(cache_dir, {abs_path: entry})
+    return {"path": abs_path, "mtime_ns": entry["mtime_ns"], "sha256": entry["sha256"]}
+
+
+def _entry_dir(path, sheet_name, read_kwargs, cache_dir):
+    key = dict(source_key(path, cache_dir), sheet_name=sheet_name, read_kwargs=read_kwargs)
+    key_hash = hashlib.sha256(json.dumps(
+        key, sort_keys=True, default=str).encode()).hexdigest()[:24]
+    return os.path.join(cache_dir, key_hash)
+
+
+def _write_sheet(df, base_path):
+    """
+    Write one sheet as Parquet. Sheets that Arrow cannot type (e.g. columns mixing numbers and text)
+    are pickled instead so the cache still works for them.
+    """
+    try:
+        df.to_parquet(base_path + ".parquet")
+        return "parquet"
+    except (ValueError, TypeError, pyarrow.lib.ArrowException):
+        if os.path.exists(base_path + ".parquet"):
+            os.remove(base_path + ".parquet")
+        df.to_pickle(base_path + ".pkl")
+        return "pickle"
+
+
+def _read_sheet(base_path, file_format):
+    if file_format == "parquet":
+        return pd.read_parquet(base_path + ".parquet")
+    return pd.read_pickle(base_path + ".pkl")
+
+
+def read_excel_cached(path, sheet_name=0, cache_dir=CACHE_DIR, **kwargs):
+    """
+    Drop-in replacement for pd.read_excel that caches parsed sheets as Parquet files.
+    ----------
+    Input
+        - path: path to the Excel workbook
+        - sheet_name: name or position of the sheet, or None for all sheets (as in pd.read_excel)
+        - cache_dir: directory of the cache
+        - kwargs: additional arguments passed to pd.read_excel, they are part of the cache key
+    Returns
+        - Pandas DataFrame, or dictionary of sheet name: DataFrame when sheet_name is None
+    """
+    if not HAS_PYARROW:
+        return pd.read_excel(path, sheet_name=sheet_name, **kwargs)
+
+    entry_dir = _entry_dir(path, sheet_name, kwargs, cache_dir)
+    index_path = os.path.join(entry_dir, "sheets.json")
+
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            sheets = json.load(f)
+    else:
+        parsed = pd.read_excel(path, sheet_name=sheet_name, **kwargs)
+        frames = parsed if sheet_name is None else {sheet_name: parsed}
+        os.makedirs(entry_dir, exist_ok=True)
+        sheets = []
+        for i, (name, df) in enumerate(frames.items()):
+            sheets.append({"name": name,
+                           "format": _write_sheet(df, os.path.join(entry_dir, str(i)))})
+        # Written last so that an interrupted conversion is never read back
+        with open(index_path, "w") as f:
+            json.dump(sheets, f)
+        if sheet_name is not None:
+            return parsed
+        return frames
+
+    frames = {sheet["name"]: _read_sheet(os.path.join(entry_dir, str(i)), sheet["format"])
+              for i, sheet in enumerate(sheets)}
+    if sheet_name is None:
+        return frames
+    return next(iter(frames.values()))
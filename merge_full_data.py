@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
+import argparse
+import json
+import os
 import numpy as np
 import pandas as pd
-import holidays
+from input_cache import read_excel_cached
+from degree_days import degree_days
+from asof_align import add_asof_columns
+from calendar_table import add_calendar_features
+from msa_data import write_merged_parquet
+from weighted_temperature import POP_SCENARIOS, station_names, population_weights, weighted_temperatures
 
 """
 'EC - Calgary Temp': 'CALGARY',
@@ -10,93 +18,103 @@ import holidays
 "EC - Lethbridge Temp": "LETHBRG"
 """
 
+OUTPUT_PATH = "msa_merged_data.csv"
+STATE_PATH = "msa_merged_data.state.json"
+# Default end of the merged data: hours from this day on are dropped. With end=None (--end latest) the merged data
+# goes up to the last hour of AIL data instead, so incremental runs pick up newly added hours
+END_DATE = "2020-12-31"
+# Output column of the weighted average temperature under each population scenario
+WEIGHTED_TEMP_COLS = {"POP_MEDIUM": "Weighted_Avg_Temp",
+                      "POP_LOW": "Weighted_Avg_Temp_low",
+                      "POP_HIGH": "Weighted_Avg_Temp_high"}
+TEMP_COL = "BFILL_TEMP_CELSIUS"
+FUTURE_COLS = ["future 1", "future 2", "future 3", "future 4"]
+SPOT_COLS = ["WTI spot"]
+# Daily oil prices are matched to the first trading day at or after each hour, with no limit on the gap
+OIL_DIRECTION = "forward"
+OIL_TOLERANCE = None
 
-def calc_weighted_temp(temp_data, temp_column, population_column):
+# Columns written to msa_merged_data.csv and their types.
+# Types are fixed so that a full rebuild and incremental appends format values the same way
+OUTPUT_DTYPES = {"HE": "float64", "POOL_PRICE": "float64", "AIL_DEMAND": "float64",
+                 "Avg_temp": "float64", "Degree_days": "float64", "Weighted_Avg_Temp": "float64",
+                 "Calgary_temp": "float64", "Edmonton_temp": "float64",
+                 "FortMM_Temp": "float64", "Lethbridge_temp": "float64",
+                 "future 1": "float64", "future 2": "float64", "future 3": "float64", "future 4": "float64",
+                 "WTI spot": "float64", "dayofweek": "int64", "month": "int64", "year": "int64",
+                 "holiday": "int64", "workingday": "int64",
+                 "Weighted_Avg_Temp_low": "float64", "Weighted_Avg_Temp_high": "float64"}
+
+
+def calc_weighted_temp(temp_data, temp_column, scenarios=POP_SCENARIOS):
     """
-    Calculate Average and Weighted Average Temperature based on the given non-messing temperature column and population estimate.
-    Alter data frame in place
+    Calculate Average and Weighted Average Temperature based on the given non-messing temperature column,
+    for every station in the data and every population scenario at once.
+    Adds the columns "Avg temp" and "Weighted Avg Temp|<scenario>". Alter data frame in place
 
-    Examples: calc_weighted_temp(temp_data, "BFILL_TEMP_CELSIUS", "POP_MEDIUM")
-        => Calculate averages based on back filled temperature data and medium population estimates
+    Examples: calc_weighted_temp(temp_data, "BFILL_TEMP_CELSIUS", ["POP_LOW", "POP_MEDIUM", "POP_HIGH"])
+        => Calculate averages based on back filled temperature data and low, medium and high population estimates
     ---------
     Input:
-        - temp_data: Pandas Dataframe
+        - temp_data: Pandas Dataframe, see weighted_temperature.py for the expected columns
         - temp_column: string
-        - population_column: string
+        - scenarios: list of population estimates
     """
+    stations = station_names(temp_data, temp_column)
+    temps = temp_data[[temp_column + "|" + station for station in stations]].to_numpy(dtype=float)
     # Calculate average temperature
-    temp_data["Avg temp"] = (temp_data[temp_column + "|CALGARY"]
-                             + temp_data[temp_column + "|FORTMM"] +
-                             temp_data[temp_column+"|EDMONTON"]
-                             + temp_data[temp_column+"|LETHBRG"]) / 4.0
+    temp_data["Avg temp"] = temps.mean(axis=1)
     # Calculate weighted average temperature
-    yyc_wt = temp_data[temp_column + "|CALGARY"] * \
-        temp_data["PCT_" + population_column+"|CALGARY"]
-    edm_wt = temp_data[temp_column + "|EDMONTON"] * \
-        temp_data["PCT_" + population_column+"|EDMONTON"]
-    lb_wt = temp_data[temp_column + "|LETHBRG"] * \
-        temp_data["PCT_" + population_column+"|LETHBRG"]
-    fmm_wt = temp_data[temp_column + "|FORTMM"] * \
-        temp_data["PCT_" + population_column+"|FORTMM"]
-    temp_data["Weighted Avg Temp"] = yyc_wt + edm_wt + lb_wt + fmm_wt
+    years, weights = population_weights(temp_data, stations, scenarios)
+    weighted = weighted_temperatures(
+        temps, temp_data["BEGIN_DATE_GMT"].dt.year.to_numpy(), years, weights)
+    for i, scenario in enumerate(scenarios):
+        temp_data["Weighted Avg Temp|" + scenario] = weighted[:, i]
 
 
 def calc_degree_days(temps, base_temp=18):
     """
-    Calculate Number of heating and cooling degree days per hour
+    Calculate Number of heating and cooling degree days per hour as one signed number:
+    heating degree days are positive and cooling degree days negative.
+    See degree_days.py for separate heating/cooling arrays and grids of base temperatures
     ---------
     Input:
     - temp_data: Pandas Series, Numpy List.. with Temperatures
     - base_temp: Base Temperature to count heating and cooling days
     Returns:
-    - List
+    - Numpy array, missing temperatures count as 0
     """
-    degree_days = []
-    for value in temps:
-        if (value < base_temp) or (value > base_temp):
-            degree_days.append((base_temp - value)*(1/24))
-        else:
-            degree_days.append(0)
-    return degree_days
+    heating, cooling = degree_days(temps, base_temp)
+    return np.nan_to_num(heating - cooling)
 
 
-if __name__ == "__main__":
+def load_sources(start=None, end=END_DATE):
+    """
+    Read in and clean all the data sources of the merged data set
+    ---------
+    Input:
+    - start: if given, only rows from this timestamp onwards are kept, before they are cleaned
+      (see build_merged_data)
+    - end: oil prices after this day are dropped, None to keep them all
+    Returns:
+    - Dictionary of Pandas Dataframes with keys "ail", "temp", "oilfutures" and "oilprices",
+      each with a BEGIN_DATE_GMT column
+    """
+    def from_start(df):
+        return df if start is None else df[df['BEGIN_DATE_GMT'] >= start]
+
     # Reading in all the data
-    xls = pd.ExcelFile(
-        'original data/AIL and Pool Price (2010-2020)(7183).xls')
-    ail_data1 = pd.read_excel(xls, "Sheet 1")
-    ail_data2 = pd.read_excel(xls, "Sheet 2")
+    ail_path = 'original data/AIL and Pool Price (2010-2020)(7183).xls'
+    ail_data1 = read_excel_cached(ail_path, "Sheet 1")
+    ail_data2 = read_excel_cached(ail_path, "Sheet 2")
     temp_data = pd.read_csv("cleaned data/WF_Weighted Temp 2010-2021.csv")
     oilfutures_data = pd.read_csv(
         "cleaned data/Futures Crude 2010-2021 CAD.csv")
     oilprices_data = pd.read_csv("cleaned data/Oil Prices 2010-2021 CAD.csv")
 
     # Cleaning temperature data
-    POP_COL = "POP_MEDIUM"
-    TEMP_COL = "BFILL_TEMP_CELSIUS"
-    calc_weighted_temp(temp_data, TEMP_COL, POP_COL)
-
-    temp_data = temp_data[['BEGIN_DATE_GMT',
-                           'Avg temp',
-                           'Weighted Avg Temp',
-                           "BFILL_TEMP_CELSIUS|CALGARY",
-                           "BFILL_TEMP_CELSIUS|EDMONTON",
-                           "BFILL_TEMP_CELSIUS|FORTMM",
-                           "BFILL_TEMP_CELSIUS|LETHBRG",
-                           ]]
-    temp_data.rename(columns={"Avg temp": "Avg_temp",
-                              "Weighted Avg Temp": "Weighted_Avg_Temp",
-                              "BFILL_TEMP_CELSIUS|CALGARY": "Calgary_temp",
-                              "BFILL_TEMP_CELSIUS|EDMONTON": "Edmonton_temp",
-                              "BFILL_TEMP_CELSIUS|FORTMM": "FortMM_Temp",
-                              "BFILL_TEMP_CELSIUS|LETHBRG":  "Lethbridge_temp"}, inplace=True)
-
-    temp_data['Avg_temp'] = temp_data['Avg_temp'].astype(float)
-    temp_data['Weighted_Avg_Temp'] = temp_data['Weighted_Avg_Temp'].astype(
-        float)
     temp_data['BEGIN_DATE_GMT'] = pd.to_datetime(temp_data['BEGIN_DATE_GMT'])
-    temp_data["Degree_days"] = calc_degree_days(
-        temp_data['Avg_temp'], base_temp=18)
+    temp_data = from_start(temp_data)
 
     # Cleaning Oil Futures data
     oilfutures_data.rename(columns={"OK_Crude_Future_C1_CAD_per_bbl": "future 1",
@@ -106,49 +124,101 @@ if __name__ == "__main__":
                            inplace=True)
 
     oilfutures_data['BEGIN_DATE_GMT'] = pd.to_datetime(oilfutures_data["Date"])
+    oilfutures_data = from_start(oilfutures_data)
     oilfutures_data = oilfutures_data[~(
         oilfutures_data['BEGIN_DATE_GMT'] < '2009-12-31')]
-    oilfutures_data = oilfutures_data[~(
-        oilfutures_data['BEGIN_DATE_GMT'] > '2020-12-31')]
+    if end is not None:
+        oilfutures_data = oilfutures_data[~(
+            oilfutures_data['BEGIN_DATE_GMT'] > end)]
     del oilfutures_data['Date']
 
     # Cleaning Crude Oil data frame
     oilprices_data = oilprices_data.rename(
         columns={"OK_WTI_Spot_CAD_per_bbl": "WTI spot"})
     oilprices_data['BEGIN_DATE_GMT'] = pd.to_datetime(oilprices_data["Date"])
+    oilprices_data = from_start(oilprices_data)
     oilprices_data = oilprices_data[~(
         oilprices_data['BEGIN_DATE_GMT'] < '2009-12-31')]
-    oilprices_data = oilprices_data[~(
-        oilprices_data['BEGIN_DATE_GMT'] > '2020-12-31')]
+    if end is not None:
+        oilprices_data = oilprices_data[~(
+            oilprices_data['BEGIN_DATE_GMT'] > end)]
     del oilprices_data['Date']
 
     # Cleaning AIL demand data
     ail_frames = [ail_data1, ail_data2]
     ail_data = pd.concat(ail_frames)
+    ail_data['BEGIN_DATE_GMT'] = pd.to_datetime(ail_data['BEGIN_DATE_GMT'])
+    ail_data = from_start(ail_data).copy()
     ail_data['AIL_DEMAND'] = ail_data['AIL_DEMAND'].replace(',', '')
     ail_data['AIL_DEMAND'] = ail_data['AIL_DEMAND'].astype(int)
-    ail_data['BEGIN_DATE_GMT'] = pd.to_datetime(ail_data['BEGIN_DATE_GMT'])
     del ail_data['DATE']
 
+    return {"ail": ail_data, "temp": temp_data,
+            "oilfutures": oilfutures_data, "oilprices": oilprices_data}
+
+
+def build_merged_data(sources, start=None, end=END_DATE):
+    """
+    Merge the cleaned data sources and derive the additional features of msa_merged_data.csv
+    ---------
+    Input:
+    - sources: dictionary returned by load_sources
+    - start: if given, only hours from this timestamp onwards are built.
+      Oil prices are matched to later days only (OIL_DIRECTION = "forward"), so no earlier data is needed
+    - end: hours from this day on are dropped. If None, hours after the last hour of AIL data are dropped
+    Returns:
+    - Pandas Dataframe indexed by BEGIN_DATE_GMT with the columns in OUTPUT_DTYPES
+    """
+    if start is not None:
+        sources = {name: df[df["BEGIN_DATE_GMT"] >= start]
+                   for name, df in sources.items()}
+    ail_data = sources["ail"]
+    oilfutures_data = sources["oilfutures"]
+    oilprices_data = sources["oilprices"]
+
+    # Cleaning temperature data
+    temp_data = sources["temp"].copy()
+    calc_weighted_temp(temp_data, TEMP_COL, list(WEIGHTED_TEMP_COLS))
+
+    weighted_columns = {"Weighted Avg Temp|" + scenario: col
+                        for scenario, col in WEIGHTED_TEMP_COLS.items()}
+    temp_data = temp_data[['BEGIN_DATE_GMT',
+                           'Avg temp',
+                           "BFILL_TEMP_CELSIUS|CALGARY",
+                           "BFILL_TEMP_CELSIUS|EDMONTON",
+                           "BFILL_TEMP_CELSIUS|FORTMM",
+                           "BFILL_TEMP_CELSIUS|LETHBRG",
+                           ] + list(weighted_columns)]
+    temp_data = temp_data.rename(columns=dict({"Avg temp": "Avg_temp",
+                                               "BFILL_TEMP_CELSIUS|CALGARY": "Calgary_temp",
+                                               "BFILL_TEMP_CELSIUS|EDMONTON": "Edmonton_temp",
+                                               "BFILL_TEMP_CELSIUS|FORTMM": "FortMM_Temp",
+                                               "BFILL_TEMP_CELSIUS|LETHBRG":  "Lethbridge_temp"},
+                                              **weighted_columns))
+
+    temp_data["Degree_days"] = calc_degree_days(
+        temp_data['Avg_temp'], base_temp=18)
+
     # Merging the data
     merged_data = ail_data.merge(temp_data, how="right", on=['BEGIN_DATE_GMT'])
-    merged_data = merged_data.merge(
-        oilfutures_data, how="outer", on=['BEGIN_DATE_GMT'])
-    merged_data = merged_data.merge(
-        oilprices_data, how="outer", on=['BEGIN_DATE_GMT'])
     merged_data.index = merged_data['BEGIN_DATE_GMT']
-    merged_data = merged_data.sort_index()
+    if not merged_data.index.is_monotonic_increasing:
+        merged_data = merged_data.sort_index()
 
-    # Filling in missing values for oil data
-    merged_data['WTI spot'].fillna(method='bfill', inplace=True)
-    merged_data['future 1'].fillna(method='bfill', inplace=True)
-    merged_data['future 2'].fillna(method='bfill', inplace=True)
-    merged_data['future 3'].fillna(method='bfill', inplace=True)
-    merged_data['future 4'].fillna(method='bfill', inplace=True)
+    # Oil prices of each hour are the prices of the next trading day
+    add_asof_columns(merged_data, "BEGIN_DATE_GMT", oilfutures_data, "BEGIN_DATE_GMT",
+                     FUTURE_COLS, direction=OIL_DIRECTION, tolerance=OIL_TOLERANCE)
+    add_asof_columns(merged_data, "BEGIN_DATE_GMT", oilprices_data, "BEGIN_DATE_GMT",
+                     SPOT_COLS, direction=OIL_DIRECTION, tolerance=OIL_TOLERANCE)
 
     merged_data["POOL_PRICE"] = pd.to_numeric(merged_data["POOL_PRICE"])
 
-    merged_data = merged_data[~(merged_data['BEGIN_DATE_GMT'] >= '2020-12-31')]
+    if end is not None:
+        merged_data = merged_data[~(merged_data['BEGIN_DATE_GMT'] >= end)]
+    else:
+        # Later hours only have temperatures
+        last_ail = merged_data.loc[merged_data['AIL_DEMAND'].notna(), 'BEGIN_DATE_GMT'].max()
+        merged_data = merged_data[merged_data['BEGIN_DATE_GMT'] <= last_ail]
     merged_data['AIL_DEMAND'] = merged_data['AIL_DEMAND'].astype(float)
 
     # Creating dummies for hour, day, month, year
@@ -161,26 +231,149 @@ if __name__ == "__main__":
 
     hrdummy = pd.get_dummies(merged_data['hour'])
     dowdummy = pd.get_dummies(merged_data['dayofweek'])
-    dowdummy.columns = ['Monday', 'Tuesday', 'Wednesday',
-                        'Thursday', 'Friday', 'Saturday', 'Sunday']
+    dowdummy.columns = [['Monday', 'Tuesday', 'Wednesday',
+                         'Thursday', 'Friday', 'Saturday', 'Sunday'][i] for i in dowdummy.columns]
     mnthdummy = pd.get_dummies(merged_data['month'])
-    mnthdummy.columns = ['January', 'Feburary', 'March', 'April', 'May',
-                         'June', 'July', 'August', 'September', 'October', 'November', 'December']
+    mnthdummy.columns = [['January', 'Feburary', 'March', 'April', 'May',
+                          'June', 'July', 'August', 'September', 'October', 'November', 'December'][i - 1]
+                         for i in mnthdummy.columns]
     yrdummy = pd.get_dummies(merged_data['year'])
 
     # Creating dummy for working days
-    canada_holidays = holidays.CA()
-    merged_data["holiday"] = [
-        1 if i.date() in canada_holidays else 0 for i in merged_data["BEGIN_DATE_GMT"]]
-    merged_data["workingday"] = merged_data.apply(
-        lambda row: 0 if row["holiday"] == 1 or row["dayofweek"] in [5, 6] else 1, axis=1)
+    add_calendar_features(merged_data, "BEGIN_DATE_GMT",
+                          ["holiday", "workingday"])
 
     merged_data = pd.concat(
         [merged_data, hrdummy, dowdummy, mnthdummy, yrdummy], axis=1)
 
-    # Writing file to csv
-    cols = ["HE", "POOL_PRICE", "AIL_DEMAND", "Avg_temp", "Degree_days", "Weighted_Avg_Temp",
-            "Calgary_temp", "Edmonton_temp", "FortMM_Temp", "Lethbridge_temp",
-            "future 1", "future 2", "future 3", "future 4",
-            "WTI spot", "dayofweek", "month", "year", "holiday", "workingday"]
-    merged_data[cols].to_csv("msa_merged_data.csv")
+    return merged_data[list(OUTPUT_DTYPES)].astype(OUTPUT_DTYPES)
+
+
+def incomplete_tail_start(merged_data, columns=None):
+    """
+    Return the first hour of the trailing block of rows that could still change when more data arrives,
+    i.e. the earliest hour after which any source column is missing for every remaining hour.
+    Oil prices are back filled from the next available day, so hours after the last price stay empty
+    until newer prices are added, and AIL or temperature data can also lag behind the other sources.
+    ---------
+    Input:
+    - merged_data: Pandas Dataframe returned by build_merged_data
+    - columns: columns to check, defaults to every output column
+    Returns:
+    - Pandas Timestamp, or None if every column is filled up to the last hour
+    """
+    columns = columns or list(OUTPUT_DTYPES)
+    valid = merged_data[columns].notna().to_numpy()
+    n_rows = valid.shape[0]
+    # Position just after the last valid value of each column (0 if the column is empty)
+    last_valid = n_rows - np.argmax(valid[::-1], axis=0)
+    last_valid[~valid.any(axis=0)] = 0
+    first_incomplete = last_valid.min()
+    if first_incomplete >= n_rows:
+        return None
+    return merged_data.index[first_incomplete]
+
+
+def write_merged_data(merged_data, path, append_at=None):
+    """
+    Write the merged data to csv, either as a new file or by overwriting the end of an existing file.
+    ---------
+    Input:
+    - merged_data: Pandas Dataframe returned by build_merged_data
+    - path: path of the csv file
+    - append_at: byte offset in the existing file where new rows start. If None a new file is written
+    Returns:
+    - Dictionary with the high water mark (last hour written) and the hour and byte offset
+      from which the file has to be rewritten on the next incremental run
+    """
+    rewrite_from = incomplete_tail_start(merged_data)
+    if rewrite_from is None:
+        complete, incomplete = merged_data, merged_data.iloc[:0]
+    else:
+        complete = merged_data[merged_data.index < rewrite_from]
+        incomplete = merged_data[merged_data.index >= rewrite_from]
+
+    if append_at is None:
+        f = open(path, "w", newline="")
+        merged_data.iloc[:0].to_csv(f)
+    else:
+        f = open(path, "r+", newline="")
+        f.seek(append_at)
+        f.truncate()
+    with f:
+        complete.to_csv(f, header=False)
+        f.flush()
+        rewrite_offset = f.tell()
+        incomplete.to_csv(f, header=False)
+
+    last_hour = merged_data.index.max()
+    if rewrite_from is None:
+        rewrite_from = last_hour + pd.Timedelta(hours=1)
+    return {"high_water_mark": str(last_hour),
+            "rewrite_from": str(rewrite_from),
+            "rewrite_offset": rewrite_offset}
+
+
+def update_merged_data(sources=None, path=OUTPUT_PATH, state_path=STATE_PATH, incremental=False, end=END_DATE):
+    """
+    Build msa_merged_data.csv (and its typed Parquet copy) from scratch, or append the hours after the stored high water mark.
+    In incremental mode only the hours from the state's "rewrite_from" timestamp onwards are rebuilt:
+    the new hours plus the trailing hours whose oil prices were still waiting for a later day.
+    The result is the same as a full rebuild. The file is rebuilt from scratch when the state was written
+    for other output columns (or without them), e.g. after columns were added to OUTPUT_DTYPES, or when the file
+    has hours from end on.
+    ---------
+    Input:
+    - sources: dictionary returned by load_sources. If None, the sources are loaded with load_sources,
+      from the first hour to rebuild in incremental mode
+    - path: path of the csv file
+    - state_path: path of the json file storing the high water mark
+    - incremental: if True, append to the existing file when possible
+    - end: hours from this day on are not merged, None to merge up to the last hour of AIL data
+      (see build_merged_data)
+    Returns:
+    - Dictionary with the new state
+    """
+    state = None
+    if incremental and os.path.exists(path) and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        # Rows can only be appended to a file with the same columns, otherwise rebuild it
+        if state.get("columns") != list(OUTPUT_DTYPES):
+            state = None
+        # Hours written with a later end cannot be removed by appending
+        elif end is not None and pd.Timestamp(state["high_water_mark"]) >= pd.Timestamp(end):
+            state = None
+
+    if state is None:
+        merged_data = build_merged_data(sources if sources is not None else load_sources(end=end), end=end)
+        new_state = write_merged_data(merged_data, path)
+        write_merged_parquet(merged_data, path)
+    else:
+        start = pd.Timestamp(state["rewrite_from"])
+        merged_data = build_merged_data(sources if sources is not None else load_sources(start, end),
+                                        start=start, end=end)
+        if merged_data.empty:
+            return state
+        new_state = write_merged_data(
+            merged_data, path, append_at=state["rewrite_offset"])
+        write_merged_parquet(merged_data, path, replace_from=start)
+
+    new_state["columns"] = list(OUTPUT_DTYPES)
+    with open(state_path, "w") as f:
+        json.dump(new_state, f, indent=2)
+    return new_state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge the cleaned data sets into msa_merged_data.csv")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only build hours after the last run and append them to the existing file")
+    parser.add_argument("--end", default=END_DATE,
+                        help="day from which hours are not merged (default: {}), "
+                             "or 'latest' to merge up to the last hour of AIL data".format(END_DATE))
+    args = parser.parse_args()
+
+    state = update_merged_data(incremental=args.incremental, end=None if args.end == "latest" else args.end)
+    print("Merged data written up to {}".format(state["high_water_mark"]))
@@ -0,0 +1,227 @@
+"""
+Registry of fitted Prophet models under cache/models.
+
+Every model is stored under a key hashed from its training data (date range, number of rows and content),
+its regressors and its Prophet settings. fit_model returns the registered model when the key matches
+instead of fitting it again, so scripts and experiments only pay for a fit once.
+
+Models are written with fbprophet's JSON serializer (gzip compressed), which unlike pickle does not depend on
+the versions of the Stan backend and Python that wrote the file. If the serializer is not available
+(fbprophet < 0.6) they are pickled. index.json lists the registered models with their metadata and aliases
+(e.g. "pretrained"); a model file is only read the first time the model is requested.
+
+The pretrained model (pickled_model) is imported into the registry under the alias "pretrained" on first use.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+import pandas as pd
+
+from input_cache import file_digest, file_lock
+
+REGISTRY_DIR = os.path.join("cache", "models")
+INDEX_NAME = "index.json"
+LEGACY_MODEL_PATH = "pickled_model"
+
+_models = {}
+
+
+def _load_index(registry_dir):
+    try:
+        with open(os.path.join(registry_dir, INDEX_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"models": {}, "aliases": {}}
+
+
+def _update_index(registry_dir, models=None, aliases=None):
+    """
+    Add models and aliases to the index. The index is read again under a lock, so models registered by other
+    processes (e.g. parallel tuning or backtest workers) in the meantime are kept, and written to a temporary
+    file of its own before it replaces the index
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    with file_lock(os.path.join(registry_dir, INDEX_NAME + ".lock")):
+        index = _load_index(registry_dir)
+        index["models"].update(models or {})
+        index["aliases"].update(aliases or {})
+        with tempfile.NamedTemporaryFile("w", dir=registry_dir, suffix=".tmp", delete=False) as f:
+            json.dump(index, f, indent=2)
+        os.replace(f.name, os.path.join(registry_dir, INDEX_NAME))
+
+
+def model_key(data, regressors, settings):
+    """
+    Return the key of a model
+    ----------
+    Input
+        - data: Prophet dataframe with columns y, ds and the regressors used for training
+        - regressors: name of the additional regressors
+        - settings: all the arguments passed to Prophet
+    Returns
+        - Tuple (key, description): 16 character string and the dictionary it was hashed from
+    """
+    columns = ["ds", "y"] + list(regressors)
+    content = hashlib.sha256(pd.util.hash_pandas_object(data[columns], index=False).to_numpy().tobytes())
+    description = {"start": str(data["ds"].min()),
+                   "end": str(data["ds"].max()),
+                   "rows": len(data),
+                   "data": content.hexdigest(),
+                   "regressors": list(regressors),
+                   "settings": settings}
+    key = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return key, description
+
+
+def list_models(registry_dir=REGISTRY_DIR):
+    """
+    Return a Pandas DataFrame with one row per registered model and its metadata, without loading any model
+    """
+    index = _load_index(registry_dir)
+    aliases = {}
+    for alias, key in index["aliases"].items():
+        aliases.setdefault(key, []).append(alias)
+    rows = [dict(metadata, key=key, aliases=", ".join(aliases.get(key, [])))
+            for key, metadata in index["models"].items()]
+    return pd.DataFrame(rows)
+
+
+def save_model(model, key, metadata=None, alias=None, registry_dir=REGISTRY_DIR):
+    """
+    Register a fitted model
+    ----------
+    Input
+        - model: fitted model of the Prophet class
+        - key: key of the model, see model_key
+        - metadata: dictionary stored in the index with the model
+        - alias: optional name pointing to the model e.g. "pretrained"
+        - registry_dir: directory of the registry
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    try:
+        from fbprophet.serialize import model_to_json
+    except ImportError:
+        model_to_json = None
+    # Written to a temporary file of its own first so that sessions saving the same model do not write to the
+    # same file
+    if model_to_json is not None:
+        file_name, file_format = key + ".json.gz", "json"
+        with tempfile.NamedTemporaryFile(dir=registry_dir, suffix=".tmp", delete=False) as f, \
+                gzip.open(f, "wt") as g:
+            g.write(model_to_json(model))
+    else:
+        file_name, file_format = key + ".pkl", "pickle"
+        with tempfile.NamedTemporaryFile(dir=registry_dir, suffix=".tmp", delete=False) as f:
+            pickle.dump(model, f)
+    os.replace(f.name, os.path.join(registry_dir, file_name))
+
+    metadata = dict(metadata or {}, file=file_name, format=file_format, saved=time.strftime("%Y-%m-%d %H:%M:%S"))
+    _update_index(registry_dir, {key: metadata}, None if alias is None else {alias: key})
+    _models[(registry_dir, key)] = model
+
+
+def load_model(name, registry_dir=REGISTRY_DIR):
+    """
+    Return a registered model, reading its file only the first time it is requested
+    ----------
+    Input
+        - name: key or alias of the model
+        - registry_dir: directory of the registry
+    Returns
+        - Fitted model of the Prophet class, or None if no model is registered under that name
+    """
+    index = _load_index(registry_dir)
+    key = index["aliases"].get(name, name)
+    if (registry_dir, key) in _models:
+        return _models[(registry_dir, key)]
+    if key not in index["models"]:
+        return None
+
+    metadata = index["models"][key]
+    path = os.path.join(registry_dir, metadata["file"])
+    if not os.path.exists(path):
+        return None
+    if metadata["format"] == "json":
+        from fbprophet.serialize import model_from_json
+        with gzip.open(path, "rt") as f:
+            model = model_from_json(f.read())
+    else:
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    _models[(registry_dir, key)] = model
+    return model
+
+
+def fit_model(data, regressors=None, settings=None, init=None, alias=None, registry_dir=REGISTRY_DIR):
+    """
+    Return the registered model for this training data, regressors and settings, fitting and registering it
+    if there is none
+    ----------
+    Input
+        - data: Prophet dataframe with columns y, ds and the regressors
+        - regressors: name of the additional regressors, defaults to refit_model.REGRESSORS
+        - settings: arguments of Prophet overriding refit_model.PROPHET_SETTINGS
+        - init: parameters to warm start the fit, see refit_model.stan_init. Not part of the key
+        - alias: optional name pointing to the model
+        - registry_dir: directory of the registry
+    Returns
+        - Fitted model of the Prophet class
+    """
+    # Imported here since refit_model itself uses the registry
+    from refit_model import PROPHET_SETTINGS, REGRESSORS, make_prophet_model
+
+    regressors = REGRESSORS if regressors is None else regressors
+    settings = dict(PROPHET_SETTINGS, **(settings or {}))
+    key, description = model_key(data, regressors, settings)
+    model = load_model(key, registry_dir)
+    if model is None:
+        model = make_prophet_model(regressors, **settings)
+        start = time.perf_counter()
+        if init is None:
+            model.fit(data)
+        else:
+            model.fit(data, init=init)
+        description["fit_seconds"] = time.perf_counter() - start
+        save_model(model, key, description, alias, registry_dir)
+    elif alias is not None:
+        _update_index(registry_dir, aliases={alias: key})
+    return model
+
+
+def load_pretrained_model(path=LEGACY_MODEL_PATH, registry_dir=REGISTRY_DIR):
+    """
+    Return the pretrained model. It is read from the registry, and imported from the pickled file
+    the first time or when that file changed
+    ----------
+    Input
+        - path: path of the pickled model
+        - registry_dir: directory of the registry
+    Returns
+        - Fitted model of the Prophet class
+    """
+    index = _load_index(registry_dir)
+    key = index["aliases"].get("pretrained")
+    source_digest = file_digest(path) if os.path.exists(path) else None
+    registered_digest = index["models"].get(key, {}).get("source_digest")
+    if key is not None and source_digest in (None, registered_digest):
+        model = load_model(key, registry_dir)
+        if model is not None:
+            return model
+    if source_digest is None:
+        raise FileNotFoundError("No pretrained model in {} and no file {}".format(registry_dir, path))
+
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+    save_model(model, "pretrained-" + source_digest[:16], {"source": path, "source_digest": source_digest},
+               alias="pretrained", registry_dir=registry_dir)
+    return model
+
+
+if __name__ == "__main__":
+    models = list_models()
+    print(models.to_string(index=False) if len(models) else "No models in " + REGISTRY_DIR)
@@ -0,0 +1,154 @@
+"""
+Schema and shared loader of the merged data set (msa_merged_data.csv).
+
+merge_full_data.py writes a typed Parquet copy of the merged data next to the csv file
+(msa_merged_data.parquet, a directory with one <year>.parquet file per year, so an incremental run only rewrites
+the years it changes). Every consumer loads the data with load_merged_data, which reads the Parquet
+copy when it is up to date and otherwise parses the csv with the declared schema (and refreshes the Parquet copy).
+
+Types:
+- BEGIN_DATE_GMT: datetime64
+- measures (load, prices, temperatures, degree days): float32
+- holiday, workingday, dayofweek, month: uint8
+- HE: nullable UInt8 (hours with temperatures but no AIL data yet), year: uint16
+"""
+
+import os
+import pandas as pd
+
+from input_cache import HAS_PYARROW
+
+MERGED_CSV_PATH = "msa_merged_data.csv"
+DATE_COL = "BEGIN_DATE_GMT"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MERGED_SCHEMA = {"HE": "UInt8",
+                 "POOL_PRICE": "float32",
+                 "AIL_DEMAND": "float32",
+                 "Avg_temp": "float32",
+                 "Degree_days": "float32",
+                 "Weighted_Avg_Temp": "float32",
+                 "Weighted_Avg_Temp_low": "float32",
+                 "Weighted_Avg_Temp_high": "float32",
+                 "Calgary_temp": "float32",
+                 "Edmonton_temp": "float32",
+                 "FortMM_Temp": "float32",
+                 "Lethbridge_temp": "float32",
+                 "future 1": "float32",
+                 "future 2": "float32",
+                 "future 3": "float32",
+                 "future 4": "float32",
+                 "WTI spot": "float32",
+                 "dayofweek": "uint8",
+                 "month": "uint8",
+                 "year": "uint16",
+                 "holiday": "uint8",
+                 "workingday": "uint8"}
+
+
+def parquet_path(csv_path=MERGED_CSV_PATH):
+    """
+    Return the path of the Parquet copy of a csv file, a directory of yearly files
+    (a single file when written by an older version)
+    """
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def _year_files(path):
+    return {int(name[:-len(".parquet")]): os.path.join(path, name) for name in os.listdir(path)
+            if name.endswith(".parquet") and name[:-len(".parquet")].isdigit()}
+
+
+def _read_parquet_copy(path, columns=None):
+    if os.path.isfile(path):
+        return pd.read_parquet(path, columns=columns)
+    files = _year_files(path)
+    return pd.concat([pd.read_parquet(files[year], columns=columns) for year in sorted(files)],
+                     ignore_index=True)
+
+
+def apply_schema(df):
+    """
+    Return data frame with BEGIN_DATE_GMT as a column and the types declared in MERGED_SCHEMA.
+    Columns that are not in the schema keep their type
+    ----------
+    Input
+        - df: Pandas DataFrame with BEGIN_DATE_GMT as a column or as the index
+    Returns
+        - Pandas DataFrame
+    """
+    if DATE_COL not in df.columns:
+        df = df.reset_index()
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL], format=DATE_FORMAT)
+    schema = {col: dtype for col, dtype in MERGED_SCHEMA.items() if col in df.columns}
+    return df.astype(schema)
+
+
+def _to_parquet(df, path):
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def write_merged_parquet(merged_data, csv_path=MERGED_CSV_PATH, replace_from=None):
+    """
+    Write the typed Parquet copy of the merged data
+    ----------
+    Input
+        - merged_data: Pandas DataFrame indexed by (or with a column) BEGIN_DATE_GMT
+        - csv_path: path of the csv file the Parquet file sits next to
+        - replace_from: if given, only rows from this timestamp onwards are replaced in the existing Parquet copy,
+          and only the files of their years are written
+    """
+    if not HAS_PYARROW:
+        return
+    merged_data = apply_schema(merged_data.copy())
+    path = parquet_path(csv_path)
+    if replace_from is not None and os.path.isfile(path):
+        # Single file of an older version: converted to yearly files once
+        existing = pd.read_parquet(path)
+        merged_data = pd.concat([existing[existing[DATE_COL] < replace_from], merged_data], ignore_index=True)
+        replace_from = None
+    if os.path.isfile(path):
+        os.remove(path)
+    os.makedirs(path, exist_ok=True)
+
+    # Only the files of the years from replace_from onwards are written again
+    existing_files = _year_files(path)
+    first_year = pd.Timestamp(replace_from).year if replace_from is not None else None
+    if first_year is not None and first_year in existing_files:
+        existing = pd.read_parquet(existing_files[first_year])
+        merged_data = pd.concat([existing[existing[DATE_COL] < replace_from], merged_data], ignore_index=True)
+    years = merged_data[DATE_COL].dt.year.to_numpy()
+    for year, rows in merged_data.groupby(years):
+        _to_parquet(rows, os.path.join(path, "{}.parquet".format(year)))
+    written = set(years.tolist())
+    for year, file in existing_files.items():
+        if (first_year is None or year >= first_year) and year not in written:
+            os.remove(file)
+    # The modification time of the directory tells load_merged_data whether the copy is up to date
+    os.utime(path)
+
+
+def load_merged_data(columns=None, path=MERGED_CSV_PATH):
+    """
+    Load the merged data set with the declared schema
+    ----------
+    Input
+        - columns: list of columns to load (BEGIN_DATE_GMT is always included), defaults to all columns
+        - path: path of the csv file
+    Returns
+        - Pandas DataFrame with a BEGIN_DATE_GMT column and a default index
+    """
+    if columns is not None:
+        columns = [DATE_COL] + [col for col in columns if col != DATE_COL]
+    binary_path = parquet_path(path)
+    binary_is_fresh = (HAS_PYARROW and os.path.exists(binary_path) and
+                       (not os.path.exists(path) or os.path.getmtime(binary_path) >= os.path.getmtime(path)))
+    if binary_is_fresh:
+        return _read_parquet_copy(binary_path, columns)
+
+    data = apply_schema(pd.read_csv(path))
+    write_merged_parquet(data, path)
+    if columns is not None:
+        data = data[columns]
+    return data
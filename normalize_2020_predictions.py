@@ -8,16 +8,27 @@ Running this script writes AIL forecasts for 2020 including;
 -   the actual values
 -   forecasted values using 2020 temperature
 -   forecasted values using 2019 temperature 
+-   mean and 10th/90th percentiles of the forecasts using the temperatures of each year from 2010 to 2019
 """
 
 from os import name
+import argparse
 import numpy as np
 import pandas as pd
-import pickle
 from fbprophet import Prophet
+from msa_data import load_merged_data
+from feature_factory import lag, add_features
+from model_registry import load_pretrained_model
+from scenario_forecast import weather_year_scenarios, scenario_forecast, summarize_scenarios
 
-# this might give errors if you don't have newer version of fbprophet
-# from fbprophet.serialize import model_to_json, model_from_json
+WEATHER_YEARS = range(2010, 2020)
+WEATHER_PERCENTILES = (10, 90)
+
+FEATURES = [lag("Calgary_temp", 1), lag("Edmonton_temp", 1),
+            lag("FortMM_Temp", 1, name="FortMM_temp.1_hour_lag"), lag("Lethbridge_temp", 1)]
+"""
+Features of the pretrained model made from the merged data, see feature_factory.py
+"""
 
 
 # Functions to make FBProphet Datasets
@@ -71,25 +82,22 @@ def make_future_df(prophet_model, df_train, df_test, include_history=True):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast AIL for 2020 with the pretrained model")
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="number of samples of the uncertainty intervals (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the uncertainty intervals (default: 0)")
+    args = parser.parse_args()
 
-    # Code to load pretrained model with pickle
-    with open("pickled_model", "rb") as f:
-        model = pickle.load(f)
-
-    # Code to load model with fb prophet serialize if that works
-    # with open('serialized_model.json', 'r') as fin:
-    #     model = model_from_json(json.load(fin))  # Load model
+    # Load pretrained model from the model registry (imported from pickled_model on first use)
+    model = load_pretrained_model()
 
     # Reading in data
-    data = pd.read_csv("msa_merged_data.csv")
-    data["BEGIN_DATE_GMT"] = pd.to_datetime(data["BEGIN_DATE_GMT"])
+    data = load_merged_data()
 
     # Making Lags
     # Choose Regressors
-    data["Calgary_temp.1_hour_lag"] = data["Calgary_temp"].shift(1)
-    data["Edmonton_temp.1_hour_lag"] = data["Edmonton_temp"].shift(1)
-    data["FortMM_temp.1_hour_lag"] = data["FortMM_Temp"].shift(1)
-    data["Lethbridge_temp.1_hour_lag"] = data["Lethbridge_temp"].shift(1)
+    add_features(data, FEATURES)
     regressors = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag", "FortMM_temp.1_hour_lag",
                   "Lethbridge_temp.1_hour_lag", "future 1", "WTI spot", "workingday"]
 
@@ -107,18 +115,19 @@ if __name__ == "__main__":
     future_df = make_future_df(
         model,  train_df, test_df, include_history=False)
 
-    # Make future dataframe with 2019 temperatures
-    future_temp_norm_df = future_df.copy(deep=True)
+    # Make one scenario per weather year: the temperatures of the same day and hour in that year
     temperature_columns = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag",
                            "FortMM_temp.1_hour_lag", "Lethbridge_temp.1_hour_lag"]
-    index_2019 = len(train_df) - len(future_df)
-    for temp_col in temperature_columns:
-        future_temp_norm_df[temp_col] = [
-            i for i in train_df[temp_col][index_2019:]]
+    scenarios = weather_year_scenarios(
+        train_df, future_df, temperature_columns, WEATHER_YEARS)
+
+    # Forecast AIL, the weather scenarios reuse the forecast with 2020 temperatures
+    forecast_2020, scenario_yhat = scenario_forecast(
+        model, future_df, scenarios, samples=args.samples, seed=args.seed)
+    weather_norm = summarize_scenarios(scenario_yhat, WEATHER_PERCENTILES)
 
-    # Forecast AIL
-    forecast_2020 = model.predict(future_df)
-    forecast_temp_norm_2020 = model.predict(future_temp_norm_df)
+    # Forecast with 2019 temperatures, its interval is the 2020 interval shifted by the change of the forecast
+    temp_norm_shift = scenario_yhat[2019].to_numpy() - forecast_2020["yhat"].to_numpy()
 
     # Filter out Necessary Columns
 
@@ -130,12 +139,13 @@ if __name__ == "__main__":
         i for i in forecast_2020["yhat_lower"]]
     data_2020["Predicted_Load_upper"] = [
         i for i in forecast_2020["yhat_upper"]]
-    data_2020["Temperature_Norm_Load"] = [
-        i for i in forecast_temp_norm_2020["yhat"]]
-    data_2020["Temperature_Norm_lower"] = [
-        i for i in forecast_temp_norm_2020["yhat_lower"]]
-    data_2020["Temperature_Norm_upper"] = [
-        i for i in forecast_temp_norm_2020["yhat_upper"]]
+    data_2020["Temperature_Norm_Load"] = scenario_yhat[2019].to_numpy()
+    data_2020["Temperature_Norm_lower"] = forecast_2020["yhat_lower"].to_numpy() + temp_norm_shift
+    data_2020["Temperature_Norm_upper"] = forecast_2020["yhat_upper"].to_numpy() + temp_norm_shift
+    # Mean and percentiles over all weather years
+    data_2020["Weather_Norm_Load"] = weather_norm["mean"].to_numpy()
+    for percentile in WEATHER_PERCENTILES:
+        data_2020["Weather_Norm_p{}".format(percentile)] = weather_norm["p{}".format(percentile)].to_numpy()
     data_2020.set_index("BEGIN_DATE_GMT", drop=True, inplace=True)
 
     # Save final dataframe to csv files
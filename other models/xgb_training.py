@@ -0,0 +1,267 @@
+"""
+Training of the XGBoost model of the weekly difference of AIL_DEMAND (AIL_DEMAND minus its value 168 hours before).
+
+The feature matrix is built once as float32 and saved as a .npy file in cache/xgb, then opened memory-mapped.
+The random search over XGBoost parameters runs the (candidate, fold) fits in joblib worker processes: the workers
+receive the memory-mapped file instead of a copy of the matrix, and the folds of a TimeSeriesSplit are contiguous
+so each fit reads a slice of it without copying. Trees are built with the histogram method and each fit gets
+cores / workers threads, so the parallel fits do not oversubscribe the cores.
+
+Import it from the other scripts of this folder, or from the root of the repository with
+sys.path.append("other models"). Running this file trains the model on msa_merged_data.csv:
+    python "other models/xgb_training.py" --workers 4 --n-iter 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import sys
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from joblib import Parallel, delayed
+from sklearn.model_selection import ParameterSampler
+
+FEATURE_DIR = os.path.join("cache", "xgb")
+TARGET = "ail_demand_diff"
+DIFF_PERIODS = 168
+DROP_COLUMNS = ["AIL_DEMAND", "Weighted_Avg_Temp_low", "Weighted_Avg_Temp_high"]
+"""
+Columns of the merged data that are not features. Only the medium population scenario is used as a feature
+"""
+
+PARAM_GRID = {
+    'max_depth': [3, 4, 5, 6, 7, 8, 9, 10],
+    'learning_rate': [0.001, 0.01, 0.1, 0.2, 0.3],
+    'subsample': [0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+    'colsample_bytree': [0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+    'colsample_bylevel': [0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+    'min_child_weight': [0.5, 1.0, 3.0, 5.0, 7.0, 10.0],
+    'gamma': [0, 0.25, 0.5, 1.0],
+    'n_estimators': [10, 31, 52, 73, 94, 115, 136, 157, 178, 200]}
+
+
+# Measurement metrics
+def MAPE(y_true, y_pred):
+    y_true, y_pred = np.array(y_true), np.array(y_pred)
+    return np.mean(np.abs((y_true - y_pred) / y_true)) * 100
+
+
+def MSE(y_true, y_pred):
+    y_true, y_pred = np.array(y_true), np.array(y_pred)
+    return np.square(np.subtract(y_true, y_pred)).mean()
+
+
+def RMSE(y_true, y_pred):
+    return np.sqrt(MSE(y_true, y_pred))
+
+
+def prepare_data(data, periods=DIFF_PERIODS):
+    """
+    Add the target (difference of AIL_DEMAND with its value periods hours before) to the merged data
+    ----------
+    Input
+        - data: merged data with BEGIN_DATE_GMT, see msa_data.load_merged_data
+        - periods: number of hours of the difference, 168 to make the series stationary
+    Returns
+        - Pandas DataFrame indexed by BEGIN_DATE_GMT, without the hours where the target is missing
+    """
+    data = data.set_index("BEGIN_DATE_GMT")
+    data[TARGET] = data["AIL_DEMAND"].diff(periods=periods)
+    return data.dropna(subset=[TARGET])
+
+
+def feature_columns(data):
+    """
+    Return the names of the feature columns of data returned by prepare_data
+    """
+    return [col for col in data.columns if col not in DROP_COLUMNS + [TARGET]]
+
+
+def _data_digest(data, columns):
+    content = pd.util.hash_pandas_object(data[columns + [TARGET]], index=True).to_numpy()
+    return hashlib.sha256(content.tobytes()).hexdigest()
+
+
+def build_feature_matrix(data, feature_dir=FEATURE_DIR):
+    """
+    Write the feature matrix (float32) and the target of data to .npy files and open them memory-mapped.
+    The files are only written again when the content of data changed
+    ----------
+    Input
+        - data: Pandas DataFrame returned by prepare_data
+        - feature_dir: directory of the files
+    Returns
+        - Tuple (X, y, columns): read-only memory-mapped Numpy arrays of shape (hours, features) and (hours,),
+          and the names of the features
+    """
+    columns = feature_columns(data)
+    digest = _data_digest(data, columns)
+    x_path, y_path = os.path.join(feature_dir, "X.npy"), os.path.join(feature_dir, "y.npy")
+    meta_path = os.path.join(feature_dir, "features.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+
+    if meta.get("digest") != digest or not (os.path.exists(x_path) and os.path.exists(y_path)):
+        os.makedirs(feature_dir, exist_ok=True)
+        # Filled column by column, never holding a dense float64 copy of the features
+        X = np.lib.format.open_memmap(x_path + ".tmp", mode="w+", dtype=np.float32, shape=(len(data), len(columns)))
+        for i, col in enumerate(columns):
+            X[:, i] = data[col].to_numpy(dtype=np.float32, na_value=np.nan)
+        X.flush()
+        del X
+        np.save(y_path + ".tmp.npy", data[TARGET].to_numpy(dtype=np.float32))
+        os.replace(x_path + ".tmp", x_path)
+        os.replace(y_path + ".tmp.npy", y_path)
+        with open(meta_path, "w") as f:
+            json.dump({"digest": digest, "columns": columns, "rows": len(data),
+                       "start": str(data.index[0]), "end": str(data.index[-1])}, f, indent=2)
+
+    return np.load(x_path, mmap_mode="r"), np.load(y_path, mmap_mode="r"), columns
+
+
+def time_series_folds(n_samples, n_splits):
+    """
+    Return the folds of sklearn's TimeSeriesSplit(n_splits) as contiguous ranges
+    ----------
+    Input
+        - n_samples: number of rows
+        - n_splits: number of folds
+    Returns
+        - List of tuples (train_end, test_end): the fold trains on rows [0, train_end) and tests on
+          [train_end, test_end)
+    """
+    test_size = n_samples // (n_splits + 1)
+    first = n_samples - n_splits * test_size
+    return [(first + i * test_size, first + (i + 1) * test_size) for i in range(n_splits)]
+
+
+def thread_budget(workers, cores=None):
+    """
+    Return the number of threads of each XGBoost fit so that workers parallel fits use the cores once
+    """
+    cores = cores or os.cpu_count() or 1
+    return max(1, cores // max(1, workers))
+
+
+def make_model(params, threads=None, seed=0):
+    """
+    Return an XGBRegressor with histogram-based tree building
+    """
+    return xgb.XGBRegressor(tree_method="hist", n_jobs=threads, random_state=seed, **params)
+
+
+def fit_and_score(X, y, params, train_end, test_end, threads, seed=0):
+    """
+    Fit a model on rows [0, train_end) and return the negative mean squared error on [train_end, test_end)
+    and the fit time in seconds
+    """
+    start = time.perf_counter()
+    model = make_model(params, threads, seed).fit(X[:train_end], y[:train_end])
+    seconds = time.perf_counter() - start
+    return -MSE(y[train_end:test_end], model.predict(X[train_end:test_end])), seconds
+
+
+def random_search(X, y, param_grid=PARAM_GRID, n_iter=20, n_splits=11, workers=-1, seed=42):
+    """
+    Randomized search of XGBoost parameters with time series cross validation, as sklearn's RandomizedSearchCV
+    (same candidates for the same seed) but sharing X between the workers
+    ----------
+    Input
+        - X, y: feature matrix and target, memory-mapped arrays from build_feature_matrix
+        - param_grid: dictionary of parameter: list of values
+        - n_iter: number of candidates
+        - n_splits: number of folds of the time series cross validation
+        - workers: number of joblib worker processes, -1 for one per core
+        - seed: seed of the candidates
+    Returns
+        - Tuple (best parameters, Pandas DataFrame with the mean score and fit time of each candidate)
+    """
+    candidates = list(ParameterSampler(param_grid, n_iter, random_state=seed))
+    folds = time_series_folds(len(y), n_splits)
+    workers = os.cpu_count() if workers == -1 else workers
+    threads = thread_budget(workers)
+
+    scores = Parallel(n_jobs=workers)(
+        delayed(fit_and_score)(X, y, params, train_end, test_end, threads)
+        for params in candidates for train_end, test_end in folds)
+
+    scores = np.array(scores).reshape(len(candidates), len(folds), 2)
+    results = pd.DataFrame({"params": candidates,
+                            "mean_test_score": scores[:, :, 0].mean(axis=1),
+                            "std_test_score": scores[:, :, 0].std(axis=1),
+                            "mean_fit_time": scores[:, :, 1].mean(axis=1)})
+    results["rank_test_score"] = results["mean_test_score"].rank(ascending=False, method="min").astype(int)
+    return candidates[int(results["mean_test_score"].idxmax())], results
+
+
+def train(data, n_iter=20, n_splits=11, workers=-1, seed=42, feature_dir=FEATURE_DIR):
+    """
+    Tune and fit the model. The last fold of a TimeSeriesSplit(n_splits) is held out: the parameters are searched
+    on the rows before it, the best model is fitted on them and evaluated on the held out rows
+    ----------
+    Input
+        - data: merged data with BEGIN_DATE_GMT, see msa_data.load_merged_data
+        - n_iter, n_splits, workers, seed: see random_search
+        - feature_dir: directory of the feature matrix, see build_feature_matrix
+    Returns
+        - Dictionary with model (fitted XGBRegressor), best_params, cv_results, predictions (Pandas Series of the
+          held out hours), mse, rmse, mape, and the seconds of each step (build_seconds, search_seconds, fit_seconds)
+    """
+    start = time.perf_counter()
+    prepared = prepare_data(data)
+    X, y, columns = build_feature_matrix(prepared, feature_dir)
+    build_seconds = time.perf_counter() - start
+
+    train_end, test_end = time_series_folds(len(y), n_splits)[-1]
+    start = time.perf_counter()
+    best_params, cv_results = random_search(X[:train_end], y[:train_end], n_iter=n_iter, n_splits=n_splits,
+                                            workers=workers, seed=seed)
+    search_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = make_model(best_params, thread_budget(1)).fit(X[:train_end], y[:train_end])
+    fit_seconds = time.perf_counter() - start
+
+    y_test = np.asarray(y[train_end:test_end])
+    predictions = model.predict(X[train_end:test_end])
+    return {"model": model, "best_params": best_params, "cv_results": cv_results, "columns": columns,
+            "predictions": pd.Series(predictions, index=prepared.index[train_end:test_end], name=TARGET + "_pred"),
+            "mse": MSE(y_test, predictions), "rmse": RMSE(y_test, predictions), "mape": MAPE(y_test, predictions),
+            "build_seconds": build_seconds, "search_seconds": search_seconds, "fit_seconds": fit_seconds}
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident memory (MB) of this process and of its largest finished child process
+    """
+    factor = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * factor / 2 ** 20,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * factor / 2 ** 20)
+
+
+if __name__ == "__main__":
+    # Shared loader of the merged data lives at the root of the repository
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from msa_data import load_merged_data
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n-iter", type=int, default=20, help="number of candidates of the random search")
+    parser.add_argument("--splits", type=int, default=11, help="number of folds of the time series split")
+    parser.add_argument("--workers", type=int, default=-1, help="number of worker processes, -1 for all cores")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    result = train(load_merged_data(), args.n_iter, args.splits, args.workers, args.seed)
+    print("best score : {}".format(result["cv_results"]["mean_test_score"].max()))
+    print("best params: {}".format(result["best_params"]))
+    print("held out MSE {:.0f}, RMSE {:.1f}".format(result["mse"], result["rmse"]))
+    print("feature matrix {:.1f}s, search {:.1f}s, final fit {:.1f}s".format(
+        result["build_seconds"], result["search_seconds"], result["fit_seconds"]))
+    print("peak RSS {:.0f} MB (largest worker {:.0f} MB)".format(*peak_rss_mb()))
@@ -0,0 +1,182 @@
+"""
+Faster predictions with uncertainty intervals for fitted Prophet models.
+
+Prophet's predict spends most of its time in the uncertainty intervals: for each of uncertainty_samples
+(1000 by default) samples it simulates a trend path with new changepoints, recomputes all seasonality and
+regressor terms and builds a data frame. For a model fitted by MAP only the trend changepoints and the noise are
+random, so here every sample is drawn at once:
+    sampled yhat = yhat + trend deviation * (1 + multiplicative terms) + noise
+The trend deviations and noise are drawn from a seeded generator and cached for the hours of the call,
+so forecasts over the same hours (e.g. different weather scenarios) reuse them and have consistent intervals.
+
+Use intervals=False when only yhat is needed. Models fitted with MCMC or with logistic/flat growth fall back to
+Prophet's own sampling, with the given number of samples and seed. Prophet only draws from numpy's global random
+generator, so these calls run one at a time and restore its state afterwards.
+"""
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+CACHE_BYTES = 512 * 2 ** 20
+"""
+Maximum size of the cached trend paths, an entry of 1000 samples over a year of hours takes about 140 MB
+"""
+
+_paths = OrderedDict()
+# The batcher threads of forecast_service.py share the cache
+_lock = threading.Lock()
+_global_rng_lock = threading.Lock()
+
+
+def _entry_bytes(paths):
+    return sum(values.nbytes for values in paths.values())
+
+
+def _model_fingerprint(model):
+    digest = hashlib.sha256()
+    for name in ["k", "m", "delta", "sigma_obs"]:
+        digest.update(np.ascontiguousarray(model.params[name], dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(model.changepoints_t, dtype=float).tobytes())
+    digest.update(np.float64(model.y_scale).tobytes())
+    return digest.hexdigest()
+
+
+def clear_cache():
+    """
+    Forget the cached trend paths
+    """
+    with _lock:
+        _paths.clear()
+
+
+def sample_trend_paths(model, t, samples, seed=0):
+    """
+    Simulate the deviation of the trend from its point estimate, as Prophet's sample_predictive_trend does:
+    new changepoints after the history (a Poisson process with the rate of the fitted changepoints) with
+    Laplace distributed rate changes of the empirical scale of the fitted ones, and observation noise
+    ----------
+    Input
+        - model: model of the Prophet class fitted by MAP with linear growth
+        - t: array of scaled times (column t of model.setup_dataframe)
+        - samples: number of paths
+        - seed: seed of the random generator
+    Returns
+        - Tuple of Numpy arrays (trend deviation, noise), of shape (samples, len(t)) and in units of y
+    """
+    rng = np.random.default_rng(seed)
+    t = np.asarray(t, dtype=float)
+    n_hours = len(t)
+    deltas = np.asarray(model.params["delta"])[0]
+    sigma = float(np.asarray(model.params["sigma_obs"]).ravel()[0])
+    T = t.max() if n_hours else 0.0
+
+    deviation = np.zeros((samples, n_hours))
+    if T > 1:
+        n_changes = rng.poisson(len(model.changepoints_t) * (T - 1), size=samples)
+        changepoints = 1 + rng.random(n_changes.sum()) * (T - 1)
+        new_deltas = rng.laplace(0, np.mean(np.abs(deltas)) + 1e-8, n_changes.sum())
+        owner = np.repeat(np.arange(samples), n_changes)
+
+        # After a changepoint c with rate change d the trend moves by d * (t - c):
+        # accumulate d and d * c from the first hour at or after each changepoint
+        order = np.argsort(t, kind="stable")
+        start = np.searchsorted(t[order], changepoints, side="left")
+        inside = start < n_hours
+        slope = np.zeros((samples, n_hours))
+        offset = np.zeros((samples, n_hours))
+        np.add.at(slope, (owner[inside], start[inside]), new_deltas[inside])
+        np.add.at(offset, (owner[inside], start[inside]), new_deltas[inside] * changepoints[inside])
+        np.cumsum(slope, axis=1, out=slope)
+        np.cumsum(offset, axis=1, out=offset)
+        deviation[:, order] = (slope * t[order] - offset) * model.y_scale
+
+    noise = rng.normal(0, sigma, (samples, n_hours)) * model.y_scale
+    return deviation, noise
+
+
+def _cached_paths(model, t, samples, seed):
+    key = (_model_fingerprint(model), hashlib.sha256(np.ascontiguousarray(t, dtype=float).tobytes()).hexdigest(),
+           samples, seed)
+    with _lock:
+        if key in _paths:
+            _paths.move_to_end(key)
+            return _paths[key]
+    # Sampled outside of the lock so that other models are not kept waiting
+    deviation, noise = sample_trend_paths(model, t, samples, seed)
+    with _lock:
+        paths = _paths.setdefault(key, {"deviation": deviation, "noise": noise})
+        _paths.move_to_end(key)
+        total = sum(_entry_bytes(entry) for entry in _paths.values())
+        while _paths and total > CACHE_BYTES:
+            total -= _entry_bytes(_paths.popitem(last=False)[1])
+    return paths
+
+
+def _quantiles(paths, name, values, lower_p, upper_p):
+    # Percentiles of paths that do not depend on the forecast are computed once per cached entry
+    if name not in paths:
+        paths[name] = np.percentile(values, [lower_p, upper_p], axis=0)
+    return paths[name]
+
+
+def predict(model, df, samples=None, seed=0, intervals=True):
+    """
+    Drop-in replacement of model.predict(df)
+    ----------
+    Input
+        - model: fitted model of the Prophet class
+        - df: dataframe with ds and the regressors
+        - samples: number of samples of the uncertainty intervals, defaults to model.uncertainty_samples
+        - seed: seed of the random generator, the same seed gives the same intervals
+        - intervals: if False (or samples is 0) the forecast has no yhat_lower/upper and trend_lower/upper columns
+    Returns
+        - Pandas DataFrame with the columns of model.predict
+    """
+    if samples is None:
+        samples = model.uncertainty_samples
+    map_fit = np.asarray(model.params["k"]).shape[0] == 1
+    # A copy of its own, so that other threads predicting with the model never see the changed number of samples
+    model_copy = copy.copy(model)
+    if intervals and samples and not (map_fit and model.growth == "linear"):
+        # Prophet's own sampling, seeded. It draws from the global generator, so one call at a time
+        model_copy.uncertainty_samples = samples
+        with _global_rng_lock:
+            state = np.random.get_state()
+            np.random.seed(seed)
+            try:
+                return model_copy.predict(df)
+            finally:
+                np.random.set_state(state)
+    model_copy.uncertainty_samples = 0
+    forecast = model_copy.predict(df)
+    if not intervals or not samples:
+        return forecast
+
+    t = model.setup_dataframe(df.copy())["t"].to_numpy()
+    paths = _cached_paths(model, t, samples, seed)
+    lower_p = 100 * (1.0 - model.interval_width) / 2
+    upper_p = 100 * (1.0 + model.interval_width) / 2
+
+    trend_lower, trend_upper = _quantiles(paths, "trend_quantiles", paths["deviation"], lower_p, upper_p)
+    multiplicative = forecast["multiplicative_terms"].to_numpy()
+    if not multiplicative.any():
+        # Additive model: the sampled forecasts are yhat plus the same paths for any regressor values
+        yhat_lower, yhat_upper = _quantiles(paths, "yhat_quantiles", paths["deviation"] + paths["noise"],
+                                            lower_p, upper_p)
+    else:
+        yhat_lower, yhat_upper = np.percentile(
+            paths["deviation"] * (1 + multiplicative) + paths["noise"], [lower_p, upper_p], axis=0)
+
+    yhat = forecast["yhat"].to_numpy()
+    trend = forecast["trend"].to_numpy()
+    intervals_df = pd.DataFrame({"yhat_lower": yhat + yhat_lower, "yhat_upper": yhat + yhat_upper,
+                                 "trend_lower": trend + trend_lower, "trend_upper": trend + trend_upper})
+    # Same column order as Prophet: ds, trend, yhat_lower, yhat_upper, trend_lower, trend_upper, components..., yhat
+    columns = list(forecast.columns)
+    position = columns.index("trend") + 1
+    forecast = pd.concat([forecast, intervals_df.set_index(forecast.index)], axis=1)
+    return forecast[columns[:position] + list(intervals_df.columns) + columns[position:]]
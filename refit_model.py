@@ -1,16 +1,36 @@
 """
 - This script demonstrates how a prefit prophet model can be refitted with additional data i.e. data left out for training.
 
-- True out-of-sample predictions require predicted values for the regressors, which is unfortunately out of the scope of our abilities.
+- True out-of-sample predictions require predicted values for the regressors, see make_out_of_sample_df and regressor_forecast.py
 """
 
+import argparse
+import json
 import pandas as pd
-import pickle
-import holidays
 from fbprophet import Prophet
-from normalize_2020_predictions import make_prophet_df, make_future_df
-from statsmodels.tsa.forecasting.stl import STLForecast
-from statsmodels.tsa.arima.model import ARIMA
+from normalize_2020_predictions import FEATURES, make_prophet_df, make_future_df
+from calendar_table import add_calendar_features
+from feature_factory import add_features
+from msa_data import load_merged_data
+from model_registry import load_pretrained_model, fit_model
+from regressor_forecast import CONTINUOUS_REGRESSORS, forecast_regressors
+
+PROPHET_SETTINGS = dict(growth='linear', interval_width=0.95,
+                        yearly_seasonality=True,
+                        weekly_seasonality='auto',
+                        daily_seasonality='auto',
+                        seasonality_mode='additive')
+"""
+Specification of the pretrained model (pickled_model), passed to Prophet
+"""
+
+REGRESSORS = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag", "FortMM_temp.1_hour_lag",
+              "Lethbridge_temp.1_hour_lag", "future 1", "WTI spot", "workingday"]
+
+TUNED_CONFIG_PATH = "best_prophet_config.json"
+"""
+Configuration selected by tune_prophet.py
+"""
 
 
 def stan_init(model):
@@ -32,15 +52,73 @@ def stan_init(model):
     return res
 
 
-def make_out_of_sample_df(past_data, model, periods=24*30):
+def make_prophet_model(regressors=REGRESSORS, **settings):
+    """
+    Initalize a new prophet model with the specifications of the pretrained model
+    ----------
+    Input
+        - regressors: name of the additional regressors, all added in additive mode
+        - settings: arguments of Prophet overriding PROPHET_SETTINGS e.g. uncertainty_samples=0
+
+    Returns
+        - An unfitted model of the Prophet class.
+    """
+    model = Prophet(**dict(PROPHET_SETTINGS, **settings))
+    for regressor in regressors:
+        model.add_regressor(regressor, mode='additive')
+    return model
+
+
+def load_tuned_config(path=TUNED_CONFIG_PATH):
+    """
+    Read the configuration written by tune_prophet.py
+    ----------
+    Input
+        - path: path of the JSON file
+
+    Returns
+        - Tuple (regressors, settings): name of the additional regressors and arguments of Prophet
+          overriding PROPHET_SETTINGS
+    """
+    with open(path) as f:
+        config = json.load(f)
+    return config["regressors"], config["settings"]
+
+
+def load_training_data(regressors=REGRESSORS, features=FEATURES):
+    """
+    Load the merged data set in the format of the pretrained model:
+    y (AIL_DEMAND), ds and the regressors, without rows with missing values
+    ----------
+    Input
+        - regressors: name of the additional regressors
+        - features: features made from the merged data, see feature_factory.py
+
+    Returns
+        - A panda dataframe, see normalize_2020_predictions.make_prophet_df
+    """
+    data = load_merged_data()
+
+    # Making Lags
+    add_features(data, features)
+
+    return make_prophet_df(
+        data.drop(columns=["AIL_DEMAND"]), data["AIL_DEMAND"], regressors).dropna()
+
+
+def make_out_of_sample_df(past_data, model, periods=24*30, window=None, workers=None, refit=False):
     """
-    Sample function to create a dataframe with predicted values for the regressors using STL and ARIMA
-    Likely does not run very efficiently.
+    Create a dataframe with predicted values for the regressors using STL and ARIMA, see regressor_forecast.py.
+    The fitted regressor models are saved and only updated with the new hours on later calls
     Reference: https://www.statsmodels.org/stable/examples/notebooks/generated/stl_decomposition.html#Forecasting-with-STL
     ----------
     Input
         - past_data: data used ing training Prophet model
         - model: trained model of the Prophet class.
+        - periods: number of hours to forecast
+        - window: number of most recent hours used to fit the regressor models, defaults to all of them
+        - workers: number of processes fitting the regressor models, see regressor_forecast.forecast_regressors
+        - refit: if True, fit the regressor models again instead of updating the saved ones
 
     Returns
         - A panda dataframe with predicted values for regressors to use for forecasting
@@ -48,79 +126,36 @@ def make_out_of_sample_df(past_data, model, periods=24*30):
     future_time_df = model.make_future_dataframe(
         periods=periods, freq="H", include_history=False)
     # Creating dummy for working days
-    canada_holidays = holidays.CA()
-    future_time_df["holiday"] = [
-        1 if i.date() in canada_holidays else 0 for i in future_time_df["ds"]]
-    future_time_df["workingday"] = future_time_df.apply(
-        lambda row: 0 if row["holiday"] == 1 or row["ds"].weekday in ['Saturday', 'Sunday'] else 1, axis=1)
-
-    future_time_df.drop(columns=["holiday"], inplace=True)
+    add_calendar_features(future_time_df, "ds", ["workingday"])
 
     # Create predictions for future values of continuous regressors
-    non_binary_regressors = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag", "FortMM_temp.1_hour_lag",
-                             "Lethbridge_temp.1_hour_lag", "future 1", "WTI spot"]
-    past_data_copy = past_data.drop(columns=["y"]).set_index("ds")
-    past_data_copy.index.freq = "H"
-    for var in non_binary_regressors:
-        var_forecast = STLForecast(past_data_copy[var], ARIMA, model_kwargs=dict(
-            order=(1, 1, 0), trend="t")).fit()
-        future_time_df[var] = var_forecast.forecast(periods)
+    forecasts = forecast_regressors(past_data, CONTINUOUS_REGRESSORS, periods, window=window, workers=workers,
+                                    refit=refit)
+    for var in CONTINUOUS_REGRESSORS:
+        future_time_df[var] = forecasts[var].reindex(future_time_df["ds"]).to_numpy()
     future_time_df.reset_index(inplace=True)
     return future_time_df
 
 
 if __name__ == "__main__":
-    # Code to load pretrained model with pickle
-    with open("pickled_model", "rb") as f:
-        model = pickle.load(f)
-
-    # Reading in data
-    data = pd.read_csv("msa_merged_data.csv")
-    data["BEGIN_DATE_GMT"] = pd.to_datetime(data["BEGIN_DATE_GMT"])
-
-    # Making Lags
-    # Choose Regressors
-    data["Calgary_temp.1_hour_lag"] = data["Calgary_temp"].shift(1)
-    data["Edmonton_temp.1_hour_lag"] = data["Edmonton_temp"].shift(1)
-    data["FortMM_temp.1_hour_lag"] = data["FortMM_Temp"].shift(1)
-    data["Lethbridge_temp.1_hour_lag"] = data["Lethbridge_temp"].shift(1)
-    regressors = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag", "FortMM_temp.1_hour_lag",
-                  "Lethbridge_temp.1_hour_lag", "future 1", "WTI spot", "workingday"]
-
-    # Make Prophet dataset
-    prophet_data = make_prophet_df(
-        data.drop(columns=["AIL_DEMAND"]), data["AIL_DEMAND"], regressors).dropna()
-
-    # Initalize a new prophet model with the exact same specifications as original model
-    model_2 = Prophet(growth='linear', interval_width=0.95,
-                      yearly_seasonality=True,
-                      weekly_seasonality='auto',
-                      daily_seasonality='auto',
-                      seasonality_mode='additive')
-    model_2.add_regressor(regressors[0],
-                          mode='additive'
-                          )
-    model_2.add_regressor(regressors[1],
-                          mode='additive'
-                          )
-    model_2.add_regressor(regressors[2],
-                          mode='additive'
-                          )
-    model_2.add_regressor(regressors[3],
-                          mode='additive'
-                          )
-    model_2.add_regressor(regressors[4],
-                          mode='additive'
-                          )
-    model_2.add_regressor(regressors[5],
-                          mode='additive'
-                          )
-
-    # Binary vars
-    model_2.add_regressor(regressors[6],
-                          # prior_scale=10,
-                          mode='additive',
-                          standardize='auto')
-
-    # Warm start re-fitting the model to include 2020
-    model_2.fit(prophet_data, init=stan_init(model))
+    parser = argparse.ArgumentParser(description="Refit the pretrained model with all the data")
+    parser.add_argument("--tuned", nargs="?", const=TUNED_CONFIG_PATH, default=None,
+                        help="use the regressors and settings selected by tune_prophet.py (default file: {})".format(
+                            TUNED_CONFIG_PATH))
+    args = parser.parse_args()
+
+    regressors, settings = REGRESSORS, {}
+    if args.tuned is not None:
+        regressors, settings = load_tuned_config(args.tuned)
+
+    # Load pretrained model from the model registry (imported from pickled_model on first use)
+    model = load_pretrained_model()
+
+    # Make Prophet dataset with all the data
+    prophet_data = load_training_data(regressors)
+
+    # Warm start re-fitting a model with the exact same specifications as original model to include 2020.
+    # The parameters of the pretrained model only fit models with the same regressors.
+    # The fitted model is registered, later runs with the same data load it instead of fitting again
+    init = stan_init(model) if regressors == REGRESSORS else None
+    model_2 = fit_model(prophet_data, regressors, settings, init=init, alias="refit")
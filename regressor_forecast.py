@@ -0,0 +1,272 @@
+"""
+Forecasts of the continuous regressors (temperatures and oil prices) needed for out-of-sample AIL forecasts.
+
+Each regressor is modelled as statsmodels' STLForecast does: an STL decomposition with a daily period, an ARIMA model
+of the deseasonalized series, and forecasts equal to the ARIMA forecast plus the last seasonal cycle repeated.
+
+The fitted state of each regressor (ARIMA parameters, Kalman filter state at the end of the data and last
+seasonal cycle) is small and saved as JSON in cache/regressor_forecasts. When new hours arrive, the saved state is
+updated by running the Kalman filter over the new hours only, with the fitted parameters and seasonal cycle, instead
+of decomposing and fitting the whole history again. Regressors that need a full fit are fitted in parallel processes,
+optionally on a recent window of the history only.
+
+Running this file updates (or fits) the states with the training data and writes the forecasts of the regressors:
+    python regressor_forecast.py --periods 720 --window-days 730 --workers 6
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.seasonal import STL
+from statsmodels.tsa.arima.model import ARIMA
+from statsmodels.tsa.statespace.tools import prepare_trend_spec, prepare_trend_data
+
+STATE_DIR = os.path.join("cache", "regressor_forecasts")
+OUTPUT_PATH = "forecasted_regressors.csv"
+
+CONTINUOUS_REGRESSORS = ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag", "FortMM_temp.1_hour_lag",
+                         "Lethbridge_temp.1_hour_lag", "future 1", "WTI spot"]
+
+PERIOD = 24
+ARIMA_ORDER = (1, 1, 0)
+ARIMA_TREND = "t"
+
+HOUR = pd.Timedelta(hours=1)
+
+
+def _hourly(series):
+    # Hourly series without gaps, missing hours are NaN
+    series = series.astype(float)
+    series = series[~series.index.duplicated(keep="last")].sort_index()
+    return series.reindex(pd.date_range(series.index[0], series.index[-1], freq="H"))
+
+
+def _state_path(state_dir, name):
+    return os.path.join(state_dir, "{}.json".format(name.replace(" ", "_").replace("/", "_")))
+
+
+def _trend_data(trend, nobs, offset):
+    # Trend terms of the ARIMA model for nobs hours, the first one being hour number offset of the fit (from 1)
+    polynomial, k_trend = prepare_trend_spec(trend)
+    return prepare_trend_data(polynomial, k_trend, nobs, offset) if k_trend else None
+
+
+def _filter_results(state, deseasonalized=()):
+    # Kalman filter restarted before the last observation of the fit, so that it always has data to run over.
+    # The trend terms are passed as exog to continue their time index from the fit
+    endog = np.concatenate([[state["last_deseasonalized"]], np.asarray(deseasonalized, dtype=float)])
+    model = ARIMA(endog, exog=_trend_data(state["trend"], len(endog), state["nobs"]), order=tuple(state["order"]),
+                  trend="n")
+    model.initialize_known(np.asarray(state["filter_state"]), np.asarray(state["filter_state_cov"]))
+    return model.filter(np.asarray(state["params"]))
+
+
+def _seasonal_cycle(state, hours):
+    # Seasonal component of the hours following the end of the state (last cycle repeated)
+    cycle = np.asarray(state["seasonal"])
+    return cycle[(state["phase"] + np.arange(hours)) % len(cycle)]
+
+
+def fit_regressor(series, name=None, period=PERIOD, order=ARIMA_ORDER, trend=ARIMA_TREND, window=None):
+    """
+    Fit the STL decomposition and ARIMA model of a regressor
+    ----------
+    Input
+        - series: hourly Pandas Series indexed by timestamps. Missing hours are interpolated for the decomposition
+        - name: name of the regressor, defaults to the name of the series
+        - period: length of the seasonal cycle in hours
+        - order, trend: order and trend of the ARIMA model of the deseasonalized series
+        - window: number of most recent hours used for fitting, defaults to all of them
+    Returns
+        - Dictionary with the fitted state, see update_regressor and forecast_regressor
+    """
+    series = _hourly(series)
+    if window is not None:
+        series = series.iloc[-window:]
+    observed = series.interpolate(limit_direction="both")
+    seasonal = STL(observed.to_numpy(), period=period).fit().seasonal
+    deseasonalized = observed.to_numpy() - seasonal
+
+    result = ARIMA(deseasonalized, order=order, trend=trend).fit()
+    return {"name": series.name if name is None else name,
+            "period": period,
+            "order": list(order),
+            "trend": trend,
+            "window": window,
+            "params": result.params.tolist(),
+            "param_names": list(result.model.param_names),
+            "nobs": len(deseasonalized),
+            "start": str(series.index[0]),
+            "end": str(series.index[-1]),
+            "last_value": float(series.iloc[-1]),
+            "last_deseasonalized": float(deseasonalized[-1]),
+            "filter_state": result.predicted_state[:, -2].tolist(),
+            "filter_state_cov": result.predicted_state_cov[:, :, -2].tolist(),
+            "seasonal": seasonal[-period:].tolist(),
+            "phase": 0,
+            "fitted": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_hours": 0}
+
+
+def update_regressor(state, series):
+    """
+    Add the hours of a series after the end of a fitted state, without refitting: the new hours are
+    deseasonalized with the last seasonal cycle and run through the Kalman filter with the fitted parameters
+    ----------
+    Input
+        - state: dictionary returned by fit_regressor or update_regressor
+        - series: hourly Pandas Series indexed by timestamps, hours up to the end of the state are ignored
+    Returns
+        - Updated copy of the state. Missing hours are allowed (the filter skips them)
+    """
+    end = pd.Timestamp(state["end"])
+    series = series[series.index > end]
+    if len(series) == 0:
+        return state
+    new = _hourly(series).reindex(pd.date_range(end + HOUR, series.index.max(), freq="H"))
+    deseasonalized = new.to_numpy() - _seasonal_cycle(state, len(new))
+
+    result = _filter_results(state, deseasonalized)
+    last_observed = np.flatnonzero(~np.isnan(new.to_numpy()))
+    updated = dict(state,
+                   nobs=state["nobs"] + len(new),
+                   end=str(new.index[-1]),
+                   last_value=float(new.iloc[last_observed[-1]]) if len(last_observed) else state["last_value"],
+                   last_deseasonalized=float(deseasonalized[-1]),
+                   filter_state=result.predicted_state[:, -2].tolist(),
+                   filter_state_cov=result.predicted_state_cov[:, :, -2].tolist(),
+                   phase=(state["phase"] + len(new)) % len(state["seasonal"]),
+                   updated_hours=state["updated_hours"] + len(new))
+    return updated
+
+
+def forecast_regressor(state, periods):
+    """
+    Forecast a regressor from its fitted state
+    ----------
+    Input
+        - state: dictionary returned by fit_regressor or update_regressor
+        - periods: number of hours to forecast
+    Returns
+        - Pandas Series of the forecasts indexed by the hours following the end of the state
+    """
+    result = _filter_results(state)
+    trend = _trend_data(state["trend"], periods, state["nobs"] + 1)
+    values = result.forecast(periods, exog=trend) + _seasonal_cycle(state, periods)
+    index = pd.date_range(pd.Timestamp(state["end"]) + HOUR, periods=periods, freq="H")
+    return pd.Series(values, index=index, name=state["name"])
+
+
+def save_state(state, state_dir=STATE_DIR):
+    """
+    Save the fitted state of a regressor as JSON in state_dir
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_path(state_dir, state["name"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_state(name, state_dir=STATE_DIR):
+    """
+    Return the saved state of a regressor, or None if there is none
+    """
+    try:
+        with open(_state_path(state_dir, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _reusable(state, series, period, order, trend, window):
+    # A saved state can be updated if it has the same specification and the data it was fitted on did not change
+    if state is None or (state["period"], list(state["order"]), state["trend"], state["window"]) != \
+            (period, list(order), trend, window):
+        return False
+    end = pd.Timestamp(state["end"])
+    if end not in series.index or series.index.max() < end:
+        return False
+    return bool(np.isclose(series.loc[end], state["last_value"]))
+
+
+def forecast_regressors(data, regressors=CONTINUOUS_REGRESSORS, periods=24*30, date_col="ds", window=None,
+                        workers=None, refit=False, state_dir=STATE_DIR, period=PERIOD, order=ARIMA_ORDER,
+                        trend=ARIMA_TREND):
+    """
+    Forecast several regressors. Saved states are updated with the hours added since they were fitted;
+    regressors without a usable state (or all of them if refit) are fitted in parallel and their states saved
+    ----------
+    Input
+        - data: dataframe with date_col and the regressors, e.g. the training data of the Prophet model
+        - regressors: names of the columns to forecast
+        - periods: number of hours to forecast after the end of data
+        - date_col: name of the column with timestamps
+        - window: number of most recent hours used when fitting, defaults to all of them
+        - workers: number of processes used for fitting, defaults to one per regressor (up to the number of cores)
+        - refit: if True, ignore the saved states
+        - state_dir: directory of the saved states, None to neither read nor save them
+        - period, order, trend: see fit_regressor
+    Returns
+        - Pandas DataFrame indexed by the hours following the end of data with one column per regressor
+    """
+    indexed = data.set_index(date_col)
+    end = indexed.index.max()
+    states = {}
+    to_fit = []
+    for regressor in regressors:
+        series = indexed[regressor].dropna()
+        state = None if refit or state_dir is None else load_state(regressor, state_dir)
+        if _reusable(state, series, period, order, trend, window):
+            states[regressor] = update_regressor(state, series)
+        else:
+            to_fit.append(regressor)
+
+    if workers is None:
+        workers = min(len(to_fit), os.cpu_count() or 1)
+    args = [(indexed[regressor].dropna(), regressor, period, order, trend, window) for regressor in to_fit]
+    if workers <= 1:
+        fitted = [fit_regressor(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fitted = list(executor.map(fit_regressor, *zip(*args)))
+    states.update(zip(to_fit, fitted))
+
+    forecasts = pd.DataFrame(index=pd.date_range(end + HOUR, periods=periods, freq="H"))
+    for regressor in regressors:
+        state = states[regressor]
+        if state_dir is not None:
+            save_state(state, state_dir)
+        # States end at the last observed hour of their regressor, which can be before the end of data
+        hours = int((end - pd.Timestamp(state["end"])) / HOUR) + periods
+        forecasts[regressor] = forecast_regressor(state, hours).reindex(forecasts.index)
+    return forecasts
+
+
+if __name__ == "__main__":
+    from refit_model import REGRESSORS, load_training_data
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--periods", type=int, default=24*30, help="hours to forecast")
+    parser.add_argument("--window-days", type=float, default=None,
+                        help="days of history used when fitting (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes used for fitting")
+    parser.add_argument("--refit", action="store_true", help="fit every regressor again instead of updating")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    window = None if args.window_days is None else int(args.window_days * 24)
+    forecasts = forecast_regressors(load_training_data(REGRESSORS), periods=args.periods, window=window,
+                                    workers=args.workers, refit=args.refit)
+    forecasts.rename_axis("ds").to_csv(args.output)
+    for regressor in CONTINUOUS_REGRESSORS:
+        state = load_state(regressor)
+        print("{:<30} fitted {} on {} to {}, updated with {} hours".format(
+            regressor, state["fitted"], state["start"], state["end"], state["updated_hours"]))
+    print("Forecasts of {} hours written to {} in {:.1f}s".format(args.periods, args.output,
+                                                                  time.perf_counter() - start))
@@ -0,0 +1,238 @@
+"""
+Run the data pipeline from the raw data to the 2020 forecasts with one command.
+
+Each stage declares the files it reads and writes. A stage is skipped when the content of its inputs
+(and of its own script) is unchanged since its last successful run and its outputs exist.
+Stages that do not depend on each other (e.g. the oil and population cleaning) run at the same time.
+A timing summary is printed at the end.
+
+Examples:
+    python run_pipeline.py                  # run every stage that is out of date
+    python run_pipeline.py merge --force    # rerun the merge stage (and whatever depends on it)
+    python run_pipeline.py --dry-run        # only show which stages would run
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from input_cache import file_digest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join("cache", "pipeline_state.json")
+
+STAGES = [
+    {"name": "oil",
+     "command": ["clean_oil_data.py"],
+     "inputs": ["original data/USDCAD BOC Rate.xls",
+                "original data/EIA Oil Prices.xls",
+                "original data/EIA NYMEX Futures (Crude Oil).xls"],
+     "outputs": ["cleaned data/Oil Prices 2010-2021 CAD.csv",
+                 "cleaned data/Futures Crude 2010-2021 CAD.csv"]},
+    {"name": "population",
+     "command": ["clean_population_data.py"],
+     "inputs": ["original data/2020-2046-05-census-divisions-population-projections-low.csv",
+                "original data/2020-2046-07-census-divisions-population-projections-medium.csv",
+                "original data/2020-2046-09-census-divisions-population-projections-high.csv"],
+     "outputs": ["cleaned data/Population 2010-2046.csv"]},
+    {"name": "temperature",
+     "command": ["clean_temperature_script.py"],
+     "inputs": ["original data/Temps Data full.xls",
+                "cleaned data/Population 2010-2046.csv"],
+     "outputs": ["cleaned data/WF_Weighted Temp 2010-2021.csv"]},
+    {"name": "merge",
+     "command": ["merge_full_data.py"],
+     "inputs": ["original data/AIL and Pool Price (2010-2020)(7183).xls",
+                "cleaned data/WF_Weighted Temp 2010-2021.csv",
+                "cleaned data/Oil Prices 2010-2021 CAD.csv",
+                "cleaned data/Futures Crude 2010-2021 CAD.csv"],
+     "outputs": ["msa_merged_data.csv"]},
+    {"name": "forecast",
+     "command": ["normalize_2020_predictions.py"],
+     "inputs": ["msa_merged_data.csv",
+                "pickled_model"],
+     "outputs": ["forecasted_2020_data.csv"]},
+    {"name": "regressors",
+     "command": ["regressor_forecast.py"],
+     "inputs": ["msa_merged_data.csv"],
+     "outputs": ["forecasted_regressors.csv"]},
+    {"name": "cubes",
+     "command": ["dashboard_cubes.py"],
+     "inputs": ["msa_merged_data.csv"],
+     "outputs": ["dashboard_cubes/daily.parquet", "dashboard_cubes/monthly.parquet",
+                 "dashboard_cubes/yearly.parquet", "dashboard_cubes/hour_year.parquet"]},
+]
+"""
+Stages of the pipeline. Modules imported by a stage's script are not tracked, use --force after changing them
+- name: name used on the command line
+- command: script (and arguments) run with the current python interpreter from the root of the repository
+- inputs: files read by the stage, a stage depends on the stages writing its inputs
+- outputs: files written by the stage
+"""
+
+
+def stage_dependencies(stages):
+    """
+    Return a dictionary of stage name: set of names of the stages producing its inputs
+    """
+    producers = {output: stage["name"] for stage in stages for output in stage["outputs"]}
+    return {stage["name"]: {producers[path] for path in stage["inputs"] if path in producers}
+            for stage in stages}
+
+
+def stage_fingerprint(stage):
+    """
+    Return a dictionary of path: content hash for the inputs and script of a stage.
+    Missing files are recorded as None
+    """
+    paths = stage["inputs"] + [stage["command"][0]]
+    return {path: file_digest(os.path.join(ROOT, path)) if os.path.exists(os.path.join(ROOT, path)) else None
+            for path in paths}
+
+
+def is_up_to_date(stage, fingerprint, state):
+    """
+    Return True if the stage ran successfully with the same inputs before and its outputs still exist
+    """
+    outputs_exist = all(os.path.exists(os.path.join(ROOT, path)) for path in stage["outputs"])
+    return outputs_exist and state.get(stage["name"]) == fingerprint
+
+
+def run_stage(stage):
+    """
+    Run a stage as a subprocess
+    ----------
+    Returns
+        - Tuple (return code, seconds, captured output)
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable] + stage["command"], cwd=ROOT,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    return process.returncode, time.perf_counter() - start, process.stdout
+
+
+def select_stages(stages, names):
+    """
+    Return the requested stages and every stage downstream of them, in pipeline order
+    """
+    if not names:
+        return list(stages)
+    dependencies = stage_dependencies(stages)
+    selected = set(names)
+    for stage in stages:
+        if dependencies[stage["name"]] & selected:
+            selected.add(stage["name"])
+    return [stage for stage in stages if stage["name"] in selected]
+
+
+def run_pipeline(stages=STAGES, names=None, force=False, jobs=None, dry_run=False, state_path=STATE_PATH):
+    """
+    Run out of date stages, independent stages in parallel
+    ----------
+    Input
+        - stages: list of stage definitions, see STAGES
+        - names: names of the stages to run (with their downstream stages), defaults to all
+        - force: if True, run the selected stages even when their inputs did not change
+        - jobs: maximum number of stages running at the same time, defaults to the number of stages
+        - dry_run: if True, only report which stages would run
+        - state_path: path of the json file storing the input hashes of the last successful runs
+    Returns
+        - List of dictionaries with the name, status and seconds of every stage
+    """
+    selected = select_stages(stages, names)
+    selected_names = {stage["name"] for stage in selected}
+    dependencies = {name: deps & selected_names
+                    for name, deps in stage_dependencies(stages).items() if name in selected_names}
+    state_path = os.path.join(ROOT, state_path)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    results = {}
+    pending = list(selected)
+    running = {}
+
+    def start_ready_stages(executor):
+        for stage in list(pending):
+            deps = dependencies[stage["name"]]
+            if any(results.get(dep, {}).get("status") in ("failed", "blocked") for dep in deps):
+                results[stage["name"]] = {"status": "blocked", "seconds": 0.0}
+                pending.remove(stage)
+            elif any(results.get(dep, {}).get("status") == "would run" for dep in deps):
+                # The dependency would change the inputs of this stage, which cannot be checked before it runs
+                results[stage["name"]] = {"status": "would run", "seconds": 0.0}
+                pending.remove(stage)
+            elif all(dep in results for dep in deps):
+                pending.remove(stage)
+                fingerprint = stage_fingerprint(stage)
+                missing = [path for path in stage["inputs"] if fingerprint[path] is None]
+                if missing:
+                    results[stage["name"]] = {"status": "failed", "seconds": 0.0,
+                                              "output": "Missing inputs: " + ", ".join(missing)}
+                elif not force and is_up_to_date(stage, fingerprint, state):
+                    results[stage["name"]] = {"status": "skipped", "seconds": 0.0}
+                elif dry_run:
+                    results[stage["name"]] = {"status": "would run", "seconds": 0.0}
+                else:
+                    print("Running {}...".format(stage["name"]), flush=True)
+                    running[executor.submit(run_stage, stage)] = (stage, fingerprint)
+
+    with ThreadPoolExecutor(max_workers=jobs or len(selected) or 1) as executor:
+        start_ready_stages(executor)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                returncode, seconds, output = future.result()
+                if returncode == 0:
+                    results[stage["name"]] = {"status": "ran", "seconds": seconds}
+                    state[stage["name"]] = fingerprint
+                    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+                    with open(state_path, "w") as f:
+                        json.dump(state, f, indent=2)
+                else:
+                    results[stage["name"]] = {"status": "failed", "seconds": seconds, "output": output}
+            start_ready_stages(executor)
+
+    return [dict(name=stage["name"], **results[stage["name"]]) for stage in selected]
+
+
+def print_summary(results):
+    """
+    Print the status and run time of every stage, and the output of failed stages
+    """
+    for result in results:
+        if result["status"] == "failed":
+            print("\n--- {} failed ---\n{}".format(result["name"], result["output"].strip()))
+    print("\n{:<14}{:<12}{:>10}".format("Stage", "Status", "Seconds"))
+    for result in results:
+        print("{:<14}{:<12}{:>10.2f}".format(result["name"], result["status"], result["seconds"]))
+    print("{:<26}{:>10.2f}".format("Total (sum of stages)", sum(r["seconds"] for r in results)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("stages", nargs="*",
+                        help="stages to run, with every stage that depends on them (default: all of {})".format(
+                            ", ".join(stage["name"] for stage in STAGES)))
+    parser.add_argument("--force", action="store_true",
+                        help="run the selected stages even if their inputs did not change")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="maximum number of stages running at the same time")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only show which stages would run")
+    args = parser.parse_args()
+    unknown = set(args.stages) - {stage["name"] for stage in STAGES}
+    if unknown:
+        parser.error("unknown stages: " + ", ".join(sorted(unknown)))
+
+    start = time.perf_counter()
+    results = run_pipeline(names=args.stages, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
+    print_summary(results)
+    print("{:<26}{:>10.2f}".format("Wall clock", time.perf_counter() - start))
+    sys.exit(1 if any(result["status"] == "failed" for result in results) else 0)
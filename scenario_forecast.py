@@ -0,0 +1,118 @@
+"""
+Weather scenario forecasts with a fitted Prophet model.
+
+A Prophet forecast is trend * (1 + multiplicative terms) + additive terms, and each regressor's term is linear in
+its standardized value. Changing the weather only changes the regressor terms, so the model is run once
+(prophet_predict.predict) for the base scenario. Every other scenario is the base forecast shifted by the change in its
+regressor terms, computed for all scenarios with one stacked product.
+
+Since the regressor coefficients are fixed (MAP fit), the uncertainty interval of a scenario is the base interval
+shifted by the same amount.
+"""
+
+import numpy as np
+import pandas as pd
+
+from prophet_predict import predict
+
+
+def regressor_coefficients(model, regressors):
+    """
+    Return the effect of a one unit change of each regressor on the forecast
+    ----------
+    Input
+        - model: fitted model of the Prophet class
+        - regressors: names of additional regressors of the model
+    Returns
+        - Tuple of Numpy arrays (additive, multiplicative) of shape (regressors,): change of the additive terms
+          (in units of y) and of the multiplicative terms (relative to the trend). A regressor has a zero
+          coefficient in the mode it does not use
+    """
+    # Averaging over samples gives the mean forecast when the model was fitted with MCMC
+    beta = np.mean(np.asarray(model.params["beta"]), axis=0)
+    additive = np.zeros(len(regressors))
+    multiplicative = np.zeros(len(regressors))
+    for i, regressor in enumerate(regressors):
+        props = model.extra_regressors[regressor]
+        coef = beta @ model.train_component_cols[regressor].to_numpy() / props["std"]
+        if props["mode"] == "additive":
+            additive[i] = coef * model.y_scale
+        else:
+            multiplicative[i] = coef
+    return additive, multiplicative
+
+
+def weather_year_scenarios(history, future, columns, years, date_col="ds"):
+    """
+    Build one scenario per historical year by replacing the weather columns of the future dataframe
+    with their values on the same day and hour of that year. February 29 uses February 28 in other years
+    ----------
+    Input
+        - history: dataframe with date_col and the weather columns, e.g. the training data
+        - future: dataframe with date_col and all regressors, e.g. from make_future_df
+        - columns: weather columns to replace e.g. the lagged temperatures
+        - years: historical years
+        - date_col: name of the column with timestamps
+    Returns
+        - Dictionary of year: Pandas DataFrame with the columns, aligned with the rows of future.
+          Hours without data in a year are NaN
+    """
+    ds = pd.to_datetime(future[date_col])
+    month, day, hour = ds.dt.month.to_numpy(), ds.dt.day.to_numpy(), ds.dt.hour.to_numpy()
+    by_date = history.set_index(date_col)[list(columns)]
+    by_date = by_date[~by_date.index.duplicated()]
+    scenarios = {}
+    for year in years:
+        leap_day = (month == 2) & (day == 29) & (not pd.Timestamp(year=year, month=1, day=1).is_leap_year)
+        dates = pd.to_datetime(pd.DataFrame({"year": year, "month": month,
+                                             "day": np.where(leap_day, 28, day), "hour": hour}))
+        scenarios[year] = by_date.reindex(dates).reset_index(drop=True)
+    return scenarios
+
+
+def scenario_forecast(model, future, scenarios, forecast=None, samples=None, seed=0, intervals=True):
+    """
+    Forecast every scenario from a single prediction of the base scenario
+    ----------
+    Input
+        - model: fitted model of the Prophet class
+        - future: dataframe with ds and all regressors of the model (the base scenario)
+        - scenarios: dictionary of name: dataframe with the regressors that change in the scenarios,
+          aligned with the rows of future (see weather_year_scenarios)
+        - forecast: forecast of future if it was already computed
+        - samples, seed, intervals: options of the base prediction, see prophet_predict.predict
+    Returns
+        - Tuple (forecast, scenario_yhat): the base forecast and a Pandas DataFrame indexed by ds with the
+          forecast (yhat) of each scenario as columns
+    """
+    if forecast is None:
+        forecast = predict(model, future, samples, seed, intervals)
+    names = list(scenarios)
+    columns = list(scenarios[names[0]].columns)
+    additive, multiplicative = regressor_coefficients(model, columns)
+
+    # Change of each regressor from the base scenario, shape (scenarios, hours, regressors)
+    base = future[columns].to_numpy(dtype=float)
+    change = np.stack([scenarios[name][columns].to_numpy(dtype=float) for name in names]) - base
+    shift = change @ additive + forecast["trend"].to_numpy() * (change @ multiplicative)
+
+    scenario_yhat = forecast["yhat"].to_numpy() + shift
+    return forecast, pd.DataFrame(scenario_yhat.T, index=pd.Index(forecast["ds"], name="ds"), columns=names)
+
+
+def summarize_scenarios(scenario_yhat, percentiles=(10, 90)):
+    """
+    Return the mean and percentile bands across scenarios. Scenarios missing for an hour are ignored
+    ----------
+    Input
+        - scenario_yhat: Pandas DataFrame returned by scenario_forecast
+        - percentiles: percentiles to compute
+    Returns
+        - Pandas DataFrame indexed by ds with the columns mean and p<percentile> e.g. p10
+    """
+    values = scenario_yhat.to_numpy()
+    summary = pd.DataFrame({"mean": np.nanmean(values, axis=1)}, index=scenario_yhat.index)
+    bands = np.nanpercentile(values, percentiles, axis=1)
+    for percentile, band in zip(percentiles, bands):
+        summary["p{}".format(percentile)] = band
+    return summary
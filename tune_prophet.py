@@ -0,0 +1,194 @@
+"""
+Search of Prophet settings (seasonality mode, changepoint and seasonality prior scales) and regressor sets
+over rolling-origin backtest folds, see backtest_prophet.py.
+
+Evaluating every candidate on long training windows takes a day, so candidates are compared with successive
+halving: all candidates are first evaluated with short training windows (cheap fits), then only the best 1/eta of
+them move to the next rung with longer windows, and so on. The candidates of a rung are evaluated in parallel
+processes, each one fitting its folds in a chain warm started from the previous fold.
+
+Running this file writes the best configuration to best_prophet_config.json (read by
+python refit_model.py --tuned) and the score of every candidate at every rung to tuning_results.csv:
+    python tune_prophet.py --workers 8 --budgets 90 365 1095
+"""
+
+import argparse
+import itertools
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from backtest_prophet import rolling_origins, run_chain
+from refit_model import REGRESSORS, TUNED_CONFIG_PATH, load_training_data
+
+RESULTS_PATH = "tuning_results.csv"
+
+REGRESSOR_SETS = {
+    "all": REGRESSORS,
+    "no oil": ["Calgary_temp.1_hour_lag", "Edmonton_temp.1_hour_lag", "FortMM_temp.1_hour_lag",
+               "Lethbridge_temp.1_hour_lag", "workingday"],
+    "weighted temperature": ["Weighted_Avg_Temp", "Degree_days", "future 1", "WTI spot", "workingday"],
+}
+"""
+Named sets of regressors searched over, all columns of msa_merged_data.csv or made by refit_model.load_training_data
+"""
+
+SEARCH_SPACE = {
+    "seasonality_mode": ["additive", "multiplicative"],
+    "changepoint_prior_scale": [0.005, 0.05, 0.5],
+    "seasonality_prior_scale": [0.1, 1.0, 10.0],
+}
+"""
+Values of the Prophet arguments searched over, every combination is combined with every regressor set
+"""
+
+
+def candidate_grid(space=SEARCH_SPACE, regressor_sets=REGRESSOR_SETS, samples=None, seed=0):
+    """
+    Return the candidate configurations
+    ----------
+    Input
+        - space: dictionary of Prophet argument: list of values
+        - regressor_sets: dictionary of name: list of regressors
+        - samples: number of candidates drawn at random from the grid, defaults to the whole grid
+        - seed: seed of the random draw
+    Returns
+        - List of dictionaries with name, regressor_set, regressors and settings (arguments of Prophet)
+    """
+    names = list(space)
+    candidates = []
+    for set_name, values in itertools.product(regressor_sets, itertools.product(*space.values())):
+        settings = dict(zip(names, values))
+        candidates.append({"name": "{} | {}".format(set_name, ", ".join("{}={}".format(*item)
+                                                                         for item in settings.items())),
+                           "regressor_set": set_name,
+                           "regressors": list(regressor_sets[set_name]),
+                           "settings": settings})
+    if samples is not None and samples < len(candidates):
+        chosen = np.random.default_rng(seed).choice(len(candidates), samples, replace=False)
+        candidates = [candidates[i] for i in sorted(chosen)]
+    return candidates
+
+
+def evaluate_candidate(data, candidate, cutoffs, horizon, train_days, metric="mape"):
+    """
+    Backtest a candidate on the folds of the cutoffs
+    ----------
+    Input
+        - data: Prophet dataframe with y, ds and the regressors of the candidate
+        - candidate: dictionary returned by candidate_grid
+        - cutoffs, horizon, train_days: see backtest_prophet.backtest
+        - metric: metric of backtest_prophet.forecast_metrics to minimize
+    Returns
+        - Dictionary with name, score (mean of the metric over the folds), folds and fit_seconds
+    """
+    # Intervals are not needed for the point forecast metrics
+    settings = dict(candidate["settings"], uncertainty_samples=0)
+    columns = ["y", "ds"] + candidate["regressors"]
+    rows = run_chain(data[columns], cutoffs, candidate["regressors"], horizon, train_days, True, settings)
+    scores = [row[metric] for row in rows]
+    return {"name": candidate["name"],
+            "score": np.mean(scores) if scores else np.inf,
+            "folds": len(rows),
+            "fit_seconds": sum(row["fit_seconds"] for row in rows)}
+
+
+def successive_halving(data, candidates, cutoffs, horizon=pd.Timedelta(days=30), budgets=(90, 365, 1095), eta=3,
+                       workers=1, metric="mape"):
+    """
+    Select the best candidate by successive halving
+    ----------
+    Input
+        - data: Prophet dataframe with y, ds and the regressors of all candidates
+        - candidates: list of dictionaries returned by candidate_grid
+        - cutoffs: cutoffs of the backtest folds, see backtest_prophet.rolling_origins
+        - horizon: length of each test set, Pandas Timedelta
+        - budgets: days of training data before each cutoff at each rung, None for all the data
+        - eta: only the best 1/eta of the candidates of a rung are evaluated at the next rung
+        - workers: number of processes
+        - metric: metric of backtest_prophet.forecast_metrics to minimize
+    Returns
+        - Tuple (best candidate, Pandas DataFrame with one row per candidate and rung)
+    """
+    cutoffs = sorted(pd.Timestamp(cutoff) for cutoff in cutoffs)
+    by_name = {candidate["name"]: candidate for candidate in candidates}
+    survivors = list(candidates)
+    results = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for rung, train_days in enumerate(budgets):
+            # Each candidate only receives the rows its folds use
+            start = data["ds"].min() if train_days is None else cutoffs[0] - pd.Timedelta(days=train_days)
+            rung_data = data[(data["ds"] >= start) & (data["ds"] < cutoffs[-1] + horizon)]
+            args = (cutoffs, horizon, train_days, metric)
+            if executor is None:
+                scores = [evaluate_candidate(rung_data, candidate, *args) for candidate in survivors]
+            else:
+                futures = [executor.submit(evaluate_candidate, rung_data, candidate, *args) for candidate in survivors]
+                scores = [future.result() for future in futures]
+
+            scores.sort(key=lambda score: score["score"])
+            keep = 1 if rung == len(budgets) - 1 else max(1, math.ceil(len(scores) / eta))
+            for rank, score in enumerate(scores):
+                results.append(dict(score, rung=rung, train_days=train_days, rank=rank + 1, promoted=rank < keep))
+            survivors = [by_name[score["name"]] for score in scores[:keep]]
+            print("Rung {} ({} days): {} candidates, best {} {:.3f} ({})".format(
+                rung, train_days or "all", len(scores), metric, scores[0]["score"], scores[0]["name"]), flush=True)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    columns = ["rung", "train_days", "rank", "name", "score", "folds", "fit_seconds", "promoted"]
+    return survivors[0], pd.DataFrame(results, columns=columns)
+
+
+def save_config(candidate, score, metric, path=TUNED_CONFIG_PATH, **details):
+    """
+    Write the configuration of a candidate to a JSON file read by refit_model.load_tuned_config
+    """
+    config = dict({"regressors": candidate["regressors"], "settings": candidate["settings"],
+                   "name": candidate["name"], "metric": metric, "score": score,
+                   "searched": time.strftime("%Y-%m-%d %H:%M:%S")}, **details)
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--start", default="2019-01-01", help="first cutoff")
+    parser.add_argument("--end", default="2019-10-01", help="last cutoff")
+    parser.add_argument("--freq", default="3MS", help="pandas frequency between cutoffs (default: 3MS, quarterly)")
+    parser.add_argument("--horizon-days", type=float, default=30, help="length of each test set in days")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[90, 365, 1095],
+                        help="days of training data before each cutoff at each rung")
+    parser.add_argument("--eta", type=int, default=3, help="keep the best 1/eta of the candidates at each rung")
+    parser.add_argument("--candidates", type=int, default=None,
+                        help="number of candidates drawn at random from the grid (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metric", default="mape", choices=["mae", "rmse", "mape"])
+    parser.add_argument("--workers", type=int, default=1, help="number of processes")
+    parser.add_argument("--output", default=TUNED_CONFIG_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    candidates = candidate_grid(samples=args.candidates, seed=args.seed)
+    regressors = sorted({regressor for candidate in candidates for regressor in candidate["regressors"]})
+    cutoffs = rolling_origins(args.start, args.end, args.freq)
+    best, results = successive_halving(load_training_data(regressors), candidates, cutoffs,
+                                       pd.Timedelta(days=args.horizon_days), args.budgets, args.eta, args.workers,
+                                       args.metric)
+    results.to_csv(RESULTS_PATH, index=False)
+
+    last_rung = results[results["rung"] == results["rung"].max()]
+    save_config(best, float(last_rung["score"].min()), args.metric, args.output,
+                train_days=args.budgets[-1], cutoffs=[str(cutoff) for cutoff in cutoffs])
+
+    # Time of evaluating every candidate at the largest budget, from the mean fit time per fold at that budget
+    full_search = len(candidates) * (last_rung["fit_seconds"] / last_rung["folds"]).mean() * len(cutoffs)
+    print("Best configuration written to {}: {}".format(args.output, best["name"]))
+    print("Fitted {} folds in {:.0f}s of fits, {:.0f}s wall clock. "
+          "Every candidate at the largest budget one after another: about {:.0f}s".format(
+              int(results["folds"].sum()), results["fit_seconds"].sum(), time.perf_counter() - start, full_search))
@@ -12,17 +12,32 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Output, Input
 
+from msa_data import MERGED_CSV_PATH, load_merged_data
+from dashboard_cubes import load_cubes
+from figure_cache import CACHE_DIR as FIGURE_CACHE_DIR, data_key, cached_figure
+from downsampling import MAX_POINTS, zoom_range, downsampled_traces
+from distribution_stats import KDE_POINTS, distribution_stats, box_trace, outlier_trace, violin_outline
+
 # Violin Plots of AIL by Year
 
 
 def plot_ail_dstribution_by_year(data):
+    # Violins, boxes and outliers drawn from statistics computed here, not from every hourly value
+    distributions = distribution_stats(data, "AIL_DEMAND", "year", kde_points=KDE_POINTS)
+    stats = distributions["stats"]
+    colors = px.colors.qualitative.Plotly
     demand_dist_by_year = go.Figure()
-    for y in range(data.year.min(), data.year.max() + 1):
-        demand_dist_by_year.add_trace(go.Violin(
-            y=data[data["year"] == y]["AIL_DEMAND"],
-            name=y,
-            box_visible=True,
-            meanline_visible=True))
+    for i, y in enumerate(stats.index):
+        color = colors[i % len(colors)]
+        demand_dist_by_year.add_trace(violin_outline(
+            distributions["grid"][i], distributions["density"][i], y,
+            name=str(y), legendgroup=str(y), line_color=color))
+        demand_dist_by_year.add_trace(box_trace(
+            stats.loc[y], y, name=str(y), legendgroup=str(y), showlegend=False, width=0.1,
+            boxmean=True, marker_color=color, fillcolor="white"))
+        if y in distributions["outliers"].index:
+            demand_dist_by_year.add_trace(outlier_trace(
+                distributions["outliers"].loc[[y]], y, name=str(y), legendgroup=str(y), marker_color=color))
     demand_dist_by_year.update_layout(
         title_text="Distribution of AIL by Year")
     return demand_dist_by_year
@@ -31,38 +46,65 @@ def plot_ail_dstribution_by_year(data):
 
 
 def plot_ail_distribution_by_hour(data):
-    demand_dist_by_hour = px.box(data, x="AIL_DEMAND",
-                                 title='Boxplots of Hourly AIL by Year',
-                                 facet_col="HE", color="year",
-                                 facet_col_wrap=4,
-                                 facet_col_spacing=0.01,
-                                 facet_row_spacing=0.01,
-                                 height=1200
-                                 )
+    # One box (and its outliers) per year in each hour ending facet, from statistics computed in one pass
+    distributions = distribution_stats(data, "AIL_DEMAND", ["year", "HE"])
+    stats, outliers = distributions["stats"], distributions["outliers"]
+    years = stats.index.get_level_values("year").unique()
+    hours = stats.index.get_level_values("HE").unique()
+    colors = px.colors.qualitative.Plotly
+    rows = -(-len(hours) // 4)
+    demand_dist_by_hour = make_subplots(rows=rows, cols=4,
+                                        subplot_titles=["HE={}".format(h) for h in hours],
+                                        horizontal_spacing=0.01,
+                                        vertical_spacing=0.01 + 0.2 / rows)
+    traces, trace_rows, trace_cols = [], [], []
+    for k, h in enumerate(hours):
+        for i, y in enumerate(years):
+            if (y, h) not in stats.index:
+                continue
+            color = colors[i % len(colors)]
+            traces.append(box_trace(stats.loc[(y, h)], str(y), orientation="h", name=str(y), legendgroup=str(y),
+                                    showlegend=k == 0, marker_color=color))
+            if (y, h) in outliers.index:
+                traces.append(outlier_trace(outliers.loc[[(y, h)]], str(y), orientation="h", name=str(y),
+                                            legendgroup=str(y), marker_color=color))
+            trace_rows += [k // 4 + 1] * (len(traces) - len(trace_rows))
+            trace_cols += [k % 4 + 1] * (len(traces) - len(trace_cols))
+    # Added at once, adding the traces one by one to the subplots takes longer than computing them
+    demand_dist_by_hour.add_traces(traces, rows=trace_rows, cols=trace_cols)
+    demand_dist_by_hour.update_xaxes(matches="x")
+    demand_dist_by_hour.update_yaxes(showticklabels=False)
+    demand_dist_by_hour.update_layout(title_text='Boxplots of Hourly AIL by Year', legend_title_text="year",
+                                      height=1200)
     return demand_dist_by_hour
 
 # Temp vs. Consumption Line Graph
 
 
-def plot_temp_v_demand_line(data):
-    data_daily_avg = data.resample("D").mean()
+def plot_temp_v_demand_line(daily, x_range=None, max_points=MAX_POINTS):
+    # At most max_points points per line over the zoomed range (x_range, see downsampling.zoom_range)
+    traces = downsampled_traces(daily.index, {"AIL_DEMAND": daily["AIL_DEMAND"],
+                                              "Weighted_Avg_Temp": daily["Weighted_Avg_Temp"]},
+                                x_range, max_points)
 
     temp_v_demand_line = make_subplots(specs=[[{"secondary_y": True}]])
-    temp_v_demand_line = make_subplots(specs=[[{"secondary_y": True}]])
-    temp_v_demand_line.add_trace(go.Scatter(x=data_daily_avg.index,
-                                            y=data_daily_avg["AIL_DEMAND"],
+    temp_v_demand_line.add_trace(go.Scatter(x=traces["AIL_DEMAND"][0],
+                                            y=traces["AIL_DEMAND"][1],
                                             name="Temperature",
                                             mode="lines"
                                             ), secondary_y=False)
-    temp_v_demand_line.add_trace(go.Scatter(x=data_daily_avg.index,
-                                            y=data_daily_avg["Weighted_Avg_Temp"],
+    temp_v_demand_line.add_trace(go.Scatter(x=traces["Weighted_Avg_Temp"][0],
+                                            y=traces["Weighted_Avg_Temp"][1],
                                             name="Electricity Consumption",
                                             mode="lines"
                                             ), secondary_y=True)
     temp_v_demand_line.update_layout(height=500,
-                                     title_text="Daily Average Temperature vs. Consumption from 2010 - 2020")
+                                     title_text="Daily Average Temperature vs. Consumption from 2010 - 2020",
+                                     uirevision="temp-v-demand-line")
     # Set x-axis title
     temp_v_demand_line.update_xaxes(title_text="Time")
+    if x_range is not None:
+        temp_v_demand_line.update_xaxes(range=list(x_range))
     # Set y-axes titles
     temp_v_demand_line.update_yaxes(
         title_text="Electricity Consumption", secondary_y=False)
@@ -72,8 +114,8 @@ def plot_temp_v_demand_line(data):
 # Temp vs. Consumption Scatter Plot
 
 
-def plot_temp_v_demand_scatter(data):
-    data_daily_avg = data.resample("D").mean()
+def plot_temp_v_demand_scatter(daily):
+    data_daily_avg = daily
     temp_v_demand_scatter = px.scatter(data_daily_avg, x="Weighted_Avg_Temp",
                                        y="AIL_DEMAND",
                                        title="Temperature vs. Consumption"
@@ -81,54 +123,111 @@ def plot_temp_v_demand_scatter(data):
     return temp_v_demand_scatter
 
 
-# Reading in data
-data = pd.read_csv("msa_merged_data.csv")
-data["BEGIN_DATE_GMT"] = pd.to_datetime(data["BEGIN_DATE_GMT"])
-data["Weighted_Avg_Temp.1_hour_lag"] = data["Weighted_Avg_Temp"].shift(1)
-data['year'] = data['BEGIN_DATE_GMT'].dt.year
-data.set_index("BEGIN_DATE_GMT", drop=False, inplace=True)
-
-demand_dist_by_year = plot_ail_dstribution_by_year(data)
-demand_dist_by_hour = plot_ail_distribution_by_hour(data)
-temp_v_demand_line = plot_temp_v_demand_line(data)
-temp_v_demand_scatter = plot_temp_v_demand_scatter(data)
-
-# Setting up Dash app, it automatically uses the style sheets from assets folder
-app = dash.Dash()
-
-app.layout = html.Div(children=[
-    html.H1(children='Exploring Electricity Consumption in Alberta 2010-2020',
-            className="header-title"),
-
-    html.H2(children="Alberta Internal Load"),
-    html.Div(
-        children=[
-            html.Div(children=dcc.Graph(figure=demand_dist_by_year,
-                                        id='demand-dist-by-year'),
-                     className="card"
-                     ),
-            html.Div(children=dcc.Graph(figure=demand_dist_by_hour,
-                                        id='demand-dist-by-hour'),
-                     className="card"
-                     ),
-        ],
-        className="wrapper"),
-
-    html.H2(children="Relationship between Demand and Temperature"),
-    html.Div(
-        children=[
-            html.Div(children=dcc.Graph(figure=temp_v_demand_line,
-                                        id='temp-v-demand-line'),
-                     className="card"
-                     ),
-            html.Div(children=dcc.Graph(figure=temp_v_demand_scatter,
-                                        id='temp-v-demand-scatter'),
-                     className="card"
-                     ),
-        ],
-        className="wrapper"),
-]
-)
-
-# Run app
-app.run_server(host='127.0.0.1', port=8000, debug=False)
+def prepare_data(data):
+    """
+    Add the year and index by BEGIN_DATE_GMT. Alter data frame in place
+
+    Input: Data from 2010 - 2020 with HE and AIL_DEMAND, see msa_data.load_merged_data
+    Returns: Dataframe
+    """
+    data['year'] = data['BEGIN_DATE_GMT'].dt.year
+    data.set_index("BEGIN_DATE_GMT", drop=False, inplace=True)
+    return data
+
+
+def make_app(cubes, load_data, data_path=MERGED_CSV_PATH, cache_dir=FIGURE_CACHE_DIR):
+    """
+    Set up the Dash app, it automatically uses the style sheets from assets folder
+    Figures are built the first time their tab is viewed and cached on disk (see figure_cache.py)
+
+    Input: Aggregates of the data from 2010 - 2020 (see dashboard_cubes.py), function returning the hourly AIL
+           (see prepare_data), only called when its figures are not cached, path of the data file, cache directory
+    Returns: Dash app
+    """
+    # Hash of the data file, part of the key of every figure
+    data_hash = data_key(data_path, cache_dir)
+    hourly = []
+
+    def hourly_data():
+        if not hourly:
+            hourly.append(load_data())
+        return (hourly[0],)
+
+    def figure(builder, *args, **params):
+        load_args = (lambda: args) if args else hourly_data
+        return cached_figure(builder, load_args, data_hash, params, cache_dir)
+
+    def ail_section():
+        return html.Div(
+            children=[
+                html.Div(children=dcc.Graph(figure=figure(plot_ail_dstribution_by_year),
+                                            id='demand-dist-by-year'),
+                         className="card"
+                         ),
+                html.Div(children=dcc.Graph(figure=figure(plot_ail_distribution_by_hour),
+                                            id='demand-dist-by-hour'),
+                         className="card"
+                         ),
+            ],
+            className="wrapper")
+
+    def temperature_section():
+        return html.Div(
+            children=[
+                html.Div(children=dcc.Graph(figure=figure(plot_temp_v_demand_line, cubes["daily"]),
+                                            id='temp-v-demand-line'),
+                         className="card"
+                         ),
+                html.Div(children=dcc.Graph(figure=figure(plot_temp_v_demand_scatter, cubes["daily"]),
+                                            id='temp-v-demand-scatter'),
+                         className="card"
+                         ),
+            ],
+            className="wrapper")
+
+    sections = {"ail": ail_section, "temperature": temperature_section}
+
+    # The graphs are added to the layout by render_section, so their callbacks are checked when they appear
+    app = dash.Dash(suppress_callback_exceptions=True)
+
+    app.layout = html.Div(children=[
+        html.H1(children='Exploring Electricity Consumption in Alberta 2010-2020',
+                className="header-title"),
+
+        dcc.Tabs(id="sections", value="ail", children=[
+            dcc.Tab(label="Alberta Internal Load", value="ail"),
+            dcc.Tab(label="Relationship between Demand and Temperature", value="temperature"),
+        ]),
+        html.Div(id="section-content"),
+    ]
+    )
+
+    @app.callback(
+        Output('section-content', 'children'),
+        [Input('sections', 'value')]
+    )
+    def render_section(section):
+        return sections[section]()
+
+    # Send the daily averages of the zoomed range only, downsampled
+    @app.callback(
+        Output('temp-v-demand-line', 'figure'),
+        [Input('temp-v-demand-line', 'relayoutData')],
+        prevent_initial_call=True
+    )
+    def zoom_temp_v_demand_line(relayout_data):
+        x_range = zoom_range(relayout_data)
+        if x_range is None:
+            return figure(plot_temp_v_demand_line, cubes["daily"])
+        return plot_temp_v_demand_line(cubes["daily"], x_range)
+
+    return app
+
+
+if __name__ == "__main__":
+    # Reading in data: aggregates, and the hourly AIL for its distributions when they are not cached
+    cubes = load_cubes()
+
+    # Run app
+    app = make_app(cubes, lambda: prepare_data(load_merged_data(["HE", "AIL_DEMAND"])))
+    app.run_server(host='127.0.0.1', port=8000, debug=False)
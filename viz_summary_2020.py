@@ -1,5 +1,6 @@
 # Basic data and viz
 from os import name
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 import plotly.express as px
@@ -12,16 +13,21 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Output, Input
 
+from dashboard_cubes import load_cubes
+from downsampling import MAX_POINTS, zoom_range, downsampled_traces
+from feature_factory import prefix_sums, prefix_rolling_mean
+from distribution_stats import distribution_stats, box_trace, outlier_trace
 
-def plot_oil_v_demand(data):
+
+def plot_oil_v_demand(yearly):
     """
     Plot Annual Average AIL vs WTI Spot Price
 
-    Input: Data from 2010 - 2020
+    Input: Yearly averages of the data from 2010 - 2020, see dashboard_cubes.py
     Returns: Figure
     """
-    year_change = data.groupby("year")["AIL_DEMAND"].mean().pct_change() * 100
-    oil_avg = data.groupby("year")["WTI spot"].mean()
+    year_change = yearly["AIL_DEMAND"].pct_change() * 100
+    oil_avg = yearly["WTI spot"]
     # Temp vs. Consumption Line Graph
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
@@ -54,17 +60,19 @@ def plot_oil_v_demand(data):
     return fig
 
 
-def plot_avg_pool_price(data):
+def plot_avg_pool_price(yearly):
     """
     Plot Average Pool Price
 
-    Input: Data from 2010 - 2020
+    Input: Yearly averages of the data from 2010 - 2020, see dashboard_cubes.py
     Returns: Figure
     """
-    pool_price_avg = data.groupby("year")["POOL_PRICE"].mean()
+    pool_price_avg = yearly["POOL_PRICE"]
     fig = go.Figure()
 
-    avg_price = data["POOL_PRICE"].mean()
+    # Average of all the hours: yearly averages weighted by their number of hours
+    priced = yearly[yearly["POOL_PRICE_count"] > 0]
+    avg_price = np.average(priced["POOL_PRICE"], weights=priced["POOL_PRICE_count"])
 
     fig.add_trace(go.Scatter(x=pool_price_avg.index,
                              y=pool_price_avg
@@ -87,163 +95,246 @@ def plot_avg_pool_price(data):
     return fig
 
 
-def plot_normalized_demand(data):
+def plot_normalized_demand(daily):
     """
     Plot Tempearture Normalized Demand based on Heating and Cooling degree days
 
-    Input: Data from 2010 - 2020
+    Input: Daily aggregates of the data from 2010 - 2020, see dashboard_cubes.py
     Returns: Figure
     """
-    temp_df = data[["AIL_DEMAND", "Degree_days"]].copy()
-    temp_df = temp_df.groupby(by=temp_df.index.date).sum()
-    temp_df.index = pd.to_datetime(temp_df.index)
-    temp_df['Normalized_AIL_Demand'] = temp_df.AIL_DEMAND / temp_df.Degree_days
+    temp_df = daily[daily["hours"] > 0].copy()
+    temp_df['Normalized_AIL_Demand'] = temp_df.AIL_DEMAND_sum / temp_df.Degree_days_sum
+
+    temp_df['year'] = temp_df.index.year
+    # Boxes and outliers drawn from statistics computed here, not from every daily value
+    distributions = distribution_stats(temp_df[temp_df['year'].between(2010, 2020)], 'Normalized_AIL_Demand',
+                                       'year')
+    colors = px.colors.qualitative.Plotly
 
     fig = go.Figure()
-    for year in range(2010, 2021):
-        fig.add_trace(go.Box(x=temp_df[temp_df.index.year == year].index.year,
-                             y=temp_df['Normalized_AIL_Demand'][temp_df.index.year == year],
-                             name=str(year)
-                             ))
+    for i, year in enumerate(distributions["stats"].index):
+        fig.add_trace(box_trace(distributions["stats"].loc[year], year, name=str(year), legendgroup=str(year),
+                                marker_color=colors[i % len(colors)]))
+        if year in distributions["outliers"].index:
+            fig.add_trace(outlier_trace(distributions["outliers"].loc[[year]], year, name=str(year),
+                                        legendgroup=str(year), marker_color=colors[i % len(colors)]))
 
     fig.update_layout(
         title="Distribition of Daily Demand per Heating/Cooling Degree Days (Base = 18 Celsius) ")
     return fig
 
 
-# Read in data for all years
-data = pd.read_csv("msa_merged_data.csv")
-data["BEGIN_DATE_GMT"] = pd.to_datetime(data["BEGIN_DATE_GMT"])
-data.set_index("BEGIN_DATE_GMT", drop=False, inplace=True)
-
-# Read in predictions for 2020
-data_2020 = pd.read_csv("forecasted_2020_data.csv")
-data_2020["BEGIN_DATE_GMT"] = pd.to_datetime(data_2020["BEGIN_DATE_GMT"])
-data_2020.set_index("BEGIN_DATE_GMT", drop=False, inplace=True)
+AIL_2020_COLUMNS = ["Actual_Load", "Predicted_Load", "Temperature_Norm_Load"]
+ROLLING_HOURS = 24
+FIGURE_CACHE_SIZE = 32
+"""
+Number of 2020 AIL figures (date range and zoom) kept by the dashboard
+"""
 
-# Setting up Dash app, it automatically uses the style sheets from asses folder
-app = dash.Dash(title="Alberta's Internal Load 2020")
-
-app.layout = html.Div(children=[
-    html.H1(children="Alberta's Internal Load 2020",
-            className="header-title"),
-
-    html.H2(children="Summary",
-            className="header-description"),
-
-    html.Div(children=[
-        html.Div(
-            children=[
-                html.Div(children=dcc.Graph(
-                    figure=plot_oil_v_demand(data),
-                    id='oil_v_demand_fig'),
-                    className='card'
-                ),
-            ],
 
-            className="wrapper"),
-        html.Div(
-            children=[
-                html.Div(children=dcc.Graph(
-                    figure=plot_avg_pool_price(data),
-                    id='avg_pool_price_fig'),
-                    className='card'
-                ),
-            ],
-            style={"min-width": "40%"},
-            className="wrapper"),
-    ],
-        style={'display': "inline-flex"},
-    ),
-
-
-    html.Div(
-        children=[
-            html.Div(children=dcc.Graph(
-                figure=plot_normalized_demand(data),
-                id='normalized_demand_fig'),
-                className='card'
-            ),
-        ],
-        className="wrapper"),
-
-    html.H2(children="Forecasted Load",
-            className="header-description"),
-
-    html.Div(
-        children=[
-            html.H3(children="Choose Time Range"),
-            dcc.DatePickerRange(
-                id='summary-date-range',
-                min_date_allowed=data_2020["BEGIN_DATE_GMT"].min().date(),
-                max_date_allowed=data_2020["BEGIN_DATE_GMT"].max().date(),
-                start_date=data_2020["BEGIN_DATE_GMT"].min().date(),
-                end_date=data_2020["BEGIN_DATE_GMT"].max().date(),
-            )],
-        className="menu"
-    ),
-
-    html.Div(
-        children=[
-            html.Div(children=dcc.Graph(
-                id='ail_2020_fig'),
-                className='card'
-            ),
-        ],
-        className="wrapper"),
-]
-)
+def make_ail_2020_sums(data_2020):
+    """
+    Prefix sums of the 2020 loads, from which the rolling means of any date range are differences of two rows.
+    The rows are sorted by date first, the rolling means were previously taken over the rows in file order
+    ----------
+    Input
+        - data_2020: forecasts of 2020 (see load_forecasts)
+    Returns
+        - Dictionary with dates (sorted Numpy datetime64 array) and prefixes (dictionary of column of
+          AIL_2020_COLUMNS: prefix sums, see feature_factory.prefix_sums)
+    """
+    dates = data_2020["BEGIN_DATE_GMT"].to_numpy(dtype="datetime64[ns]")
+    order = np.argsort(dates, kind="stable")
+    return {"dates": dates[order],
+            "prefixes": {col: prefix_sums(data_2020[col].to_numpy(dtype=float)[order]) for col in AIL_2020_COLUMNS}}
 
 
-@app.callback(
-    Output('ail_2020_fig', 'figure'),
-    [Input("summary-date-range", "start_date"),
-     Input("summary-date-range", "end_date")]
-)
-def plot_ail_2020(start_date, end_date):
+def plot_ail_2020(data_2020, start_date, end_date, x_range=None, max_points=MAX_POINTS, sums=None):
     """
     Plot 30 Day Moving Average of 2020's AIL: actual, forecasted and normalized using 2020 temperature
     Reuires preloaded data of these measures.
-    Returns Graph with data from selected time range
+    Returns Graph with data from selected time range, at most max_points points per line over the zoomed range,
+    or an empty graph when there is no data in that range
 
-    Input: Selected Start date and End date
+    Input: Forecasts of 2020 (forecasted_2020_data.csv), selected Start date and End date,
+           zoomed range (see downsampling.zoom_range), prefix sums of the forecasts (see make_ail_2020_sums)
     Returns: Figure
     """
-    condition = (data_2020["BEGIN_DATE_GMT"] >= start_date) & (
-        data_2020["BEGIN_DATE_GMT"] <= end_date)
-
-    filtered_data = data_2020[condition]
-
-    filtered_data = filtered_data.rolling(24).mean()
+    if sums is None:
+        sums = make_ail_2020_sums(data_2020)
+    # Rows of the selected dates, found by binary search, and their 24 hour rolling means from the prefix sums
+    dates = sums["dates"]
+    first = int(np.searchsorted(dates, pd.Timestamp(start_date).to_datetime64(), side="left"))
+    last = int(np.searchsorted(dates, pd.Timestamp(end_date).to_datetime64(), side="right"))
+    if first >= last:
+        # No forecasts in the selected dates (outside of the forecasts, or start after end)
+        return go.Figure(layout=dict(title="Alberta Internal Load 2020: 24-hour Rolling Average",
+                                     uirevision="{} {}".format(start_date, end_date)))
+    filtered_dates = dates[first:last]
+    means = {col: prefix_rolling_mean((prefix[0][first:last + 1], prefix[1][first:last + 1]), ROLLING_HOURS)
+             for col, prefix in sums["prefixes"].items()}
+    traces = downsampled_traces(filtered_dates, means, x_range, max_points)
 
     fig = go.Figure()
 
-    fig.add_trace(go.Scatter(x=filtered_data.index,
-                             y=filtered_data["Actual_Load"],
+    fig.add_trace(go.Scatter(x=traces["Actual_Load"][0],
+                             y=traces["Actual_Load"][1],
                              name="Actual Load",
                              mode='lines'))
-    fig.add_trace(go.Scatter(x=filtered_data.index,
-                             y=filtered_data["Predicted_Load"],
+    fig.add_trace(go.Scatter(x=traces["Predicted_Load"][0],
+                             y=traces["Predicted_Load"][1],
                              name="Predicted Load",
                              mode='lines'))
-    fig.add_trace(go.Scatter(x=filtered_data.index,
-                             y=filtered_data["Temperature_Norm_Load"],
+    fig.add_trace(go.Scatter(x=traces["Temperature_Norm_Load"][0],
+                             y=traces["Temperature_Norm_Load"][1],
                              name="2019 Temperature Normalized Load",
                              mode='lines'))
-    fig.update_xaxes(range=[filtered_data.index.min(),
-                            pd.to_datetime("2021-01-15")])
+    fig.update_xaxes(range=list(x_range) if x_range is not None else
+                     [pd.Timestamp(filtered_dates[0]), pd.to_datetime("2021-01-15")])
     fig.update_layout(title="Alberta Internal Load 2020: 24-hour Rolling Average",
                       xaxis=dict(
                             tickmode='array',
-                          tickvals=pd.date_range(start=filtered_data.index.min(),
-                                                 end=filtered_data.index.max() + pd.Timedelta(15, unit="D"),
+                          tickvals=pd.date_range(start=filtered_dates[0],
+                                                 end=filtered_dates[-1] + pd.Timedelta(15, unit="D"),
                                                  freq='M')
                       ),
-                      xaxis_tickformat='%B'
+                      xaxis_tickformat='%B',
+                      # Zoom is kept until a new date range is selected
+                      uirevision="{} {}".format(start_date, end_date)
                       )
 
     return fig
 
 
-# Run app
-app.run_server(host='127.0.0.1', port=8888, debug=False)
+def cached_figure(cache, key, build, size=FIGURE_CACHE_SIZE):
+    """
+    Return the figure of key from cache (an OrderedDict, least recently used first),
+    or build it with build() and add it, dropping the least recently used figures beyond size
+    """
+    if key not in cache:
+        cache[key] = build()
+        while len(cache) > size:
+            cache.popitem(last=False)
+    cache.move_to_end(key)
+    return cache[key]
+
+
+def load_forecasts(path="forecasted_2020_data.csv"):
+    """
+    Read in predictions for 2020, indexed by BEGIN_DATE_GMT
+
+    Input: Path of the output of normalize_2020_predictions.py
+    Returns: Dataframe
+    """
+    data_2020 = pd.read_csv(path)
+    data_2020["BEGIN_DATE_GMT"] = pd.to_datetime(data_2020["BEGIN_DATE_GMT"])
+    data_2020.set_index("BEGIN_DATE_GMT", drop=False, inplace=True)
+    return data_2020
+
+
+def make_app(cubes, data_2020):
+    """
+    Set up the Dash app, it automatically uses the style sheets from assets folder
+
+    Input: Aggregates of the data from 2010 - 2020 (see dashboard_cubes.py), forecasts of 2020 (see load_forecasts)
+    Returns: Dash app
+    """
+    app = dash.Dash(title="Alberta's Internal Load 2020")
+    # Rolling means of any date range from the prefix sums, and the figures already sent
+    ail_2020_sums = make_ail_2020_sums(data_2020)
+    ail_2020_figures = OrderedDict()
+
+    app.layout = html.Div(children=[
+        html.H1(children="Alberta's Internal Load 2020",
+                className="header-title"),
+
+        html.H2(children="Summary",
+                className="header-description"),
+
+        html.Div(children=[
+            html.Div(
+                children=[
+                    html.Div(children=dcc.Graph(
+                        figure=plot_oil_v_demand(cubes["yearly"]),
+                        id='oil_v_demand_fig'),
+                        className='card'
+                    ),
+                ],
+
+                className="wrapper"),
+            html.Div(
+                children=[
+                    html.Div(children=dcc.Graph(
+                        figure=plot_avg_pool_price(cubes["yearly"]),
+                        id='avg_pool_price_fig'),
+                        className='card'
+                    ),
+                ],
+                style={"min-width": "40%"},
+                className="wrapper"),
+        ],
+            style={'display': "inline-flex"},
+        ),
+
+
+        html.Div(
+            children=[
+                html.Div(children=dcc.Graph(
+                    figure=plot_normalized_demand(cubes["daily"]),
+                    id='normalized_demand_fig'),
+                    className='card'
+                ),
+            ],
+            className="wrapper"),
+
+        html.H2(children="Forecasted Load",
+                className="header-description"),
+
+        html.Div(
+            children=[
+                html.H3(children="Choose Time Range"),
+                dcc.DatePickerRange(
+                    id='summary-date-range',
+                    min_date_allowed=data_2020["BEGIN_DATE_GMT"].min().date(),
+                    max_date_allowed=data_2020["BEGIN_DATE_GMT"].max().date(),
+                    start_date=data_2020["BEGIN_DATE_GMT"].min().date(),
+                    end_date=data_2020["BEGIN_DATE_GMT"].max().date(),
+                )],
+            className="menu"
+        ),
+
+        html.Div(
+            children=[
+                html.Div(children=dcc.Graph(
+                    id='ail_2020_fig'),
+                    className='card'
+                ),
+            ],
+            className="wrapper"),
+    ]
+    )
+
+    @app.callback(
+        Output('ail_2020_fig', 'figure'),
+        [Input("summary-date-range", "start_date"),
+         Input("summary-date-range", "end_date"),
+         Input('ail_2020_fig', 'relayoutData')]
+    )
+    def update_ail_2020(start_date, end_date, relayout_data):
+        # A new date range shows the whole range, a zoom only the points of the zoomed range
+        zoomed = any(trigger["prop_id"] == "ail_2020_fig.relayoutData"
+                     for trigger in dash.callback_context.triggered)
+        x_range = zoom_range(relayout_data) if zoomed else None
+        return cached_figure(ail_2020_figures, (start_date, end_date, x_range),
+                             lambda: plot_ail_2020(data_2020, start_date, end_date, x_range, sums=ail_2020_sums))
+
+    return app
+
+
+if __name__ == "__main__":
+    # Read in the aggregates of all years, built by dashboard_cubes.py
+    cubes = load_cubes()
+
+    # Run app
+    app = make_app(cubes, load_forecasts())
+    app.run_server(host='127.0.0.1', port=8888, debug=False)
@@ -0,0 +1,77 @@
+"""
+Population weighted temperatures for any number of stations and population scenarios.
+
+The weights are the shares of the population living in each station's census division, which change every year.
+They are stored as a tensor of shape (years, stations, scenarios) and applied to the (hours, stations) temperature
+matrix by gathering the weights of every hour's year and one sum over the stations, so the low, medium and high scenarios are computed together.
+
+Columns of the wide temperature table (cleaned data/WF_Weighted Temp 2010-2021.csv) used here:
+- <TEMP_COLUMN>|<CITY> e.g. BFILL_TEMP_CELSIUS|CALGARY: temperature of a station
+- PCT_<SCENARIO>|<CITY> e.g. PCT_POP_HIGH|CALGARY: share of the population in the station's census division
+"""
+
+import numpy as np
+
+POP_SCENARIOS = ["POP_LOW", "POP_MEDIUM", "POP_HIGH"]
+
+
+def station_names(temp_data, temp_column):
+    """
+    Return the names of the stations with a column <temp_column>|<CITY> in the wide temperature table
+    """
+    prefix = temp_column + "|"
+    return [col[len(prefix):] for col in temp_data.columns if col.startswith(prefix)]
+
+
+def population_weights(temp_data, stations, scenarios=POP_SCENARIOS, date_col="BEGIN_DATE_GMT"):
+    """
+    Collect the yearly population shares of the wide temperature table into a weight tensor
+    ----------
+    Input
+        - temp_data: wide temperature table with a datetime column date_col and PCT_<SCENARIO>|<CITY> columns
+        - stations: names of the stations, see station_names
+        - scenarios: population scenarios e.g. POP_MEDIUM
+        - date_col: name of the column with timestamps
+    Returns
+        - Tuple (years, weights): sorted Numpy array of years and Numpy array of shape (years, stations, scenarios).
+          Shares missing for a whole year are NaN
+    """
+    columns = ["PCT_{}|{}".format(scenario, station) for station in stations for scenario in scenarios]
+    hour_years = temp_data[date_col].dt.year.to_numpy()
+    years, first_rows = np.unique(hour_years, return_index=True)
+    # Shares are constant within a year, so the first hour of each year is enough
+    by_year = temp_data.iloc[first_rows][columns].to_numpy(dtype=float)
+    # A station whose data starts during a year has no share in that year's first hour, look further into the year
+    missing = np.isnan(by_year).any(axis=0)
+    if missing.any():
+        missing_columns = [col for col, is_missing in zip(columns, missing) if is_missing]
+        by_year[:, missing] = temp_data[missing_columns].groupby(hour_years).first().to_numpy(dtype=float)
+    return years, by_year.reshape(len(years), len(stations), len(scenarios))
+
+
+def weighted_temperatures(temps, hour_years, years, weights):
+    """
+    Population weighted temperature of every hour under every scenario
+    ----------
+    Input
+        - temps: array of shape (hours, stations) with temperatures
+        - hour_years: array of shape (hours,) with the year of every hour
+        - years: sorted array of the years in weights
+        - weights: array of shape (years, stations, scenarios), see population_weights
+    Returns
+        - Numpy array of shape (hours, scenarios). Hours with a missing temperature or
+          a year without weights are NaN
+    """
+    temps = np.asarray(temps, dtype=float)
+    hour_years = np.asarray(hour_years)
+    n_hours, n_stations = temps.shape
+    n_years, _, n_scenarios = weights.shape
+    if n_years == 0:
+        return np.full((n_hours, n_scenarios), np.nan)
+
+    # Weights of every hour gathered from its year, then one sum over the stations. The gathered weights take
+    # hours * stations * scenarios floats, the size of one temperature table per scenario
+    positions = np.minimum(np.searchsorted(years, hour_years), n_years - 1)
+    weighted = np.einsum("hs,hsk->hk", temps, weights[positions])
+    weighted[years[positions] != hour_years] = np.nan
+    return weighted